@@ -1,41 +1,34 @@
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_async_db
+from hashing import hash_password_sync, verify_and_update_sync
+from auth_cache import CachedUser, token_cache, user_cache
+import logging
 import models
 import os
 
+logger = logging.getLogger(__name__)
+
 # Secret key
 SECRET_KEY = os.environ.get("SECRET_KEY")
 if not SECRET_KEY:
-    print("⚠️ WARNING: SECRET_KEY environment variable not set. Using default.")
+    logger.warning("⚠️ SECRET_KEY environment variable not set. Using default.")
     SECRET_KEY = "a-very-unsafe-default-key-for-local-testing"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # e.g., 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# --- FIX for ValueError: password cannot be longer than 72 bytes ---
-# This helper function is crucial. It encodes the password to bytes and truncates it
-# to 72 bytes, which is the maximum length the bcrypt algorithm can handle.
-def _truncate_password(password: str) -> bytes:
-    """Encodes password to UTF-8 and truncates it to 72 bytes."""
-    return password.encode('utf-8')[:72]
-
+# Hashing itself lives in hashing.py; the app goes through its process pool
+# (hashing.password_hasher). These blocking helpers are for scripts and tools.
 def hash_password(password: str) -> str:
-    # We use the helper function to ensure the password is safe before hashing.
-    safe_password = _truncate_password(password)
-    return pwd_context.hash(safe_password)
+    return hash_password_sync(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
-    # We use the helper function here as well to prevent crashes during verification.
-    safe_password = _truncate_password(plain)
-    return pwd_context.verify(safe_password, hashed)
-# --- End of FIX ---
+    return verify_and_update_sync(plain, hashed)[0]
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -51,27 +44,66 @@ def decode_access_token(token: str):
     except JWTError:
         return None
 
-def get_user_from_token(token_str: str, db: Session):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _user_id_from_token(token_str: str) -> int:
+    # A token we've already verified needs no second signature check
+    user_id = token_cache.get(token_str)
+    if user_id is not None:
+        return user_id
+
     payload = decode_access_token(token_str)
     if payload is None:
-        raise credentials_exception
+        raise _credentials_exception()
 
     user_id: str = payload.get("sub")
     if user_id is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    user_id = int(user_id)
+    if payload.get("exp") is not None:
+        token_cache.set(token_str, user_id, float(payload["exp"]))
+    return user_id
+
+def invalidate_user(user_id: int):
+    """Drops a cached profile; call after changing a user's moderation state."""
+    user_cache.invalidate(user_id)
 
-    user = db.query(models.User).get(int(user_id))
+def get_user_from_token(token_str: str, db: Session) -> CachedUser:
+    user_id = _user_id_from_token(token_str)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = db.get(models.User, user_id)
     if not user:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    cached = CachedUser.from_model(user)
+    user_cache.set(cached)
+    return cached
+
+async def get_user_from_token_async(token_str: str, db: AsyncSession) -> CachedUser:
+    user_id = _user_id_from_token(token_str)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = await db.get(models.User, user_id)
+    if not user:
+        raise _credentials_exception()
+    cached = CachedUser.from_model(user)
+    user_cache.set(cached)
+    return cached
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     return get_user_from_token(token, db)
 
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await get_user_from_token_async(token, db)
+
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Backplane Settings ---
+# "memory": deliver within this process only (single worker, the default)
+# "redis":  fan out through Redis pub/sub so every worker and every replica
+#           delivers each message to its own sockets
+BROADCAST_BACKPLANE = os.environ.get("BROADCAST_BACKPLANE", "memory")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+BROADCAST_CHANNEL = os.environ.get("BROADCAST_CHANNEL", "chatroom:broadcast")
+# Node ids are leased from Redis for this long and renewed every third of it,
+# so a crashed worker's id is free again after at most this many seconds
+NODE_LEASE_TTL_SECONDS = int(os.environ.get("NODE_LEASE_TTL_SECONDS", "30"))
+
+# Called with each envelope, in publish order, on every subscribed worker
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane:
+    """
+    Carries broadcast envelopes between workers. An envelope is a small dict
+    holding the already-serialized frame, its kind and its room.
+    """
+
+    async def start(self, handler: Handler):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+    async def publish(self, envelope: dict):
+        raise NotImplementedError
+
+    async def lease_node_id(self, slots: int, on_change: Callable[[int], None]) -> Optional[int]:
+        """
+        A number in range(slots) that no other live worker holds, if the
+        backplane can provide one. `on_change` is called if the lease is lost
+        and a different number had to be taken.
+        """
+        return None
+
+
+class InProcessBackplane(Backplane):
+    """Delivers straight to the local handler; what a single worker needs."""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def publish(self, envelope: dict):
+        if self._handler:
+            await self._handler(envelope)
+
+
+class RedisBackplane(Backplane):
+    """
+    Publishes envelopes on one Redis channel and delivers everything received
+    on it. Redis hands messages to every subscriber in the order it accepted
+    them, so all workers see the same room-wide order.
+
+    `client` may be any redis.asyncio-compatible client (e.g. a fakeredis
+    instance in tests); by default one is created from `url`.
+    """
+
+    def __init__(self, url: str = REDIS_URL, channel: str = BROADCAST_CHANNEL, client=None):
+        self.url = url
+        self.channel = channel
+        self._client = client
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._lease_key: Optional[str] = None
+        self._lease_token = uuid.uuid4().hex
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        if self._client is None:
+            import redis.asyncio as redis  # Optional dependency, only needed for this backplane
+            self._client = redis.from_url(self.url)
+
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(handler))
+        logger.info("✅ Redis backplane subscribed to '%s'.", self.channel)
+
+    async def stop(self):
+        for task in (self._listener, self._heartbeat):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._lease_key:
+            # Hand the node id back now rather than when the lease expires
+            await self._release_lease(self._lease_key)
+            self._lease_key = None
+        if self._pubsub:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.aclose()
+        if self._client:
+            await self._client.aclose()
+
+    async def publish(self, envelope: dict):
+        await self._client.publish(self.channel, json.dumps(envelope))
+
+    async def lease_node_id(self, slots: int, on_change: Callable[[int], None]) -> Optional[int]:
+        node_id = await self._acquire_lease(slots)
+        self._heartbeat = asyncio.create_task(self._renew_lease(slots, on_change))
+        return node_id
+
+    async def _acquire_lease(self, slots: int) -> int:
+        for node_id in range(slots):
+            key = f"{self.channel}:node:{node_id}"
+            if await self._client.set(key, self._lease_token, nx=True, ex=NODE_LEASE_TTL_SECONDS):
+                self._lease_key = key
+                logger.info("✅ Leased node id %d.", node_id)
+                return node_id
+        raise RuntimeError(f"All {slots} node ids are leased by live workers; cannot start another one")
+
+    async def _holds_lease(self, key: str, then: Callable) -> bool:
+        """Runs `then(pipe)` in a transaction, only if this worker still holds `key`."""
+        import redis.exceptions  # Optional dependency, only needed for this backplane
+
+        async with self._client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                value = await pipe.get(key)
+                if value is None or (value.decode() if isinstance(value, bytes) else value) != self._lease_token:
+                    return False
+                pipe.multi()
+                then(pipe)
+                await pipe.execute()
+                return True
+            except redis.exceptions.WatchError:
+                return False
+
+    async def _release_lease(self, key: str):
+        try:
+            await self._holds_lease(key, lambda pipe: pipe.delete(key))
+        except Exception as e:
+            logger.warning("⚠️ Could not release node id lease: %s", e)
+
+    async def _renew_lease(self, slots: int, on_change: Callable[[int], None]):
+        while True:
+            await asyncio.sleep(NODE_LEASE_TTL_SECONDS / 3)
+            try:
+                key = self._lease_key
+                if await self._holds_lease(key, lambda pipe: pipe.expire(key, NODE_LEASE_TTL_SECONDS)):
+                    continue
+                # Expired (e.g. Redis was unreachable for a while) and maybe
+                # taken by another worker: move to a free id before writing more
+                logger.error("🔴 Node id lease %s was lost; leasing a new one.", key)
+                on_change(await self._acquire_lease(slots))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("🔴 Could not renew node id lease, retrying: %s", e)
+
+    async def _listen(self, handler: Handler):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    await handler(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("🔴 Error while listening, retrying: %s", e)
+                await asyncio.sleep(1.0)
+
+
+def create_backplane(kind: str = BROADCAST_BACKPLANE) -> Backplane:
+    if kind == "memory":
+        return InProcessBackplane()
+    if kind == "redis":
+        return RedisBackplane()
+    raise ValueError(f"Unknown BROADCAST_BACKPLANE: {kind}")
@@ -0,0 +1,411 @@
+"""
+End-to-end chat benchmark.
+
+Boots the chat app against SQLite, the fake emotion/toxicity services in
+fake_services.py and the built-in fake LLM (LLM_PROVIDER=fake), then drives
+N simulated users through signup/login, a history fetch, sending messages
+over the WebSocket and polling /mood. Reports:
+
+- send -> broadcast: a sender's own message coming back to it
+- send -> fan-out:   the same message arriving at the other clients
+- send -> emotion_update: the emotion label arriving for a message
+- login, history, mood and summary request latency
+- messages/s sent and delivered, and the app's memory (VmRSS)
+
+Every run is saved as JSON (default: benchmarks/results/) with the git
+commit it ran on, so runs can be compared across commits:
+
+    python benchmarks/chat_bench.py --clients 50 --duration 30 --emotion-latency-ms 40
+    python benchmarks/chat_bench.py --clients 50 --duration 30 --compare benchmarks/results/<earlier run>.json
+
+Pass --url to benchmark an app that is already running instead (memory is
+then only reported if --pid is given).
+
+Needs httpx and websockets (both come with the app's requirements).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from login_bench import summarize
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(APP_DIR, "benchmarks", "results")
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def git_commit() -> Dict[str, object]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+# --- Local Stack ---
+class LocalStack:
+    """The chat app plus fake ML services, each in its own process."""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.tmpdir = tempfile.TemporaryDirectory(prefix="chat_bench_")
+        self.url = f"http://127.0.0.1:{args.port}"
+        self.app_pid: Optional[int] = None
+
+    async def start(self):
+        args = self.args
+        self._spawn([
+            sys.executable, os.path.join(APP_DIR, "benchmarks", "fake_services.py"),
+            "--emotion-port", str(args.fake_port), "--toxicity-port", str(args.fake_port + 1),
+            "--emotion-latency-ms", str(args.emotion_latency_ms),
+            "--toxicity-latency-ms", str(args.toxicity_latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+        ])
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmpdir.name, 'bench.db')}",
+            "EMOTION_API_URL": f"http://127.0.0.1:{args.fake_port}",
+            "TOXICITY_API_URL": f"http://127.0.0.1:{args.fake_port + 1}",
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_LATENCY_SECONDS": str(args.llm_latency_ms / 1000),
+            "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+            # The benchmark measures throughput, not the anti-spam limit
+            "MESSAGE_LIMIT": str(10 ** 9),
+        }
+        app = self._spawn(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--log-level", "warning"],
+            cwd=APP_DIR, env=env,
+        )
+        self.app_pid = app.pid
+        await self._wait_until_up(f"http://127.0.0.1:{args.fake_port + 1}/ready")
+        await self._wait_until_up(f"http://127.0.0.1:{args.fake_port}/ready")
+        await self._wait_until_up(f"{self.url}/stats")
+
+    def _spawn(self, command, **kwargs) -> subprocess.Popen:
+        log = open(os.path.join(self.tmpdir.name, f"process-{len(self.processes)}.log"), "w")
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+        self.processes.append(process)
+        return process
+
+    async def _wait_until_up(self, url: str, timeout: float = 60.0):
+        deadline = time.perf_counter() + timeout
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            while time.perf_counter() < deadline:
+                if any(process.poll() is not None for process in self.processes):
+                    raise RuntimeError(f"A benchmark process exited early; logs are in {self.tmpdir.name}")
+                try:
+                    if (await client.get(url)).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.tmpdir.cleanup()
+
+
+# --- Simulated Clients ---
+class Recorder:
+    """Shared by all clients: when each tagged message was sent, and what was observed."""
+
+    def __init__(self):
+        self.sent_at: Dict[str, float] = {}
+        self.emotion_pending: Dict[int, float] = {}
+        self.latencies: Dict[str, List[float]] = {
+            name: [] for name in ("signup", "login", "history", "broadcast", "fanout", "emotion", "mood", "summary")
+        }
+        self.counts = {"sent": 0, "delivered": 0, "emotion_updates": 0, "alerts": 0, "errors": 0}
+        self.last_sent_at = 0.0
+
+    def timed(self, name: str, started: float):
+        self.latencies[name].append(round((time.perf_counter() - started) * 1000, 3))
+
+
+async def _timed_request(recorder: Recorder, name: str, request) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.counts["errors"] += 1
+        return None
+    if response.status_code == 200:
+        recorder.timed(name, started)
+    else:
+        recorder.counts["errors"] += 1
+    return response
+
+
+async def _receive(ws, username: str, recorder: Recorder):
+    async for raw in ws:
+        now = time.perf_counter()
+        frame = json.loads(raw)
+        kind = frame.get("type")
+        if kind == "chat_message":
+            sent_at = recorder.sent_at.get(frame.get("content"))
+            if sent_at is None:
+                continue
+            recorder.counts["delivered"] += 1
+            name = "broadcast" if frame.get("username") == username else "fanout"
+            recorder.latencies[name].append(round((now - sent_at) * 1000, 3))
+            recorder.emotion_pending.setdefault(frame["id"], sent_at)
+        elif kind == "emotion_update":
+            # Every client in the room gets it; count each message once
+            sent_at = recorder.emotion_pending.pop(frame.get("message_id"), None)
+            if sent_at is not None:
+                recorder.counts["emotion_updates"] += 1
+                recorder.latencies["emotion"].append(round((now - sent_at) * 1000, 3))
+        elif kind == "system_alert":
+            recorder.counts["alerts"] += 1
+
+
+async def _poll(interval: float, deadline: float, poll):
+    if interval <= 0:
+        return
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(interval)
+        await poll()
+
+
+async def run_client(index: int, args, http: httpx.AsyncClient, ws_url: str, run_id: str,
+                     recorder: Recorder, connected: asyncio.Queue, start: asyncio.Event):
+    username, password = f"bench_{run_id}_{index}", "bench-password"
+    room = f"bench-{run_id}-{index % args.rooms}"
+    credentials = {"username": username, "password": password}
+
+    await _timed_request(recorder, "signup", http.post("/signup", json=credentials))
+    response = await _timed_request(recorder, "login", http.post("/login", json=credentials))
+    if response is None or response.status_code != 200:
+        connected.put_nowait(index)
+        return
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    await _timed_request(recorder, "history", http.get("/messages", params={"room": room}, headers=headers))
+
+    async with websockets.connect(f"{ws_url}/ws?token={token}&room={room}", max_queue=None) as ws:
+        receiver = asyncio.create_task(_receive(ws, username, recorder))
+        connected.put_nowait(index)
+        await start.wait()
+        deadline = time.perf_counter() + args.duration
+
+        async def poll_mood():
+            await _timed_request(recorder, "mood", http.get("/mood", params={"room": room}, headers=headers))
+
+        async def poll_summary():
+            await _timed_request(recorder, "summary", http.get("/summary", params={"room": room}, headers=headers))
+
+        pollers = [
+            asyncio.create_task(_poll(args.mood_interval, deadline, poll_mood)),
+            asyncio.create_task(_poll(args.summary_interval if index == 0 else 0, deadline, poll_summary)),
+        ]
+
+        interval, seq = 1 / args.rate, 0
+        next_send = time.perf_counter()
+        while time.perf_counter() < deadline:
+            tag = f"bench {run_id}-{index}-{seq}"
+            recorder.sent_at[tag] = time.perf_counter()
+            recorder.counts["sent"] += 1
+            await ws.send(tag)
+            recorder.last_sent_at = max(recorder.last_sent_at, time.perf_counter())
+            seq += 1
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+        await asyncio.gather(*pollers)
+        # Give in-flight broadcasts and emotion updates time to land
+        await asyncio.sleep(args.drain)
+        receiver.cancel()
+
+
+async def create_rooms(http: httpx.AsyncClient, run_id: str, rooms: int):
+    credentials = {"username": f"bench_{run_id}_owner", "password": "bench-password"}
+    await http.post("/signup", json=credentials)
+    response = await http.post("/login", json=credentials)
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for index in range(rooms):
+        (await http.post("/rooms", json={"name": f"bench-{run_id}-{index}"}, headers=headers)).raise_for_status()
+
+
+async def sample_memory(pid: int, stop: asyncio.Event, samples: List[float], interval: float = 0.5):
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args) -> dict:
+    stack = None
+    url, pid = args.url, args.pid
+    if url is None:
+        stack = LocalStack(args)
+        await stack.start()
+        url, pid = stack.url, stack.app_pid
+
+    try:
+        run_id = uuid.uuid4().hex[:6]
+        recorder = Recorder()
+        connected: asyncio.Queue = asyncio.Queue()
+        start = asyncio.Event()
+        memory: List[float] = []
+        rss_idle = rss_mb(pid) if pid else None
+
+        limits = httpx.Limits(max_connections=args.clients * 2 + 10)
+        async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as http:
+            await create_rooms(http, run_id, args.rooms)
+            clients = [
+                asyncio.create_task(run_client(
+                    i, args, http, url.replace("http", "ws", 1), run_id, recorder, connected, start
+                ))
+                for i in range(args.clients)
+            ]
+            # Everyone is logged in and connected before the clock starts
+            for _ in clients:
+                await connected.get()
+            rss_connected = rss_mb(pid) if pid else None
+
+            stop_sampling = asyncio.Event()
+            sampler = asyncio.create_task(sample_memory(pid, stop_sampling, memory)) if pid else None
+            started = time.perf_counter()
+            start.set()
+            await asyncio.gather(*clients)
+            # The sending phase, which can overrun --duration if the app falls behind
+            elapsed = max(recorder.last_sent_at - started, args.duration)
+            stop_sampling.set()
+            if sampler:
+                await sampler
+            app_stats = (await http.get("/stats")).json()
+    finally:
+        if stack:
+            stack.stop()
+
+    counts = recorder.counts
+    return {
+        "meta": {
+            **git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "throughput": {
+            "duration_s": round(elapsed, 3),
+            "sent_per_s": round(counts["sent"] / elapsed, 2),
+            "delivered_per_s": round(counts["delivered"] / elapsed, 2),
+            "emotion_updates_per_s": round(counts["emotion_updates"] / elapsed, 2),
+        },
+        "counts": counts,
+        "latency": {name: summarize(values) for name, values in recorder.latencies.items()},
+        "memory_mb": {
+            "idle": rss_idle,
+            "connected": rss_connected,
+            "peak": max(memory) if memory else None,
+            "end": memory[-1] if memory else None,
+        },
+        "app_stats": app_stats,
+    }
+
+
+# --- Comparing Runs ---
+COMPARED = [
+    ("throughput", "delivered_per_s"),
+    ("latency", "broadcast", "p50_ms"), ("latency", "broadcast", "p99_ms"),
+    ("latency", "fanout", "p99_ms"),
+    ("latency", "emotion", "p50_ms"), ("latency", "emotion", "p99_ms"),
+    ("latency", "mood", "p99_ms"),
+    ("memory_mb", "peak"),
+]
+
+
+def compare(baseline: dict, report: dict):
+    print(f"Compared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for path in COMPARED:
+        before, after = baseline, report
+        for key in path:
+            before = (before or {}).get(key)
+            after = (after or {}).get(key)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "n/a"
+        print(f"  {'.'.join(path):<28} {before!s:>10} -> {after!s:>10}  ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--rooms", type=int, default=1, help="clients are spread evenly over this many rooms")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of sending")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per client")
+    parser.add_argument("--mood-interval", type=float, default=2.0, help="seconds between /mood polls (0: off)")
+    parser.add_argument("--summary-interval", type=float, default=0.0,
+                        help="seconds between /summary calls from one client (0: off)")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for late events after sending")
+    parser.add_argument("--url", help="benchmark this running app instead of booting a local one")
+    parser.add_argument("--pid", type=int, help="the running app's pid, for memory figures with --url")
+
+    stack = parser.add_argument_group("local stack (ignored with --url)")
+    stack.add_argument("--port", type=int, default=18080)
+    stack.add_argument("--fake-port", type=int, default=18001, help="emotion on this port, toxicity on the next")
+    stack.add_argument("--emotion-latency-ms", type=float, default=30.0)
+    stack.add_argument("--toxicity-latency-ms", type=float, default=10.0)
+    stack.add_argument("--llm-latency-ms", type=float, default=500.0)
+    stack.add_argument("--jitter-ms", type=float, default=0.0)
+    stack.add_argument("--bcrypt-rounds", type=int, default=4, help="cheap hashing so signup doesn't dominate")
+
+    parser.add_argument("--output", help="where to write the JSON report (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="an earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"chat_bench-{stamp}-{report['meta']['commit'] or 'unknown'}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Report written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
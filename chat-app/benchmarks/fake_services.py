@@ -0,0 +1,119 @@
+"""
+Local stand-ins for the emotion and toxicity services.
+
+They speak the same API as ml-emotion and ml-toxicity (/analyze,
+/analyze_batch, /health, /ready) but answer from a hash of the text after a
+configurable delay, so the chat app can be benchmarked without models.
+
+Usage:
+    python benchmarks/fake_services.py --emotion-port 8001 --toxicity-port 8002 --emotion-latency-ms 40
+
+Messages containing TOXIC_MARKER are scored as toxic; everything else is clean.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import zlib
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+EMOTIONS = ["joy", "neutral", "sadness", "anger", "surprise", "gratitude", "curiosity", "fear"]
+TOXIC_MARKER = "benchtoxic"
+
+
+class TextIn(BaseModel):
+    text: str
+
+
+class TextsIn(BaseModel):
+    texts: List[str]
+
+
+async def _delay(latency_ms: float, jitter_ms: float):
+    delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _emotion(text: str) -> str:
+    # Stable per text, like the real model, so caching behaves the same way
+    return EMOTIONS[zlib.crc32(text.encode()) % len(EMOTIONS)]
+
+
+def _toxicity(text: str) -> dict:
+    score = 0.99 if TOXIC_MARKER in text else 0.01
+    return {"is_toxic": score > 0.8, "score": score}
+
+
+def _add_health(app: FastAPI):
+    @app.get("/health")
+    def health():
+        return {"status": "ready"}
+
+    @app.get("/ready")
+    def ready():
+        return {"ready": True, "status": "ready"}
+
+
+def create_emotion_app(latency_ms: float = 0, jitter_ms: float = 0) -> FastAPI:
+    app = FastAPI(title="Fake Emotion Service")
+    _add_health(app)
+
+    @app.post("/analyze")
+    async def analyze(data: TextIn):
+        await _delay(latency_ms, jitter_ms)
+        return {"emotion": _emotion(data.text)}
+
+    @app.post("/analyze_batch")
+    async def analyze_batch(data: TextsIn):
+        # One "forward pass" per batch, as in the real service
+        await _delay(latency_ms, jitter_ms)
+        return {"emotions": [_emotion(text) for text in data.texts]}
+
+    return app
+
+
+def create_toxicity_app(latency_ms: float = 0, jitter_ms: float = 0) -> FastAPI:
+    app = FastAPI(title="Fake Toxicity Service")
+    _add_health(app)
+
+    @app.post("/analyze")
+    async def analyze(data: TextIn):
+        await _delay(latency_ms, jitter_ms)
+        return _toxicity(data.text)
+
+    @app.post("/analyze_batch")
+    async def analyze_batch(data: TextsIn):
+        await _delay(latency_ms, jitter_ms)
+        return {"results": [_toxicity(text) for text in data.texts]}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--emotion-port", type=int, default=8001)
+    parser.add_argument("--toxicity-port", type=int, default=8002)
+    parser.add_argument("--emotion-latency-ms", type=float, default=30.0)
+    parser.add_argument("--toxicity-latency-ms", type=float, default=10.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- noise added to every delay")
+    args = parser.parse_args()
+
+    emotion = create_emotion_app(args.emotion_latency_ms, args.jitter_ms)
+    toxicity = create_toxicity_app(args.toxicity_latency_ms, args.jitter_ms)
+    threading.Thread(
+        target=uvicorn.run, args=(toxicity,),
+        kwargs={"host": args.host, "port": args.toxicity_port, "log_level": "warning"},
+        daemon=True,
+    ).start()
+    print(f"✅ Fake emotion service on :{args.emotion_port}, fake toxicity service on :{args.toxicity_port}")
+    uvicorn.run(emotion, host=args.host, port=args.emotion_port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
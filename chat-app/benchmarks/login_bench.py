@@ -0,0 +1,143 @@
+"""
+Login throughput benchmark.
+
+Hammers POST /login from many concurrent clients while one WebSocket client
+keeps sending messages and timing how long each takes to come back as a
+broadcast. If password hashing blocks the event loop, the echo latency
+during the login phase shows it.
+
+Usage (against a running chat-app):
+    python benchmarks/login_bench.py --url http://localhost:8080 --concurrency 32 --duration 20
+
+Needs httpx and websockets (both come with the app's requirements).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+import websockets
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": max(values) if values else None,
+        "mean_ms": round(statistics.fmean(values), 3) if values else None,
+    }
+
+
+async def ensure_user(client: httpx.AsyncClient, username: str, password: str) -> str:
+    await client.post("/signup", json={"username": username, "password": password})
+    response = await client.post("/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def echo_probe(ws_url: str, token: str, room: str, interval: float, stop: asyncio.Event, samples: list):
+    """Sends a uniquely tagged message every `interval` seconds and records its round trip in ms."""
+    async with websockets.connect(f"{ws_url}/ws?token={token}&room={room}") as ws:
+        while not stop.is_set():
+            tag = f"echo-{uuid.uuid4().hex[:12]}"
+            started = time.perf_counter()
+            await ws.send(tag)
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame.get("type") == "chat_message" and frame.get("content") == tag:
+                    samples.append(round((time.perf_counter() - started) * 1000, 3))
+                    break
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def login_worker(client: httpx.AsyncClient, username: str, password: str, deadline: float, results: dict):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post("/login", json={"username": username, "password": password})
+            key = "ok" if response.status_code == 200 else f"status_{response.status_code}"
+        except httpx.HTTPError:
+            key = "errors"
+        results[key] = results.get(key, 0) + 1
+        if key == "ok":
+            results["latencies"].append(round((time.perf_counter() - started) * 1000, 3))
+
+
+async def run(args):
+    ws_url = args.url.replace("http", "ws", 1)
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60.0, limits=limits) as client:
+        run_id = uuid.uuid4().hex[:6]
+        echo_token = await ensure_user(client, f"echo_{run_id}", "echo-password")
+        await ensure_user(client, f"login_{run_id}", args.password)
+
+        # Phase 1: echo latency with no logins running
+        baseline = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(echo_probe(ws_url, echo_token, args.room, args.echo_interval, stop, baseline))
+        await asyncio.sleep(args.baseline)
+        stop.set()
+        await probe
+
+        # Phase 2: the same probe during a login storm
+        under_load = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(echo_probe(ws_url, echo_token, args.room, args.echo_interval, stop, under_load))
+        results = {"ok": 0, "latencies": []}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            login_worker(client, f"login_{run_id}", args.password, deadline, results)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    login_latencies = results.pop("latencies")
+    report = {
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "logins_per_s": round(results["ok"] / elapsed, 2),
+        "responses": results,
+        "login_latency": summarize(login_latencies),
+        "echo_latency_idle": summarize(baseline),
+        "echo_latency_during_logins": summarize(under_load),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--room", default="general")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of login load")
+    parser.add_argument("--baseline", type=float, default=5.0, help="seconds of idle echo sampling first")
+    parser.add_argument("--echo-interval", type=float, default=0.1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
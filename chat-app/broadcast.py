@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import WebSocket, status
+
+from backplane import Backplane, InProcessBackplane
+from logging_config import sampled
+
+logger = logging.getLogger(__name__)
+
+# --- Broadcast Settings ---
+# Each connection gets its own bounded outbound queue and writer task, so a
+# slow client only ever delays itself.
+BROADCAST_QUEUE_SIZE = int(os.environ.get("BROADCAST_QUEUE_SIZE", "256"))
+
+# What to do when a client's queue is full:
+#   "drop_oldest" - discard the oldest queued frame
+#   "coalesce"    - discard the oldest emotion/mood update first (they are
+#                   superseded or cosmetic), falling back to drop_oldest
+#   "disconnect"  - close the socket; the client reconnects and reloads history
+SLOW_CONSUMER_POLICY = os.environ.get("SLOW_CONSUMER_POLICY", "coalesce")
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Frame kinds that may be dropped under the "coalesce" policy
+COALESCABLE_KINDS = {"emotion_update", "mood_update"}
+
+# Lag is smoothed as an exponentially weighted moving average
+_LAG_EWMA_ALPHA = 0.2
+
+
+class OutboundFrame:
+    __slots__ = ("payload", "kind", "enqueued_at")
+
+    def __init__(self, payload: str, kind: str):
+        self.payload = payload
+        self.kind = kind
+        self.enqueued_at = time.monotonic()
+
+
+class ClientConnection:
+    """One connected socket with its own outbound queue and writer task."""
+
+    def __init__(self, user: str, room: int, websocket: WebSocket, manager: "ConnectionManager"):
+        self.user = user
+        self.room = room
+        self.websocket = websocket
+        self.manager = manager
+        self._queue: deque = deque()
+        self._has_frames = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.send_lag_ewma = 0.0
+        self.max_send_lag = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        self._queue.clear()
+
+    def enqueue(self, frame: OutboundFrame) -> bool:
+        """Queues a frame without blocking. Returns False if the client must be disconnected."""
+        # A newer mood always supersedes one that hasn't been sent yet
+        if frame.kind == "mood_update" and self.manager.policy == "coalesce":
+            self._remove_first(lambda queued: queued.kind == "mood_update")
+
+        if len(self._queue) >= self.manager.max_queue_size:
+            if self.manager.policy == "disconnect":
+                return False
+            if self.manager.policy == "coalesce":
+                if not self._remove_first(lambda queued: queued.kind in COALESCABLE_KINDS):
+                    self._queue.popleft()
+            else:
+                self._queue.popleft()
+            self.dropped += 1
+            self.manager.dropped_frames += 1
+
+        self._queue.append(frame)
+        self._has_frames.set()
+        return True
+
+    def _remove_first(self, predicate) -> bool:
+        for queued in self._queue:
+            if predicate(queued):
+                self._queue.remove(queued)
+                return True
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._has_frames.clear()
+                    await self._has_frames.wait()
+                    continue
+                frame = self._queue.popleft()
+                await self.websocket.send_text(frame.payload)
+                lag = time.monotonic() - frame.enqueued_at
+                self._record_lag(lag)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Sent frame", extra=sampled(
+                        user=self.user, room=self.room, kind=frame.kind, lag_ms=round(lag * 1000, 3)
+                    ))
+                self.sent += 1
+                self.manager.sent_frames += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("🔴 Failed to send to '%s': %s", self.user, e)
+            self.manager.disconnect(self)
+
+    def _record_lag(self, lag: float):
+        self.send_lag_ewma += _LAG_EWMA_ALPHA * (lag - self.send_lag_ewma)
+        self.max_send_lag = max(self.max_send_lag, lag)
+
+    async def close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """
+    Tracks this worker's sockets, indexed by room. Broadcasts go out through
+    the backplane and come back in via `deliver_local`, so every worker
+    (including this one) delivers each message to its own connections in
+    that room, in the same order. A message costs O(room size), not O(users).
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = BROADCAST_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        backplane: Optional[Backplane] = None,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown SLOW_CONSUMER_POLICY: {policy}")
+        self.max_queue_size = max(1, max_queue_size)
+        self.policy = policy
+        self.backplane = backplane or InProcessBackplane()
+        # room id -> username -> connection
+        self.rooms: Dict[int, Dict[str, ClientConnection]] = {}
+        self.connection_count = 0
+        self._listeners: Dict[str, List[Callable[[str, int], Awaitable[None]]]] = {}
+        # Totals since startup, including connections that have since closed
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.slow_consumer_disconnects = 0
+        self._closing: set = set()
+
+    async def start(self):
+        await self.backplane.start(self._on_envelope)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    def add_listener(self, kind: str, callback: Callable[[str, int], Awaitable[None]]):
+        """Runs `callback(payload, room)` on this worker for every delivered frame of `kind`."""
+        self._listeners.setdefault(kind, []).append(callback)
+
+    def room_size(self, room: int) -> int:
+        return len(self.rooms.get(room, ()))
+
+    async def connect(self, websocket: WebSocket, user: str, room: int) -> ClientConnection:
+        members = self.rooms.setdefault(room, {})
+        # A second tab for the same user in the same room replaces the first
+        previous = members.get(user)
+        if previous:
+            self.disconnect(previous)
+            await previous.close(status.WS_1000_NORMAL_CLOSURE)
+            members = self.rooms.setdefault(room, {})
+
+        connection = ClientConnection(user, room, websocket, self)
+        members[user] = connection
+        self.connection_count += 1
+        connection.start()
+        logger.info(
+            "✅ User '%s' connected to room %s. Total connections: %d", user, room, self.connection_count
+        )
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        members = self.rooms.get(connection.room)
+        # Ignore stale disconnects from a connection that was already replaced
+        if not members or members.get(connection.user) is not connection:
+            return
+        del members[connection.user]
+        if not members:
+            del self.rooms[connection.room]
+        self.connection_count -= 1
+        connection.stop()
+        logger.info(
+            "❌ User '%s' disconnected from room %s. Total connections: %d",
+            connection.user, connection.room, self.connection_count,
+        )
+
+    async def broadcast(self, message: str, room: int, kind: str = "chat_message"):
+        """Publishes an already-serialized message to the room on every worker."""
+        try:
+            await self.backplane.publish({"room": room, "kind": kind, "payload": message})
+        except Exception as e:
+            # Better to reach this worker's users than nobody
+            logger.error("🔴 Backplane publish failed, delivering locally only: %s", e)
+            await self.deliver_local(message, room, kind)
+
+    async def _on_envelope(self, envelope: dict):
+        await self.deliver_local(envelope["payload"], envelope["room"], envelope["kind"])
+
+    async def deliver_local(self, message: str, room: int, kind: str = "chat_message"):
+        """
+        Enqueues a message for every client in `room` connected to this worker.
+        Never waits on a socket; the per-connection writers do the sending.
+        """
+        frame = OutboundFrame(message, kind)
+        slow_consumers = [
+            connection
+            for connection in list(self.rooms.get(room, {}).values())
+            if not connection.enqueue(frame)
+        ]
+
+        for connection in slow_consumers:
+            logger.warning("🐢 Disconnecting slow consumer '%s'.", connection.user)
+            self.slow_consumer_disconnects += 1
+            self.disconnect(connection)
+            # Closing can itself stall on a slow client, so don't wait for it
+            task = asyncio.create_task(connection.close(status.WS_1013_TRY_AGAIN_LATER))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+        for callback in self._listeners.get(kind, ()):
+            try:
+                await callback(message, room)
+            except Exception as e:
+                logger.exception("🔴 Listener for '%s' failed: %s", kind, e)
+
+    async def send_private_message(self, message: str, user: str, room: int, kind: str = "system_alert"):
+        connection = self.rooms.get(room, {}).get(user)
+        if connection and not connection.enqueue(OutboundFrame(message, kind)):
+            self.disconnect(connection)
+            await connection.close(status.WS_1013_TRY_AGAIN_LATER)
+
+    def stats(self) -> dict:
+        connections = [connection for members in self.rooms.values() for connection in members.values()]
+        depths = [connection.queue_depth for connection in connections]
+        lags = [connection.send_lag_ewma for connection in connections]
+        return {
+            "connections": len(connections),
+            "rooms": len(self.rooms),
+            "policy": self.policy,
+            "queue_size": self.max_queue_size,
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sent_frames": self.sent_frames,
+            "dropped_frames": self.dropped_frames,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "avg_send_lag_ms": round(1000 * sum(lags) / len(lags), 3) if lags else 0.0,
+            "max_send_lag_ms": round(1000 * max((c.max_send_lag for c in connections), default=0.0), 3),
+        }
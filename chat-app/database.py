@@ -1,35 +1,64 @@
+import logging
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+logger = logging.getLogger(__name__)
+
+# Optional override, e.g. "sqlite:///./chat.db" for local runs and tests.
+# When set, the Cloud SQL variables below are not required.
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
 # Get database credentials from environment variables
 DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
 DB_NAME = os.environ.get("DB_NAME")
 INSTANCE_CONNECTION_NAME = os.environ.get("INSTANCE_CONNECTION_NAME")
 
-if not all([DB_USER, DB_PASS, DB_NAME, INSTANCE_CONNECTION_NAME]):
+if not DATABASE_URL and not all([DB_USER, DB_PASS, DB_NAME, INSTANCE_CONNECTION_NAME]):
     raise ValueError("One or more database environment variables are not set")
 
-print("Attempting to connect via Cloud SQL Unix Socket...")
+# Sync drivers and their asyncio counterparts
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+def _to_async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
 
 try:
-    # This is the simple, direct connection string.
-    # It connects to the socket created by the --add-cloudsql-instances flag.
-    DATABASE_URL = (
-        f"mysql+pymysql://{DB_USER}:{DB_PASS}@"
-        f"/{DB_NAME}?unix_socket=/cloudsql/{INSTANCE_CONNECTION_NAME}"
-    )
+    if DATABASE_URL:
+        logger.info("Attempting to connect via DATABASE_URL...")
+    else:
+        logger.info("Attempting to connect via Cloud SQL Unix Socket...")
+        # This is the simple, direct connection string.
+        # It connects to the socket created by the --add-cloudsql-instances flag.
+        DATABASE_URL = (
+            f"mysql+pymysql://{DB_USER}:{DB_PASS}@"
+            f"/{DB_NAME}?unix_socket=/cloudsql/{INSTANCE_CONNECTION_NAME}"
+        )
+    ASYNC_DATABASE_URL = _to_async_url(DATABASE_URL)
+
+    # SQLite connections are shared between threads by the threadpool
+    connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
     
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-    print("✅ Database engine created.")
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+    # The async engine serves the WebSocket loop and the hot REST endpoints,
+    # so a slow query no longer blocks the event loop for every other socket.
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    logger.info("✅ Database engine created.")
 
 except Exception as e:
-    print(f"❌ Failed to create database engine: {e}")
+    logger.error("❌ Failed to create database engine: %s", e)
     raise e
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Dependency for DB session
@@ -40,6 +69,11 @@ def get_db():
     finally:
         db.close()
 
+# Dependency for an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 
 # import os
 # import pymysql
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List
+
+logger = logging.getLogger(__name__)
+
+# --- Enrichment Settings ---
+# Emotion lookups for new messages run on a fixed pool of workers instead of
+# one unbounded task per message.
+ENRICHMENT_WORKERS = int(os.environ.get("ENRICHMENT_WORKERS", "4"))
+# Jobs waiting for a worker. Beyond this, jobs are shed: their message keeps
+# its initial "unknown" emotion.
+ENRICHMENT_MAX_QUEUE = int(os.environ.get("ENRICHMENT_MAX_QUEUE", "1000"))
+# Which job is shed when the queue is full:
+#   "oldest" - the longest-waiting one; its message has likely scrolled away (default)
+#   "newest" - the incoming one
+ENRICHMENT_SHED_POLICY = os.environ.get("ENRICHMENT_SHED_POLICY", "oldest")
+ENRICHMENT_SHED_POLICIES = ("oldest", "newest")
+# A worker sends up to ENRICHMENT_BATCH_SIZE queued texts in one request,
+# waiting at most ENRICHMENT_BATCH_WAIT_MS for a batch to fill.
+ENRICHMENT_BATCH_SIZE = int(os.environ.get("ENRICHMENT_BATCH_SIZE", "16"))
+ENRICHMENT_BATCH_WAIT_MS = float(os.environ.get("ENRICHMENT_BATCH_WAIT_MS", "10"))
+# How long shutdown waits for queued jobs to finish
+ENRICHMENT_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("ENRICHMENT_DRAIN_TIMEOUT_SECONDS", "10"))
+
+
+class EnrichmentJob:
+    __slots__ = ("message_id", "text", "room_id", "enqueued_at")
+
+    def __init__(self, message_id: int, text: str, room_id: int):
+        self.message_id = message_id
+        self.text = text
+        self.room_id = room_id
+        self.enqueued_at = time.perf_counter()
+
+
+class EnrichmentQueue:
+    """
+    A bounded job queue drained by a fixed number of workers.
+
+    Each worker takes a batch of jobs, classifies all of their texts with one
+    `classify` call and hands every job its label via `apply`. The queue never
+    blocks the caller: when it is full, a job is shed according to the policy.
+    """
+
+    def __init__(
+        self,
+        classify: Callable[[List[str]], Awaitable[List[str]]],
+        apply: Callable[[EnrichmentJob, str], Awaitable[None]],
+        workers: int = ENRICHMENT_WORKERS,
+        max_queue: int = ENRICHMENT_MAX_QUEUE,
+        shed_policy: str = ENRICHMENT_SHED_POLICY,
+        batch_size: int = ENRICHMENT_BATCH_SIZE,
+        batch_wait_ms: float = ENRICHMENT_BATCH_WAIT_MS,
+    ):
+        if shed_policy not in ENRICHMENT_SHED_POLICIES:
+            raise ValueError(f"Unknown ENRICHMENT_SHED_POLICY: {shed_policy}")
+        self.classify = classify
+        self.apply = apply
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.shed_policy = shed_policy
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000.0
+        self._jobs: Deque[EnrichmentJob] = deque()
+        self._has_jobs = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+        self.batches = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._jobs)
+
+    async def start(self):
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = ENRICHMENT_DRAIN_TIMEOUT_SECONDS):
+        """Stops accepting jobs, gives the queued ones `timeout` seconds to finish, then sheds the rest."""
+        self._accepting = False
+        deadline = time.perf_counter() + timeout
+        while (self._jobs or self.in_flight) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._jobs:
+            logger.warning("⚠️ %d enrichment jobs were not finished before shutdown.", len(self._jobs))
+            self.shed += len(self._jobs)
+            self._jobs.clear()
+
+    def submit(self, message_id: int, text: str, room_id: int) -> bool:
+        """Queues a job without waiting. Returns False if this or an older job was shed."""
+        if not self._accepting:
+            self.shed += 1
+            return False
+        self.submitted += 1
+        if len(self._jobs) >= self.max_queue:
+            self.shed += 1
+            if self.shed_policy == "newest":
+                return False
+            self._jobs.popleft()
+            self._jobs.append(EnrichmentJob(message_id, text, room_id))
+            return False
+        self._jobs.append(EnrichmentJob(message_id, text, room_id))
+        self._has_jobs.set()
+        return True
+
+    async def _collect(self, batch: List[EnrichmentJob]):
+        """
+        Moves up to batch_size jobs from the queue into `batch`, counting each
+        as in flight the moment it leaves the queue. If the worker is
+        cancelled meanwhile, the partial batch goes back to the front of the
+        queue, so stop() still waits for or sheds those jobs.
+        """
+        try:
+            while not self._jobs:
+                self._has_jobs.clear()
+                await self._has_jobs.wait()
+
+            self._take(batch)
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.batch_size:
+                if self._jobs:
+                    self._take(batch)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._has_jobs.clear()
+                try:
+                    await asyncio.wait_for(self._has_jobs.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            self._jobs.extendleft(reversed(batch))
+            self.in_flight -= len(batch)
+            batch.clear()
+            raise
+
+    def _take(self, batch: List[EnrichmentJob]):
+        batch.append(self._jobs.popleft())
+        self.in_flight += 1
+
+    async def _worker(self):
+        while True:
+            batch: List[EnrichmentJob] = []
+            try:
+                await self._collect(batch)
+                await self._process(batch)
+            finally:
+                self.in_flight -= len(batch)
+
+    async def _process(self, batch: List[EnrichmentJob]):
+        self.batches += 1
+        try:
+            labels = await self.classify([job.text for job in batch])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The messages keep their "unknown" emotion
+            logger.error("🔴 Emotion classification failed for %d messages: %s", len(batch), e)
+            self.failed += len(batch)
+            return
+
+        for job, label in zip(batch, labels):
+            try:
+                await self.apply(job, label)
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("🔴 Could not apply emotion: %s", e, extra={"message_id": job.message_id})
+                self.failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": len(self._jobs),
+            "max_queue": self.max_queue,
+            "shed_policy": self.shed_policy,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "batches": self.batches,
+            "avg_batch_size": round((self.completed + self.failed) / self.batches, 2) if self.batches else 0.0,
+        }
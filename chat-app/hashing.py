@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# --- Password Hashing Settings ---
+# bcrypt cost factor. Hashes made with a lower cost are upgraded on login.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# bcrypt is deliberately CPU-bound, so it runs in its own processes and a
+# burst of logins can never stall the event loop (and every WebSocket with it).
+HASH_POOL_WORKERS = int(os.environ.get("HASH_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hash/verify calls allowed in flight at once (running + waiting in the pool)
+HASH_MAX_CONCURRENCY = int(os.environ.get("HASH_MAX_CONCURRENCY", str(HASH_POOL_WORKERS * 2)))
+# A call that can't get a slot within this long is rejected instead of queued
+HASH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("HASH_QUEUE_TIMEOUT_SECONDS", "2.0"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashingOverloaded(Exception):
+    """Raised when no hashing slot frees up within HASH_QUEUE_TIMEOUT_SECONDS."""
+
+
+# --- FIX for ValueError: password cannot be longer than 72 bytes ---
+# bcrypt only looks at the first 72 bytes, so hand it exactly those.
+def _truncate_password(password: str) -> bytes:
+    """Encodes password to UTF-8 and truncates it to 72 bytes."""
+    return password.encode('utf-8')[:72]
+
+# These run inside the pool's worker processes, so they must stay picklable
+# module-level functions.
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(_truncate_password(password))
+
+def verify_and_update_sync(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Returns (matches, new_hash); new_hash is set when `hashed` uses outdated parameters."""
+    return pwd_context.verify_and_update(_truncate_password(password), hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool with a concurrency limit."""
+
+    def __init__(
+        self,
+        workers: int = HASH_POOL_WORKERS,
+        max_concurrency: int = HASH_MAX_CONCURRENCY,
+        queue_timeout: float = HASH_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.rejected = 0
+
+    def start(self):
+        # "spawn" keeps the workers free of the parent's threads, sockets and DB pools
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        logger.info("✅ Password hashing pool started (%d workers, bcrypt rounds %d).", self.workers, BCRYPT_ROUNDS)
+
+    def stop(self):
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, fn, *args):
+        if self._pool is None:
+            raise RuntimeError("Password hashing pool has not been started")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HashingOverloaded()
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password_sync, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_sync, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Optional
+
+import httpx
+
+from resilience import DependencyGuard
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional 'h2' package (installed via httpx[http2]).
+# Without it we silently stay on HTTP/1.1 keep-alive.
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Responses that mean "try again shortly" rather than "your request is bad"
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+# Errors raised before the request could have been processed, so a retry
+# can never double-apply anything. Read timeouts are deliberately excluded.
+RETRYABLE_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+# Floor for the toxicity guard's latency-derived timeout (the env var
+# TOXICITY_TIMEOUT_MIN_SECONDS overrides it). Low enough that the timeout
+# follows the service's observed p99, so a slow call stalls its sender briefly;
+# an occasional blip is absorbed by the breaker's failure-rate window.
+TOXICITY_TIMEOUT_MIN_SECONDS = 0.5
+
+
+class ServiceClient:
+    """
+    A long-lived, pooled HTTP client for one downstream ML service.
+
+    Connections are kept alive between messages, so a chat message costs a
+    request on an existing connection instead of a fresh TCP/TLS handshake.
+    Calls go through `guard`, if set, which refuses them fast while the
+    service is failing or overloaded (see resilience.py).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        retries: int = 2,
+        backoff_seconds: float = 0.05,
+        guard: Optional[DependencyGuard] = None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.guard = guard
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(
+        cls, name: str, url_var: str, guard_defaults: Optional[dict] = None, **defaults
+    ) -> Optional["ServiceClient"]:
+        """
+        Builds a client from environment variables, e.g. for name="TOXICITY":
+        TOXICITY_HTTP_TIMEOUT, TOXICITY_HTTP_MAX_CONNECTIONS, TOXICITY_HTTP_RETRIES.
+        The HTTP timeout is the ceiling for the guard's latency-derived timeout;
+        `guard_defaults` are passed on to DependencyGuard.from_env.
+        Returns None if the service URL itself is not configured.
+        """
+        base_url = os.environ.get(url_var)
+        if not base_url:
+            return None
+
+        def setting(key: str, cast, default):
+            value = os.environ.get(f"{name}_HTTP_{key}")
+            return cast(value) if value is not None else defaults.get(key.lower(), default)
+
+        timeout = setting("TIMEOUT", float, 30.0)
+        return cls(
+            name=name.lower(),
+            base_url=base_url,
+            timeout=timeout,
+            connect_timeout=setting("CONNECT_TIMEOUT", float, 5.0),
+            max_connections=setting("MAX_CONNECTIONS", int, 100),
+            max_keepalive_connections=setting("MAX_KEEPALIVE_CONNECTIONS", int, 20),
+            retries=setting("RETRIES", int, 2),
+            backoff_seconds=setting("BACKOFF_SECONDS", float, 0.05),
+            guard=DependencyGuard.from_env(name, max_timeout=timeout, **(guard_defaults or {})),
+        )
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, path: str, json: dict) -> httpx.Response:
+        """
+        POSTs JSON to the service, retrying transient failures with
+        exponential backoff and jitter. The last error or response is returned
+        (or raised) once the retries are used up. With a guard, the retries
+        share one timeout, and DependencyUnavailable is raised without
+        calling the service when its circuit is open.
+        """
+        if self._client is None:
+            raise RuntimeError(f"HTTP client for '{self.name}' has not been started")
+        if self.guard is None:
+            return await self._post_with_retries(path, json)
+        return await self.guard.call(
+            lambda: self._post_with_retries(path, json),
+            is_failure=lambda response: response.status_code >= 500,
+        )
+
+    async def _post_with_retries(self, path: str, json: dict) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            is_last_attempt = attempt == self.retries
+            try:
+                response = await self._client.post(path, json=json)
+                if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+                    return response
+            except RETRYABLE_EXCEPTIONS:
+                if is_last_attempt:
+                    raise
+
+            delay = self.backoff_seconds * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+
+class ServiceClients:
+    """Holds the application-lifetime clients for every downstream service."""
+
+    def __init__(self):
+        self.emotion: Optional[ServiceClient] = None
+        self.toxicity: Optional[ServiceClient] = None
+
+    async def start(self):
+        self.emotion = ServiceClient.from_env("EMOTION", "EMOTION_API_URL")
+        # The toxicity check sits on the send path, so give up retrying sooner
+        # and never wait anywhere near as long as for a background emotion lookup
+        self.toxicity = ServiceClient.from_env(
+            "TOXICITY", "TOXICITY_API_URL", retries=1, timeout=5.0,
+            guard_defaults={"timeout_min_seconds": TOXICITY_TIMEOUT_MIN_SECONDS},
+        )
+
+        for client in (self.emotion, self.toxicity):
+            if client:
+                await client.start()
+                logger.info("✅ HTTP client for '%s' started (HTTP/2: %s).", client.name, HTTP2_AVAILABLE)
+
+    async def close(self):
+        for client in (self.emotion, self.toxicity):
+            if client:
+                await client.close()
+
+    def stats(self) -> dict:
+        return {
+            client.name: client.guard.stats()
+            for client in (self.emotion, self.toxicity)
+            if client and client.guard
+        }
+
+
+service_clients = ServiceClients()
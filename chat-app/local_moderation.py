@@ -0,0 +1,69 @@
+import logging
+import os
+import re
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Local Fallback Settings ---
+# Used when TOXICITY_DEGRADED_MODE=local and the toxicity service can't be
+# reached. One word or phrase per line; blank lines and "#" comments are
+# skipped. Without a file, a short built-in list is used.
+TOXICITY_WORDLIST_PATH = os.environ.get("TOXICITY_WORDLIST_PATH")
+
+# Deliberately short: a crude stop-gap for blatant abuse, not a replacement
+# for the model
+DEFAULT_WORDLIST = (
+    "idiot", "moron", "stupid", "dumbass", "loser", "retard", "bitch", "bastard",
+    "asshole", "fuck", "fucking", "shit", "kill yourself", "kys",
+)
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _load_wordlist(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class WordlistFilter:
+    """Flags a message that contains any listed word or phrase (whole words, case-insensitive)."""
+
+    def __init__(self, entries: Iterable[str]):
+        self.words = set()
+        self.phrases = set()
+        for entry in entries:
+            tokens = _WORD_RE.findall(entry.lower())
+            if len(tokens) == 1:
+                self.words.add(tokens[0])
+            elif tokens:
+                self.phrases.add(" ".join(tokens))
+        self.checked = 0
+        self.flagged = 0
+
+    @classmethod
+    def from_env(cls, path: Optional[str] = TOXICITY_WORDLIST_PATH) -> "WordlistFilter":
+        if path:
+            try:
+                return cls(_load_wordlist(path))
+            except OSError as e:
+                logger.error("🔴 Could not read TOXICITY_WORDLIST_PATH, using the built-in list: %s", e)
+        return cls(DEFAULT_WORDLIST)
+
+    def check(self, text: str) -> dict:
+        """A result shaped like the toxicity service's."""
+        tokens = _WORD_RE.findall(text.lower())
+        is_toxic = any(token in self.words for token in tokens)
+        if not is_toxic and self.phrases:
+            joined = f" {' '.join(tokens)} "
+            is_toxic = any(f" {phrase} " in joined for phrase in self.phrases)
+        self.checked += 1
+        self.flagged += is_toxic
+        return {"is_toxic": is_toxic, "score": 1.0 if is_toxic else 0.0, "source": "wordlist"}
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.words) + len(self.phrases),
+            "checked": self.checked,
+            "flagged": self.flagged,
+        }
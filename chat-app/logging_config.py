@@ -0,0 +1,164 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# --- Logging Settings ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line, for log collectors) or "text" (for a terminal)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Fraction of per-message / per-recipient debug events that are kept
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+# Records waiting for the writer thread; beyond this they are dropped, never waited on
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+# (uvicorn adds an ANSI-coloured copy of its messages, which is dropped too)
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "sampled", "sample_key", "color_message",
+}
+
+
+def sampled(key=None, **fields) -> dict:
+    """
+    `extra=` for a high-volume debug event, kept at the LOG_SAMPLE_RATE.
+    Events sharing a `key` (e.g. a message id) are kept or dropped together,
+    so a sampled message keeps its whole trace.
+    """
+    return {"sampled": True, "sample_key": key, **fields}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes records marked with `sampled(...)` only `rate` of the time; everything else always."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        if self.rate >= 1.0:
+            return True
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return random.random() < self.rate
+        return zlib.crc32(str(key).encode()) / 2 ** 32 < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; if it has fallen behind, drops them instead of blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the default, keep the `extra=` fields for the JSON formatter.
+        # The message and traceback are rendered now, while their objects are still current.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "text":
+        return logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+    return JsonFormatter()
+
+
+class LoggingControl:
+    """
+    Routes all logging through one bounded queue and a single writer thread,
+    so the event loop never blocks on stdout. Levels and the sample rate can
+    be changed at runtime (see the /admin/logging endpoint).
+    """
+
+    def __init__(self):
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.sampling: Optional[SamplingFilter] = None
+        self.listener: Optional[QueueListener] = None
+        self.overrides: Dict[str, str] = {}
+
+    def setup(self, level: str = LOG_LEVEL, sample_rate: float = LOG_SAMPLE_RATE):
+        if self.listener:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(log_queue)
+        self.sampling = SamplingFilter(sample_rate)
+        self.handler.addFilter(self.sampling)
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(_formatter())
+        self.listener = QueueListener(log_queue, output, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.stop)
+
+        root = logging.getLogger()
+        root.handlers = [self.handler]
+        root.setLevel(level)
+        # Send the server's own loggers through the same queue
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error", "gunicorn.access"):
+            server_logger = logging.getLogger(name)
+            server_logger.handlers = []
+            server_logger.propagate = True
+
+    def stop(self):
+        if self.listener:
+            self.listener.stop()  # Flushes whatever is still queued
+            self.listener = None
+
+    def set_levels(self, levels: Dict[str, str]):
+        """Maps logger names ("root" for the root logger) to level names."""
+        for name, level in levels.items():
+            logging.getLogger(None if name == "root" else name).setLevel(level.upper())
+            self.overrides[name] = level.upper()
+
+    def set_sample_rate(self, rate: float):
+        if self.sampling:
+            self.sampling.rate = min(1.0, max(0.0, rate))
+
+    def state(self) -> dict:
+        return {
+            "levels": {"root": logging.getLevelName(logging.getLogger().level), **self.overrides},
+            "sample_rate": self.sampling.rate if self.sampling else None,
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0,
+        }
+
+
+logging_control = LoggingControl()
@@ -1,30 +1,77 @@
+import hmac
 import json
-import os, asyncio
+import logging
+import os, asyncio, time
 
-import traceback
-import httpx
-from datetime import datetime, timedelta
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Query, BackgroundTasks
-from fastapi.responses import FileResponse # UPDATED: To serve the HTML file
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, Depends, Header, HTTPException, status, WebSocket, WebSocketDisconnect, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse # UPDATED: To serve the HTML file
 from fastapi.staticfiles import StaticFiles # NEW: To serve static files (CSS, JS)
-from sqlalchemy.orm import Session
-from typing import List, Dict
-from collections import Counter
-from starlette.concurrency import run_in_threadpool
-from collections import Counter
-import models, schemas, auth
-from database import engine, Base, get_db, SessionLocal
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from logging_config import logging_control, sampled
+# Set up before the other modules log anything
+logging_control.setup()
+
+import models, schemas, auth, metrics
+from cache import ResultCache
+from enrichment import EnrichmentJob, EnrichmentQueue
+from auth_cache import token_cache, user_cache
+from hashing import password_hasher, HashingOverloaded
+from http_clients import service_clients
+from resilience import DependencyUnavailable
+from local_moderation import WordlistFilter
+from persistence import check_node_id, message_writer
+from mood import RoomMoods
+from summaries import RoomSummaries
+from rooms import room_directory, DEFAULT_ROOM
+from schema import check_schema
+from broadcast import ConnectionManager
+from backplane import create_backplane
+from rate_limit import create_rate_limiter
+from database import engine, async_engine, Base, get_async_db, AsyncSessionLocal
 # from ml_model import analyze_emotion 
 # from content_moderation import is_toxic
-from summarizer import generate_summary_async , generate_mood_async
 
 # from dotenv import load_dotenv
 # load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Create tables in the database if they don't exist
 Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Real-Time Affective Chatroom")
+# ... but create_all never alters an existing table, so refuse to run against
+# one that predates the current models (see schema.py)
+check_schema(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled, keep-alive clients for the ML services live as long as the app
+    await service_clients.start()
+    password_hasher.start()
+    await manager.start()
+    # Give this worker a cluster-unique message id prefix when we can;
+    # fails startup if every id is taken by a live worker
+    node_id = await manager.backplane.lease_node_id(message_writer.ids.node_slots, message_writer.ids.set_node_id)
+    if node_id is not None:
+        message_writer.ids.set_node_id(node_id)
+    check_node_id(leased=node_id is not None)
+    await message_writer.start()
+    await enrichment_queue.start()
+    await room_directory.ensure(DEFAULT_ROOM)
+    yield
+    # Finish queued emotion lookups, then flush buffered messages before the DB engine goes away
+    await enrichment_queue.stop()
+    await message_writer.stop()
+    await manager.stop()
+    await service_clients.close()
+    password_hasher.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="Real-Time Affective Chatroom", lifespan=lifespan)
 
 # --- Static Files Setup ---
 STATIC_DIR = "static"
@@ -41,153 +88,218 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
 # --- Anti-Spam (Rate Limiting) ---
-message_timestamps: Dict[str, List[datetime]] = {}
-MESSAGE_LIMIT = 5
-TIME_WINDOW = timedelta(seconds=10)
-
-
-
-# --- IMPROVED Connection Manager (Debugging Version) ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, user: str):
-        self.active_connections[user] = websocket
-        print(f"[Manager] ✅ User '{user}' connected. Total connections: {len(self.active_connections)}")
-
-    def disconnect(self, user: str):
-        if user in self.active_connections:
-            del self.active_connections[user]
-            print(f"[Manager] ❌ User '{user}' disconnected. Total connections: {len(self.active_connections)}")
-
-    async def broadcast(self, message: str):
-        count = len(self.active_connections)
-        print(f"[Manager] 📢 Broadcasting to {count} users...")
-        
-        if count == 0:
-            print("[Manager] ⚠️ WARNING: No active connections found! The user might have disconnected.")
-            return
-
-        # Create a list of broken connections to remove
-        broken_connections = []
-
-        for user, connection in self.active_connections.items():
-            try:
-                await connection.send_text(message)
-                print(f"[Manager] ➡️ Sent to {user}")
-            except Exception as e:
-                print(f"[Manager] 🔴 FAILED to send to {user}: {e}")
-                broken_connections.append(user)
-        
-        # Clean up broken connections
-        for user in broken_connections:
-            self.disconnect(user)
-
-    async def send_private_message(self, message: str, user: str):
-        if user in self.active_connections:
-            try:
-                await self.active_connections[user].send_text(message)
-            except Exception as e:
-                print(f"[Manager] 🔴 Failed to send private message to {user}: {e}")
-                self.disconnect(user)
-manager = ConnectionManager()
+# A token bucket per user (MESSAGE_LIMIT messages per TIME_WINDOW_SECONDS),
+# shared across workers with RATE_LIMIT_BACKEND=redis.
+rate_limiter = create_rate_limiter()
+
+
+
+# --- Toxicity Threshold ---
+# If set, the raw score returned by the toxicity service is compared against
+# this value here, so the threshold can be tuned without touching the model.
+CHAT_TOXICITY_THRESHOLD = os.environ.get("TOXICITY_THRESHOLD")
+
+def _is_toxic_result(result: dict) -> bool:
+    score = result.get("score")
+    if CHAT_TOXICITY_THRESHOLD is not None and score is not None:
+        return score > float(CHAT_TOXICITY_THRESHOLD)
+    return result.get("is_toxic", False)
+
+
+# --- Toxicity Degraded Mode ---
+# What happens to a message when the toxicity service gives no verdict (an
+# error, a timeout, or its circuit is open and it isn't being called at all):
+#   "local"       - it is checked against a wordlist instead (see local_moderation.py, the default);
+#                   a hit holds the message back but, unlike a model verdict, never counts as a warning
+#   "fail_closed" - it is refused and the sender is asked to try again
+#   "fail_open"   - it is sent unchecked
+TOXICITY_DEGRADED_MODE = os.environ.get("TOXICITY_DEGRADED_MODE", "local")
+if TOXICITY_DEGRADED_MODE not in ("fail_open", "fail_closed", "local"):
+    raise ValueError(f"Unknown TOXICITY_DEGRADED_MODE: {TOXICITY_DEGRADED_MODE}")
+
+local_toxicity_filter = WordlistFilter.from_env()
+
+
+# --- Classification Result Cache ---
+# Repeated messages skip the HTTP round trip to the ML services entirely.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "600"))
+# Share one entry between casings of a text. Off by default: the models are
+# case-sensitive, so "STOP" and "stop" can score differently.
+RESULT_CACHE_CASEFOLD = os.environ.get("RESULT_CACHE_CASEFOLD", "false").lower() == "true"
+
+emotion_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_CASEFOLD)
+toxicity_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_CASEFOLD)
+
+
+# --- Room Mood ---
+# The dominant emotion over each room's last MOOD_WINDOW_SIZE classified messages.
+MOOD_WINDOW_SIZE = int(os.environ.get("MOOD_WINDOW_SIZE", "30"))
+
+async def _load_room_emotions(room_id: int, limit: int) -> List[str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.Message.emotion)
+            .where(models.Message.room_id == room_id, models.Message.emotion != "unknown")
+            .order_by(models.Message.timestamp.desc())
+            .limit(limit)
+        )
+        return list(reversed(result.scalars().all()))
+
+room_moods = RoomMoods(MOOD_WINDOW_SIZE, _load_room_emotions)
+
+
+# --- Connection Manager ---
+# With BROADCAST_BACKPLANE=redis, several workers/replicas share each room.
+manager = ConnectionManager(backplane=create_backplane())
+
+metrics.register_gauge(
+    "chat_websocket_connections", "Open WebSocket connections on this worker", lambda: manager.connection_count
+)
+metrics.register_gauge(
+    "chat_outbound_queued_frames", "Frames waiting in per-connection send queues",
+    lambda: manager.stats()["queued_frames"],
+)
+metrics.register_gauge(
+    "chat_persist_pending_rows", "Message rows and emotion updates not yet flushed",
+    lambda: message_writer.pending_rows,
+)
+
+async def _on_emotion_update(payload: str, room_id: int):
+    # Runs on every worker for every emotion, so each worker's aggregators
+    # stay in step and push mood changes to their own sockets.
+    mood_aggregator = await room_moods.get(room_id)
+    if mood_aggregator.record(json.loads(payload).get("emotion")):
+        await manager.deliver_local(
+            json.dumps({"type": "mood_update", "mood": mood_aggregator.mood}), room_id, kind="mood_update"
+        )
+
+manager.add_listener("emotion_update", _on_emotion_update)
+
+
+
+# --- Toxicity Check ---
+async def _fetch_toxicity(text: str) -> Optional[dict]:
+    """Calls the toxicity service. Returns its verdict, or None if it gave none."""
+    try:
+        response = await service_clients.toxicity.post("/analyze", json={"text": text})
+    except DependencyUnavailable as e:
+        # Refused without a call; the guard already logged the circuit opening
+        logger.debug("Toxicity check skipped: %s", e, extra=sampled())
+        return None
+    except Exception as e:
+        logger.error("Error calling toxicity API: %r", e)
+        return None
+    if response.status_code != 200:
+        logger.warning("Toxicity API call failed with status %d", response.status_code)
+        return None
+    result = response.json()
+    toxicity_cache.set(text, result)
+    return result
 
+def _guard_of(name: str):
+    client = getattr(service_clients, name)
+    return client.guard if client else None
 
+for _name in ("emotion", "toxicity"):
+    metrics.register_gauge(
+        f"chat_{_name}_circuit_open", f"1 while calls to the {_name} service are refused or probing",
+        lambda name=_name: float(bool(_guard_of(name) and _guard_of(name).is_open)),
+    )
+    metrics.register_gauge(
+        f"chat_{_name}_concurrency_limit", f"Concurrent calls currently allowed to the {_name} service",
+        lambda name=_name: _guard_of(name).limiter.limit if _guard_of(name) else 0.0,
+    )
+    metrics.register_gauge(
+        f"chat_{_name}_timeout_seconds", f"Timeout derived from recent {_name} service latency",
+        lambda name=_name: _guard_of(name).timeout if _guard_of(name) else 0.0,
+    )
 
-def _update_message_emotion_in_db(message_id: int, emotion: str) -> bool:
+# --- Emotion Enrichment ---
+async def _classify_emotions(texts: List[str]) -> List[str]:
     """
-    A SYNCHRONOUS, BLOCKING function to be run in a threadpool.
-    It creates its own DB session, updates one message, and closes the session.
-    Returns True on success, False on failure.
+    Labels a batch of texts: cache hits directly, the rest with one call to the
+    emotion service. Raises if the call fails.
     """
-    db = None
-    try:
-        print(f"[Task {message_id}]: DB-Thread: Creating new DB session...")
-        db = SessionLocal()
-        print(f"[Task {message_id}]: DB-Thread: Querying for message...")
-        db_message = db.query(models.Message).filter(models.Message.id == message_id).first()
-        
-        if db_message:
-            print(f"[Task {message_id}]: DB-Thread: Message found, updating emotion to {emotion}...")
-            db_message.emotion = emotion
-            db.commit()
-            print(f"[Task {message_id}]: DB-Thread: DB update complete.")
-            return True
-        else:
-            print(f"[Task {message_id}]: DB-Thread: ERROR - Message ID {message_id} not found in DB.")
-            return False
-            
-    except Exception as e:
-        print(f"[Task {message_id}]: DB-Thread: ERROR - Exception during DB update: {e}")
-        if db:
-            db.rollback()
-        traceback.print_exc()
-        return False
-    finally:
-        if db:
-            db.close()
-            print(f"[Task {message_id}]: DB-Thread: DB session closed.")
-
-async def update_emotion(message_id: int, text: str):
+    emotions = [emotion_cache.get(text) for text in texts]
+    misses = list(dict.fromkeys(text for text, emotion in zip(texts, emotions) if emotion is None))
+    if not misses:
+        return emotions
+    if service_clients.emotion is None:
+        raise RuntimeError("EMOTION_API_URL is not set!")
+
+    with metrics.EMOTION_API_STAGE.time():
+        response = await service_clients.emotion.post("/analyze_batch", json={"texts": misses})
+    if response.status_code != 200:
+        raise RuntimeError(f"Emotion API call failed with status {response.status_code}")
+    fetched = dict(zip(misses, response.json().get("emotions", [])))
+    for text, emotion in fetched.items():
+        if emotion != "unknown":
+            emotion_cache.set(text, emotion)
+    return [emotion if emotion is not None else fetched.get(text, "unknown") for text, emotion in zip(texts, emotions)]
+
+async def _apply_emotion(job: EnrichmentJob, emotion: str):
     """
-    ASYNC Background Task:
-    1. Calls the slow emotion API (async).
-    2. Calls the blocking DB update in a threadpool (async-aware).
-    3. Broadcasts the emotion update to all clients (async).
+    Runs on an enrichment worker once the emotion is known:
+    1. Queues the emotion update with the batched message writer (async).
+    2. Broadcasts the emotion update to the room (async).
     """
-    print(f"[Task {message_id}]: Starting emotion update for: '{text}'")
-    
-    # 1. Call the slow emotion API (Async)
-    EMOTION_API_URL = os.environ.get("EMOTION_API_URL")
-    emotion = "unknown"
-    
-    if not EMOTION_API_URL:
-        print(f"[Task {message_id}]: ERROR - EMOTION_API_URL is not set!")
-        return
-
-    try:
-        print(f"[Task {message_id}]: Calling API: {EMOTION_API_URL}")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{EMOTION_API_URL}/analyze", 
-                json={"text": text},
-                timeout=30.0
-            )
-        
-        if response.status_code == 200:
-            emotion = response.json().get("emotion", "unknown")
-            print(f"[Task {message_id}]: API call SUCCESS, emotion: {emotion}")
-        else:
-            print(f"[Task {message_id}]: ERROR - API call failed with status: {response.status_code}")
-            return # Stop if API call fails
-            
-    except Exception as e:
-        print(f"[Task {message_id}]: ERROR - Exception during API call: {e}")
-        traceback.print_exc()
-        return # Stop if API call fails
-
-    # 2. Update the message in the DB (Run blocking code in threadpool)
-    print(f"[Task {message_id}]: Handing off to DB thread...")
-    db_success = await run_in_threadpool(_update_message_emotion_in_db, message_id, emotion)
-    
-    if not db_success:
-        print(f"[Task {message_id}]: Stopping task, DB update failed.")
-        return # Stop if DB update failed
+    message_id = job.message_id
+    logger.debug("Emotion classified", extra=sampled(message_id, message_id=message_id, emotion=emotion))
+
+    # 1. Update the message in the DB (Async, flushed in batches)
+    with metrics.EMOTION_PERSIST_STAGE.time():
+        await message_writer.set_emotion(message_id, emotion)
+
+    # 2. Broadcast *only* the update (Async)
+    update_data = {
+        "type": "emotion_update",
+        "message_id": message_id,
+        "emotion": emotion
+    }
+    with metrics.EMOTION_BROADCAST_STAGE.time():
+        await manager.broadcast(json.dumps(update_data), job.room_id, kind="emotion_update")
+    # Includes the time spent waiting in the queue
+    metrics.EMOTION_STAGE.observe(time.perf_counter() - job.enqueued_at)
+    logger.debug("Emotion update broadcast", extra=sampled(message_id, message_id=message_id))
+
+# A fixed pool of workers; messages shed under load keep the "unknown" emotion
+# they were saved with.
+enrichment_queue = EnrichmentQueue(_classify_emotions, _apply_emotion)
+
+metrics.register_gauge(
+    "chat_enrichment_queue_depth", "Messages waiting for an emotion", lambda: enrichment_queue.queue_depth
+)
+metrics.register_gauge(
+    "chat_enrichment_in_flight", "Messages an enrichment worker is classifying", lambda: enrichment_queue.in_flight
+)
+
+# --- Moderation ---
+MUTE_AFTER_WARNINGS = 3
+
+async def _record_warning(db: AsyncSession, user_id: int) -> auth.CachedUser:
+    """
+    Adds a warning (muting at MUTE_AFTER_WARNINGS) with one atomic UPDATE, so
+    concurrent sockets of the same user can't lose a warning, then drops the
+    now-stale cached profile. Returns the updated profile.
+    """
+    warning_count = func.coalesce(models.User.warning_count, 0) + 1
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(
+            warning_count=warning_count,
+            is_muted=or_(models.User.is_muted == True, warning_count >= MUTE_AFTER_WARNINGS),
+        )
+    )
+    await db.commit()
+    auth.invalidate_user(user_id)
 
-    # 3. Broadcast *only* the update (Async)
-    try:
-        update_data = {
-            "type": "emotion_update",
-            "message_id": message_id,
-            "emotion": emotion
-        }
-        print(f"[Task {message_id}]: Broadcasting emotion update...")
-        await manager.broadcast(json.dumps(update_data))
-        print(f"[Task {message_id}]: Broadcast complete. Task finished.")
-    except Exception as e:
-        print(f"[Task {message_id}]: ERROR - Exception during broadcast: {e}")
-        traceback.print_exc()
+    row = (await db.execute(
+        select(models.User.id, models.User.username, models.User.is_muted, models.User.warning_count)
+        .where(models.User.id == user_id)
+    )).one()
+    return auth.CachedUser(row.id, row.username, row.is_muted, row.warning_count)
 
 # --- API Endpoints ---
 
@@ -201,26 +313,129 @@ async def get_root():
 async def get_summary_page():
     return FileResponse('summary.html')
 
+def _hashing_unavailable() -> HTTPException:
+    # Shed the login burst instead of letting it pile up behind bcrypt
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @app.post("/signup", response_model=schemas.UserOut)
-def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.username == user_in.username).first()
+async def signup(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = (await db.execute(
+        select(models.User.id).where(models.User.username == user_in.username)
+    )).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed = auth.hash_password(user_in.password)
+    try:
+        hashed = await password_hasher.hash(user_in.password)
+    except HashingOverloaded:
+        raise _hashing_unavailable()
     user = models.User(username=user_in.username, password=hashed)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Someone else registered the same name while we were hashing
+        raise HTTPException(status_code=400, detail="Username already registered")
+    await db.refresh(user)
     return user
 
 @app.post("/login", response_model=schemas.Token)
-def login(form_data: schemas.UserCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.password):
+async def login(form_data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(
+        select(models.User).where(models.User.username == form_data.username)
+    )).scalar_one_or_none()
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    try:
+        verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.password)
+    except HashingOverloaded:
+        raise _hashing_unavailable()
+    if not verified:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # The stored hash uses an outdated cost; upgrade it now that we know the password
+        await db.execute(update(models.User).where(models.User.id == user.id).values(password=new_hash))
+        await db.commit()
     access_token = auth.create_access_token(data={"sub": str(user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/stats")
+def get_stats():
+    return {
+        "emotion_cache": emotion_cache.stats(),
+        "enrichment": enrichment_queue.stats(),
+        "toxicity_cache": toxicity_cache.stats(),
+        "dependencies": service_clients.stats(),
+        "toxicity_degraded_mode": TOXICITY_DEGRADED_MODE,
+        "local_toxicity_filter": local_toxicity_filter.stats(),
+        "broadcast": manager.stats(),
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "summaries": room_summaries.stats(),
+        "logging": logging_control.state(),
+    }
+
+# --- Admin ---
+# Runtime switches for operators, e.g. turning on message tracing without a
+# redeploy. Disabled unless ADMIN_TOKEN is set. Each worker keeps its own
+# settings, so with several workers the change applies to the one that answers.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+@app.get("/admin/logging", dependencies=[Depends(require_admin)])
+def get_logging_settings():
+    return logging_control.state()
+
+@app.put("/admin/logging", dependencies=[Depends(require_admin)])
+def update_logging_settings(settings: schemas.LoggingSettings):
+    """E.g. {"levels": {"main": "DEBUG", "broadcast": "DEBUG"}, "sample_rate": 1.0} for full tracing."""
+    invalid = [level for level in settings.levels.values() if not isinstance(logging.getLevelName(level.upper()), int)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown log level(s): {', '.join(invalid)}")
+    logging_control.set_levels(settings.levels)
+    if settings.sample_rate is not None:
+        logging_control.set_sample_rate(settings.sample_rate)
+    logger.warning("Logging settings changed", extra={"levels": settings.levels, "sample_rate": settings.sample_rate})
+    return logging_control.state()
+
+@app.get("/rooms", response_model=List[schemas.RoomOut])
+async def list_rooms(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    result = await db.execute(select(models.Room).order_by(models.Room.name))
+    return result.scalars().all()
+
+@app.post("/rooms", response_model=schemas.RoomOut)
+async def create_room(
+    room_in: schemas.RoomCreate,
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    room = await room_directory.create(room_in.name)
+    if room is None:
+        raise HTTPException(status_code=400, detail="Room already exists")
+    return room
+
+async def get_room_id(room: str = Query(DEFAULT_ROOM)) -> int:
+    """Dependency resolving the `room` query parameter (a room name) to its id."""
+    room_id = await room_directory.resolve(room)
+    if room_id is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room_id
+
 @app.get("/me", response_model=schemas.UserOut)
 def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
@@ -232,12 +447,17 @@ async def websocket_endpoint(
     websocket: WebSocket, 
     # background_tasks: BackgroundTasks,  <-- REMOVE THIS
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    room: str = Query(DEFAULT_ROOM),
 ):
-    # 1. Authenticate user
+    # 1. Authenticate user and find the room
+    # Sessions are opened only around the queries that need one: a socket can
+    # stay open for hours and must not pin a pooled connection all that time.
     try:
-        user = auth.get_user_from_token(token, db)
+        async with AsyncSessionLocal() as db:
+            user = await auth.get_user_from_token_async(token, db)
         if not user: raise HTTPException(status_code=401)
+        room_id = await room_directory.resolve(room)
+        if room_id is None: raise HTTPException(status_code=404)
     except:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
@@ -245,7 +465,7 @@ async def websocket_endpoint(
     await websocket.accept()
         
     # 2. Connect user and announce entry
-    await manager.connect(websocket, user.username)
+    connection = await manager.connect(websocket, user.username, room_id)
     join_announcement = json.dumps({
         "type": "chat_message", 
         "id": f"system-{datetime.utcnow().isoformat()}",
@@ -254,93 +474,168 @@ async def websocket_endpoint(
         "timestamp": datetime.utcnow().isoformat(),
         "emotion": "neutral"
     })
-    await manager.broadcast(join_announcement)
+    await manager.broadcast(join_announcement, room_id)
     
     try:
         while True:
             # 3. Wait for a new message
             data = await websocket.receive_text()
             now = datetime.utcnow()
+            received_at = time.perf_counter()
 
             # 4. Check for Mute / Rate Limiting
             if user.is_muted:
                 await manager.send_private_message(json.dumps({
                     "type": "system_alert", "content": "You are currently muted and cannot send messages."
-                }), user.username)
+                }), user.username, room_id)
+                metrics.MESSAGES_MUTED.inc()
+                continue
+
+            # Checked before any downstream call, so a flood costs nothing but this
+            with metrics.RATE_LIMIT_STAGE.time():
+                allowed = await rate_limiter.allow(str(user.id))
+            if not allowed:
+                await manager.send_private_message(json.dumps({
+                    "type": "system_alert", "content": "You are sending messages too fast. Please slow down."
+                }), user.username, room_id)
+                metrics.MESSAGES_RATE_LIMITED.inc()
                 continue
             
             # 5. STEP 1: MANDATORY TOXICITY CHECK
-            TOXICITY_API_URL = os.environ.get("TOXICITY_API_URL")
             is_message_toxic = False
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{TOXICITY_API_URL}/analyze", 
-                        json={"text": data},
-                        timeout=30.0 
-                    )
-                    if response.status_code == 200:
-                        is_message_toxic = response.json().get("is_toxic", False)
-            except Exception as e:
-                print(f"Error calling toxicity API: {e}")
+            unchecked = False
+            with metrics.TOXICITY_STAGE.time():
+                toxicity_result = toxicity_cache.get(data)
+                if toxicity_result is None and service_clients.toxicity:
+                    toxicity_result = await _fetch_toxicity(data)
+                    if toxicity_result is None:
+                        # No verdict: fall back to TOXICITY_DEGRADED_MODE
+                        metrics.TOXICITY_DEGRADED.inc()
+                        if TOXICITY_DEGRADED_MODE == "local":
+                            toxicity_result = local_toxicity_filter.check(data)
+                        elif TOXICITY_DEGRADED_MODE == "fail_closed":
+                            unchecked = True
+            if unchecked:
+                await manager.send_private_message(json.dumps({
+                    "type": "system_alert",
+                    "content": "Messages can't be checked right now, so yours was not sent. Please try again shortly."
+                }), user.username, room_id)
+                metrics.MESSAGES_UNCHECKED.inc()
+                continue
+            if toxicity_result is not None:
+                is_message_toxic = _is_toxic_result(toxicity_result)
+
+            if is_message_toxic and toxicity_result.get("source") == "wordlist":
+                # Only a model verdict counts towards warnings and muting; the
+                # crude fallback just holds the message back
+                await manager.send_private_message(json.dumps({
+                    "type": "system_alert",
+                    "content": "Your message was not sent because it may break the chat rules. Please rephrase it."
+                }), user.username, room_id)
+                metrics.MESSAGES_FLAGGED_LOCALLY.inc()
+                continue
 
             if is_message_toxic:
                 # ... (toxicity logic remains the same) ...
-                user.warning_count += 1
+                async with AsyncSessionLocal() as db:
+                    user = await _record_warning(db, user.id)
                 warning_msg = f"Message blocked. Warning {user.warning_count}."
-                if user.warning_count >= 3:
-                     user.is_muted = True
-                db.commit()
                 await manager.send_private_message(json.dumps({
                     "type": "system_alert", "content": warning_msg
-                }), user.username)
+                }), user.username, room_id)
+                metrics.MESSAGES_TOXIC.inc()
                 continue 
 
             # 6. STEP 2: SAVE & BROADCAST IMMEDIATELY
-            db_message = models.Message(user_id=user.id, content=data, emotion="unknown")
-            db.add(db_message)
-            db.commit()
-            db.refresh(db_message)
+            # The id is allocated up front and the INSERT is batched in the
+            # background, so the broadcast doesn't wait for the database.
+            try:
+                with metrics.PERSIST_STAGE.time():
+                    db_message = await message_writer.add_message(user.id, room_id, data)
+            except Exception as e:
+                logger.error("Could not save message: %s", e)
+                await manager.send_private_message(json.dumps({
+                    "type": "system_alert", "content": "Your message could not be saved. Please try again."
+                }), user.username, room_id)
+                metrics.MESSAGES_SAVE_FAILED.inc()
+                continue
             
             message_data = {
                 "type": "chat_message",
-                "id": db_message.id,
+                "id": db_message["id"],
+                "room_id": room_id,
                 "username": user.username,
-                "content": db_message.content,
-                "timestamp": db_message.timestamp.isoformat(),
-                "emotion": db_message.emotion
+                "content": db_message["content"],
+                "timestamp": db_message["timestamp"].isoformat(),
+                "emotion": db_message["emotion"]
             }
-            await manager.broadcast(json.dumps(message_data))
+            with metrics.BROADCAST_STAGE.time():
+                await manager.broadcast(json.dumps(message_data), room_id)
+            metrics.MESSAGES_ACCEPTED.inc()
+            metrics.MESSAGE_STAGE.observe(time.perf_counter() - received_at)
 
-            print(f"[WebSocket]: Creating ASYNC task for message ID {db_message.id}")
+            logger.debug(
+                "Message accepted", extra=sampled(db_message["id"], message_id=db_message["id"], room_id=room_id)
+            )
 
-            # 7. STEP 3: RUN SLOW EMOTION CHECK (THE FIX)
-            # Use asyncio.create_task instead of background_tasks
-            asyncio.create_task(update_emotion(db_message.id, data))
+            # 7. STEP 3: QUEUE THE SLOW EMOTION CHECK
+            # Bounded: under load the message is shed and keeps "unknown"
+            if not enrichment_queue.submit(db_message["id"], data, room_id):
+                metrics.ENRICHMENT_SHED.inc()
 
     except WebSocketDisconnect:
-        manager.disconnect(user.username)
+        manager.disconnect(connection)
         # ... (disconnect logic) ...
     finally:
-        if user and user.username in manager.active_connections:
-            manager.disconnect(user.username)
+        manager.disconnect(connection)
 
 # --- Data Endpoints (Unchanged) ---
 @app.get("/messages", response_model=List[schemas.MessageOut])
-def get_messages(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+async def get_messages(
+    before_id: Optional[int] = Query(None, description="Return messages older than this message id"),
+    limit: int = Query(50, ge=1, le=200),
+    room_id: int = Depends(get_room_id),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    messages = db.query(models.Message).order_by(models.Message.timestamp.asc()).all()
-    result = []
-    for msg in messages:
-        if msg.user:
-            result.append(schemas.MessageOut(
-                id=msg.id, user_id=msg.user_id, content=msg.content,
-                timestamp=msg.timestamp, username=msg.user.username,
-                emotion=msg.emotion
-            ))
-    return result
+    """
+    Returns one page of a room's history, oldest first. Without `before_id` this is the
+    newest page; pass the id of the oldest message you have to get the page
+    before it (keyset pagination on (timestamp, id)).
+    """
+    query = (
+        select(
+            models.Message.id, models.Message.user_id, models.Message.room_id, models.Message.content,
+            models.Message.timestamp, models.Message.emotion, models.User.username,
+        )
+        .join(models.User, models.Message.user_id == models.User.id)
+        .where(models.Message.room_id == room_id)
+        .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+        .limit(limit)
+    )
+
+    if before_id is not None:
+        cursor_timestamp = (await db.execute(
+            select(models.Message.timestamp).where(
+                models.Message.id == before_id, models.Message.room_id == room_id
+            )
+        )).scalar_one_or_none()
+        if cursor_timestamp is None:
+            return []
+        query = query.where(or_(
+            models.Message.timestamp < cursor_timestamp,
+            and_(models.Message.timestamp == cursor_timestamp, models.Message.id < before_id),
+        ))
+
+    rows = (await db.execute(query)).all()
+    return [
+        schemas.MessageOut(
+            id=row.id, user_id=row.user_id, room_id=row.room_id, content=row.content,
+            timestamp=row.timestamp, username=row.username,
+            emotion=row.emotion
+        )
+        for row in reversed(rows)
+    ]
 
 # # --- UPDATED /mood ENDPOINT ---
 # @app.get("/mood", response_model=schemas.MoodOut)
@@ -370,60 +665,74 @@ def get_messages(
 # --- UPDATED /mood ENDPOINT (No LLM) ---
 @app.get("/mood", response_model=schemas.MoodOut)
 async def get_overall_mood(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    room_id: int = Depends(get_room_id),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    # 1. Fetch recent messages (e.g., last 30)
-    recent_messages = db.query(models.Message).order_by(models.Message.timestamp.desc()).limit(30).all()
-
-    if not recent_messages:
-        return schemas.MoodOut(mood="neutral")
-
-    # 2. Create a list of all emotions from these messages
-    # We will ignore "unknown" and "neutral" so they don't
-    # accidentally win the vote.
-    emotion_list = [
-        msg.emotion 
-        for msg in recent_messages 
-        if msg.emotion and msg.emotion not in ["unknown", "neutral"]
-    ]
+    # Served from the room's in-memory aggregator; clients also get pushed
+    # 'mood_update' events over the WebSocket whenever it changes.
+    mood_aggregator = await room_moods.get(room_id)
+    return schemas.MoodOut(mood=mood_aggregator.mood)
 
-    # 3. If the list is empty (all messages were neutral/unknown),
-    # just return "neutral".
-    if not emotion_list:
-        return schemas.MoodOut(mood="neutral")
-
-    # 4. Use Counter to find the most common emotion (the "majority vote")
-    # Counter(emotion_list) creates a dict like {'joy': 5, 'anger': 2}
-    # .most_common(1) gets the top one: [('joy', 5)]
-    # [0][0] extracts the emotion name: 'joy'
-    try:
-        dominant_mood = Counter(emotion_list).most_common(1)[0][0]
-    except IndexError:
-        # This happens if the list was empty, but we already checked
-        dominant_mood = "neutral"
-    
-    return schemas.MoodOut(mood=dominant_mood)
 
+# --- Summary Endpoints ---
+# Summaries are cached per room and updated incrementally (see summaries.py)
+room_summaries = RoomSummaries()
 
-# --- Summary Endpoint (Unchanged) ---
 @app.get("/summary", response_model=schemas.SummaryOut)
 async def get_chat_summary(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    room_id: int = Depends(get_room_id),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    recent_messages = db.query(models.Message).order_by(models.Message.timestamp.desc()).limit(50).all()
-    recent_messages.reverse() 
-
-    if not recent_messages:
-        return schemas.SummaryOut(summary="There are no recent messages to summarize.")
-
-    transcript = "\n".join(
-        f"{msg.user.username}: {msg.content}" 
-        for msg in recent_messages if msg.user
-    )
-
-    summary_text = await generate_summary_async(transcript)
+    try:
+        summary_text = await room_summaries.summarize(room_id)
+    except Exception as e:
+        logger.error("❌ Error during summarization: %s", e)
+        summary_text = "An error occurred while generating the summary."
     
     return schemas.SummaryOut(summary=summary_text)
 
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.get("/summary/stream")
+async def stream_chat_summary(
+    request: Request,
+    room_id: int = Depends(get_room_id),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    """
+    Server-Sent Events version of /summary: each `data:` event carries the next
+    piece of text as {"token": ...}, then an `event: done` closes the stream.
+    A cached (or shared in-flight) summary arrives as a single piece.
+    """
+    async def events():
+        tokens: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(room_summaries.summarize(room_id, on_token=tokens.put_nowait))
+        task.add_done_callback(lambda _: tokens.put_nowait(None))
+        streamed = False
+        try:
+            while (token := await tokens.get()) is not None:
+                # Stop paying for tokens nobody will read
+                if await request.is_disconnected():
+                    logger.info("Summary client disconnected, cancelling generation.")
+                    return
+                streamed = True
+                yield _sse({"token": token})
+
+            summary_text = task.result()
+            if not streamed:
+                yield _sse({"token": summary_text})
+            yield _sse({}, event="done")
+        except Exception as e:
+            logger.error("❌ Error during streamed summarization: %s", e)
+            yield _sse({"detail": "An error occurred while generating the summary."}, event="error")
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
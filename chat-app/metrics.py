@@ -0,0 +1,79 @@
+import os
+from typing import Callable, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+)
+
+# --- Metrics Settings ---
+# With more than one gunicorn worker, point PROMETHEUS_MULTIPROC_DIR at an
+# empty directory so /metrics aggregates every worker, not just the one that
+# happened to answer. (Callback gauges are per-process and are left out then.)
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Most stages take a few milliseconds; the ML round trips can take seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- Message Pipeline ---
+# One histogram, one label per stage. Children are bound once here, so
+# recording is a lock and a bucket increment, cheap enough to leave on.
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Time spent in each stage of the message pipeline", ["stage"], buckets=STAGE_BUCKETS
+)
+# websocket_endpoint, per incoming message
+RATE_LIMIT_STAGE = STAGE_SECONDS.labels("rate_limit")
+TOXICITY_STAGE = STAGE_SECONDS.labels("toxicity")
+PERSIST_STAGE = STAGE_SECONDS.labels("persist")
+BROADCAST_STAGE = STAGE_SECONDS.labels("broadcast")
+MESSAGE_STAGE = STAGE_SECONDS.labels("message_total")
+# Emotion enrichment workers, per accepted message
+EMOTION_API_STAGE = STAGE_SECONDS.labels("emotion_api")
+EMOTION_PERSIST_STAGE = STAGE_SECONDS.labels("emotion_persist")
+EMOTION_BROADCAST_STAGE = STAGE_SECONDS.labels("emotion_broadcast")
+EMOTION_STAGE = STAGE_SECONDS.labels("emotion_total")
+
+MESSAGES = Counter("chat_messages_total", "Incoming chat messages by outcome", ["outcome"])
+MESSAGES_ACCEPTED = MESSAGES.labels("accepted")
+MESSAGES_MUTED = MESSAGES.labels("muted")
+MESSAGES_RATE_LIMITED = MESSAGES.labels("rate_limited")
+MESSAGES_TOXIC = MESSAGES.labels("toxic")
+MESSAGES_SAVE_FAILED = MESSAGES.labels("save_failed")
+# Refused because the toxicity service gave no verdict (TOXICITY_DEGRADED_MODE=fail_closed)
+MESSAGES_UNCHECKED = MESSAGES.labels("unchecked")
+# Blocked by the local wordlist while the toxicity service gave no verdict (no warning recorded)
+MESSAGES_FLAGGED_LOCALLY = MESSAGES.labels("flagged_locally")
+
+# Rows the database kept rejecting, dropped by the message writer ("insert" or "emotion")
+PERSIST_DEAD_LETTERS = Counter(
+    "chat_persist_dead_letter_rows_total", "Rows dropped after PERSIST_MAX_ATTEMPTS failed writes", ["kind"]
+)
+
+TOXICITY_DEGRADED = Counter(
+    "chat_toxicity_degraded_total", "Messages handled by TOXICITY_DEGRADED_MODE because the toxicity service gave no verdict"
+)
+
+ENRICHMENT_SHED = Counter(
+    "chat_enrichment_shed_total", "Messages that skipped emotion enrichment because the queue was full"
+)
+
+
+# --- Gauges Read at Scrape Time ---
+def register_gauge(name: str, documentation: str, read: Callable[[], float]) -> Optional[Gauge]:
+    """A gauge whose value is computed only when /metrics is scraped."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Only values written to the shared files are exported; a callback would read as 0
+        return None
+    gauge = Gauge(name, documentation)
+    gauge.set_function(read)
+    return gauge
+
+
+def render() -> Tuple[bytes, str]:
+    """The exposition body and its content type, for the /metrics endpoint."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
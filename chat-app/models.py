@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func, Boolean
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, ForeignKey, func, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -15,13 +15,31 @@ class User(Base):
 
     messages = relationship("Message", back_populates="user")
 
+class Room(Base):
+    __tablename__ = "rooms"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    messages = relationship("Message", back_populates="room")
+
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Allocated by the app (persistence.SnowflakeIdGenerator), not the DB
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     emotion = Column(String(50), nullable=True) 
 
-    user = relationship("User", back_populates="messages")
\ No newline at end of file
+    user = relationship("User", back_populates="messages")
+    room = relationship("Room", back_populates="messages")
+
+    # Serves the room-scoped, newest-first, keyset-paginated history query
+    # in /messages as well as the /mood and /summary lookups
+    __table_args__ = (
+        Index("ix_messages_room_timestamp_id", "room_id", "timestamp", "id"),
+    )
\ No newline at end of file
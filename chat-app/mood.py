@@ -0,0 +1,92 @@
+import asyncio
+from collections import Counter, deque
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+# These never win the mood vote, so they don't drown out real emotions
+IGNORED_EMOTIONS = {"unknown", "neutral"}
+
+
+class MoodAggregator:
+    """
+    Tracks the room mood over the last `window_size` classified messages.
+
+    Emotions are kept in a ring buffer with running counts, so recording a new
+    emotion and reading the current mood are both constant time: no database
+    query per /mood poll.
+    """
+
+    def __init__(self, window_size: int = 30):
+        self._window = deque(maxlen=window_size)
+        self._counts: Counter = Counter()
+        self.mood = "neutral"
+
+    def seed(self, emotions: Iterable[str]):
+        """Loads historical emotions, oldest first (e.g. on startup)."""
+        for emotion in emotions:
+            self._push(emotion)
+        self.mood = self._dominant()
+
+    def record(self, emotion: str) -> bool:
+        """Adds one emotion to the window. Returns True if the mood changed."""
+        self._push(emotion)
+        new_mood = self._dominant()
+        changed = new_mood != self.mood
+        self.mood = new_mood
+        return changed
+
+    def _push(self, emotion: str):
+        # The deque drops its oldest entry itself; mirror that in the counts
+        if len(self._window) == self._window.maxlen:
+            oldest = self._window[0]
+            if oldest and oldest not in IGNORED_EMOTIONS:
+                self._counts[oldest] -= 1
+                if not self._counts[oldest]:
+                    del self._counts[oldest]
+        self._window.append(emotion)
+        if emotion and emotion not in IGNORED_EMOTIONS:
+            self._counts[emotion] += 1
+
+    def _dominant(self) -> str:
+        # At most one entry per GoEmotions label, so this is bounded
+        if not self._counts:
+            return "neutral"
+        return self._counts.most_common(1)[0][0]
+
+
+class RoomMoods:
+    """
+    One MoodAggregator per room. A room's aggregator is created and seeded
+    from its recent history the first time that room is used on this worker.
+    Concurrent first calls for a room share one seed query; other rooms
+    never wait for it.
+    """
+
+    def __init__(self, window_size: int, load_history: Callable[[int, int], Awaitable[List[str]]]):
+        # load_history(room_id, limit) returns the room's latest classified
+        # emotions, oldest first. Messages still waiting for theirs must be left
+        # out: they are recorded when their emotion arrives.
+        self.window_size = window_size
+        self.load_history = load_history
+        self._rooms: Dict[int, MoodAggregator] = {}
+        self._seeding: Dict[int, asyncio.Task] = {}
+
+    async def get(self, room_id: int) -> MoodAggregator:
+        aggregator = self._rooms.get(room_id)
+        if aggregator is not None:
+            return aggregator
+        task = self._seeding.get(room_id)
+        if task is None:
+            task = asyncio.create_task(self._seed(room_id))
+            self._seeding[room_id] = task
+        # Shielded so one cancelled caller can't cancel the seed for the others
+        return await asyncio.shield(task)
+
+    async def _seed(self, room_id: int) -> MoodAggregator:
+        try:
+            aggregator = MoodAggregator(self.window_size)
+            aggregator.seed(await self.load_history(room_id, self.window_size))
+            self._rooms[room_id] = aggregator
+            return aggregator
+        finally:
+            # On failure the next call tries again
+            self._seeding.pop(room_id, None)
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+import metrics
+import models
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# --- Persistence Settings ---
+# "write_behind": broadcast first, flush to the DB in batches (default).
+# "write_through": every add/update is flushed before the call returns.
+PERSIST_MODE = os.environ.get("PERSIST_MODE", "write_behind")
+PERSIST_FLUSH_INTERVAL_MS = float(os.environ.get("PERSIST_FLUSH_INTERVAL_MS", "50"))
+PERSIST_FLUSH_MAX_ROWS = int(os.environ.get("PERSIST_FLUSH_MAX_ROWS", "200"))
+# Writers block on a flush once this many rows are waiting (backpressure)
+PERSIST_MAX_PENDING_ROWS = int(os.environ.get("PERSIST_MAX_PENDING_ROWS", "10000"))
+# A row the database keeps rejecting (e.g. a duplicate id) is dropped and
+# logged after this many failed writes, instead of failing every later flush
+PERSIST_MAX_ATTEMPTS = int(os.environ.get("PERSIST_MAX_ATTEMPTS", "3"))
+
+# Message ids embed a node id (0-63) that must differ between all processes
+# writing messages. With BROADCAST_BACKPLANE=redis each worker leases one.
+# Otherwise set a distinct NODE_ID per replica; without it, a single worker
+# process is assumed and uses 0. (Workers in one container share NODE_ID, so
+# several of them always need the Redis lease.)
+NODE_ID = os.environ.get("NODE_ID")
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+# Errors caused by the row itself; anything else (e.g. a lost connection)
+# says nothing about the row and is retried without counting against it
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+class PersistenceBacklogFull(Exception):
+    """Raised when PERSIST_MAX_PENDING_ROWS rows are waiting and a flush could not make room."""
+
+
+class SnowflakeIdGenerator:
+    """
+    Allocates unique, time-ordered message ids without asking the database.
+
+    Layout (53 bits, so ids stay exact as JavaScript numbers):
+    39 bits of milliseconds since EPOCH_MS | 6 bits node id | 8 bits sequence.
+    That is ~17 years of ids, 64 nodes and 256 ids per millisecond per node.
+    """
+
+    EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+    NODE_BITS = 6
+    SEQUENCE_BITS = 8
+
+    def __init__(self, node_id: int):
+        self.node_slots = 1 << self.NODE_BITS
+        self._sequence_mask = (1 << self.SEQUENCE_BITS) - 1
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.set_node_id(node_id)
+
+    def set_node_id(self, node_id: int):
+        with self._lock:
+            self.node_id = node_id & ((1 << self.NODE_BITS) - 1)
+
+    def next_id(self) -> int:
+        with self._lock:
+            now_ms = int(time.time() * 1000) - self.EPOCH_MS
+            # Never go backwards, even if the wall clock does
+            if now_ms <= self._last_ms:
+                now_ms = self._last_ms
+                self._sequence = (self._sequence + 1) & self._sequence_mask
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond: borrow the next one
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms << (self.NODE_BITS + self.SEQUENCE_BITS))
+                | (self.node_id << self.SEQUENCE_BITS)
+                | self._sequence
+            )
+
+
+def _settle(waiters: List[asyncio.Future], error: Optional[Exception] = None):
+    for future in waiters:
+        if future.done():
+            continue  # The writer was cancelled
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+def _default_node_id() -> int:
+    if NODE_ID is None:
+        return 0
+    node_id = int(NODE_ID)
+    if not 0 <= node_id < 1 << SnowflakeIdGenerator.NODE_BITS:
+        raise ValueError(f"NODE_ID must be between 0 and {(1 << SnowflakeIdGenerator.NODE_BITS) - 1}")
+    return node_id
+
+
+def check_node_id(leased: bool):
+    """Fails startup when several worker processes could end up sharing a node id."""
+    if not leased and WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            "WEB_CONCURRENCY > 1 needs BROADCAST_BACKPLANE=redis, so that each worker leases its own node id"
+        )
+
+
+class MessageWriter:
+    """
+    Buffers message inserts and emotion updates in memory and writes them as
+    one multi-row INSERT plus one bulk UPDATE ... CASE per flush.
+
+    An emotion that arrives before its message has been flushed is folded
+    into the pending INSERT, so that message never needs an UPDATE at all.
+
+    If a batch fails, its rows are retried one by one, so a single bad row
+    can't hold back the others; rows that keep failing are dead-lettered.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        mode: str = PERSIST_MODE,
+        flush_interval_ms: float = PERSIST_FLUSH_INTERVAL_MS,
+        flush_max_rows: int = PERSIST_FLUSH_MAX_ROWS,
+        max_pending_rows: int = PERSIST_MAX_PENDING_ROWS,
+        max_attempts: int = PERSIST_MAX_ATTEMPTS,
+    ):
+        if mode not in ("write_behind", "write_through"):
+            raise ValueError(f"Unknown PERSIST_MODE: {mode}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_rows = max(1, flush_max_rows)
+        self.max_pending_rows = max(self.flush_max_rows, max_pending_rows)
+        self.max_attempts = max(1, max_attempts)
+        self.ids = SnowflakeIdGenerator(_default_node_id())
+
+        self._pending_inserts: Dict[int, dict] = {}
+        self._pending_emotions: Dict[int, str] = {}
+        # Failed writes per ("insert" | "emotion", message id)
+        self._attempts: Dict[Tuple[str, int], int] = {}
+        # write_through only: the writers waiting on each row's flush
+        self._waiters: Dict[Tuple[str, int], List[asyncio.Future]] = {}
+        self.dead_lettered = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._pending_inserts) + len(self._pending_emotions)
+
+    async def start(self):
+        # In write_through mode every writer flushes its own rows
+        if self.mode == "write_behind":
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flush loop and writes out everything still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self.pending_rows:
+            logger.warning("⚠️ %d rows could not be written on shutdown.", self.pending_rows)
+
+    async def add_message(self, user_id: int, room_id: int, content: str, emotion: str = "unknown") -> dict:
+        """
+        Queues a new message and returns its row (with id and timestamp) right away.
+        If this raises, the message was not queued and will never be written.
+        """
+        await self._make_room()
+        row = {
+            "id": self.ids.next_id(),
+            "user_id": user_id,
+            "room_id": room_id,
+            "content": content,
+            "timestamp": datetime.utcnow(),
+            "emotion": emotion,
+        }
+        self._pending_inserts[row["id"]] = row
+        if self.mode == "write_through":
+            # A failed flush drops the row, so the error means "not saved"
+            await self._write_through(("insert", row["id"]))
+        else:
+            self._after_write()
+        return row
+
+    async def set_emotion(self, message_id: int, emotion: str):
+        await self._make_room()
+        pending_row = self._pending_inserts.get(message_id)
+        if pending_row is not None:
+            pending_row["emotion"] = emotion
+            key = ("insert", message_id)
+        else:
+            self._pending_emotions[message_id] = emotion
+            key = ("emotion", message_id)
+        if self.mode == "write_through":
+            await self._write_through(key)
+        else:
+            self._after_write()
+
+    async def _make_room(self):
+        """Backpressure: once the buffer is full, writers wait for a flush before queueing more."""
+        if self.mode == "write_through" or self.pending_rows < self.max_pending_rows:
+            return
+        await self.flush()
+        if self.pending_rows >= self.max_pending_rows:
+            raise PersistenceBacklogFull(f"{self.pending_rows} rows are waiting to be written")
+
+    async def _write_through(self, key: Tuple[str, int]):
+        """
+        Flushes, then waits for the outcome of whichever flush took the row
+        `key` (possibly another writer's) and raises if that flush failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(future)
+        try:
+            await self.flush()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        await future
+
+    def _after_write(self):
+        # Only wakes the flush loop; a background flush failure is never
+        # reported to a writer whose row is already safely queued
+        if self.pending_rows >= self.flush_max_rows:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending_rows:
+                return
+            inserts = list(self._pending_inserts.values())
+            emotions = self._pending_emotions
+            self._pending_inserts = {}
+            self._pending_emotions = {}
+            waiters = self._take_waiters(inserts, emotions)
+
+            try:
+                await self._write(inserts, emotions)
+            except Exception as e:
+                if self.mode == "write_through":
+                    # Every writer with a row in the batch sees the error, so
+                    # don't retry behind their backs
+                    logger.warning("⚠️ Flush of %d rows failed: %s", len(inserts) + len(emotions), e)
+                    _settle(waiters, e)
+                    return
+                logger.warning("⚠️ Flush of %d rows failed, retrying row by row: %s", len(inserts) + len(emotions), e)
+                await self._write_row_by_row(inserts, emotions)
+                return
+            _settle(waiters)
+            if self._attempts:
+                for row in inserts:
+                    self._attempts.pop(("insert", row["id"]), None)
+                for message_id in emotions:
+                    self._attempts.pop(("emotion", message_id), None)
+
+    async def _write_row_by_row(self, inserts: List[dict], emotions: Dict[int, str]):
+        """
+        Writes each row in its own transaction. Rows the database rejects are
+        requeued until they have failed PERSIST_MAX_ATTEMPTS times. Any other
+        error requeues everything not yet written and is raised.
+        """
+        remaining_inserts = list(inserts)
+        remaining_emotions = dict(emotions)
+        try:
+            while remaining_inserts:
+                row = remaining_inserts[0]
+                try:
+                    await self._write([row], {})
+                    self._attempts.pop(("insert", row["id"]), None)
+                except ROW_ERRORS as e:
+                    if self._count_failure(("insert", row["id"]), row, e):
+                        self._requeue([row], {})
+                remaining_inserts.pop(0)
+
+            while remaining_emotions:
+                message_id, emotion = next(iter(remaining_emotions.items()))
+                try:
+                    await self._write([], {message_id: emotion})
+                    self._attempts.pop(("emotion", message_id), None)
+                except ROW_ERRORS as e:
+                    if self._count_failure(("emotion", message_id), {"id": message_id, "emotion": emotion}, e):
+                        self._requeue([], {message_id: emotion})
+                del remaining_emotions[message_id]
+        except Exception:
+            self._requeue(remaining_inserts, remaining_emotions)
+            raise
+
+    def _take_waiters(self, inserts: List[dict], emotions: Dict[int, str]) -> List[asyncio.Future]:
+        if not self._waiters:
+            return []
+        keys = [("insert", row["id"]) for row in inserts] + [("emotion", message_id) for message_id in emotions]
+        return [future for key in keys for future in self._waiters.pop(key, ())]
+
+    def _count_failure(self, key: Tuple[str, int], row: dict, error: Exception) -> bool:
+        """Records a rejected write. Returns True if the row should be retried, False if it was dead-lettered."""
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[key] = attempts
+            return True
+        self._attempts.pop(key, None)
+        self.dead_lettered += 1
+        metrics.PERSIST_DEAD_LETTERS.labels(key[0]).inc()
+        logger.error(
+            "🔴 Dropping %s for message %d after %d failed writes: %s", key[0], key[1], attempts, error,
+            extra={"dead_letter": row},
+        )
+        return False
+
+    def _requeue(self, inserts: List[dict], emotions: Dict[int, str]):
+        # Back into the buffer for the next flush, without clobbering newer writes
+        self._pending_inserts = {row["id"]: row for row in inserts} | self._pending_inserts
+        self._pending_emotions = emotions | self._pending_emotions
+
+    async def _write(self, inserts: List[dict], emotions: Dict[int, str]):
+        async with self.session_factory() as db:
+            for start in range(0, len(inserts), self.flush_max_rows):
+                chunk = inserts[start:start + self.flush_max_rows]
+                await db.execute(insert(models.Message).values(chunk))
+
+            if emotions:
+                message_ids = list(emotions)
+                for start in range(0, len(message_ids), self.flush_max_rows):
+                    chunk = {message_id: emotions[message_id] for message_id in message_ids[start:start + self.flush_max_rows]}
+                    await db.execute(
+                        update(models.Message)
+                        .where(models.Message.id.in_(list(chunk)))
+                        .values(emotion=case(chunk, value=models.Message.id))
+                    )
+            await db.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception("🔴 Flush failed, will retry: %s", e)
+
+
+message_writer = MessageWriter()
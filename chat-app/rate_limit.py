@@ -0,0 +1,181 @@
+import logging
+import os
+import time
+from typing import Dict
+
+from backplane import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# --- Rate Limit Settings ---
+# Token bucket per user: bursts of up to MESSAGE_LIMIT messages, refilled at
+# MESSAGE_LIMIT per TIME_WINDOW_SECONDS. Spam is rejected before it costs a
+# toxicity call, a DB row or a broadcast.
+MESSAGE_LIMIT = int(os.environ.get("MESSAGE_LIMIT", "5"))
+TIME_WINDOW_SECONDS = float(os.environ.get("TIME_WINDOW_SECONDS", "10"))
+# "memory": per-worker buckets (the default)
+# "redis":  buckets shared by every worker and replica
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", REDIS_URL)
+RATE_LIMIT_KEY_PREFIX = os.environ.get("RATE_LIMIT_KEY_PREFIX", "chatroom:ratelimit:")
+# How often idle buckets are swept out of memory
+RATE_LIMIT_EVICT_INTERVAL_SECONDS = float(os.environ.get("RATE_LIMIT_EVICT_INTERVAL_SECONDS", "60"))
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimitStore:
+    """Holds the buckets. `take` refills a key's bucket and spends one token if it can."""
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        raise NotImplementedError
+
+    def tracked_keys(self) -> int:
+        return 0
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Two numbers per active user. A bucket that has refilled completely holds
+    no information, so idle users are swept out periodically.
+    """
+
+    def __init__(self, evict_interval: float = RATE_LIMIT_EVICT_INTERVAL_SECONDS):
+        self._buckets: Dict[str, _Bucket] = {}
+        self.evict_interval = evict_interval
+        self._next_eviction = time.monotonic() + evict_interval
+        self.evicted = 0
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        now = time.monotonic()
+        if now >= self._next_eviction:
+            self._evict_idle(now, capacity, refill_per_second)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(float(capacity), now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_per_second)
+            bucket.updated_at = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True
+        return False
+
+    def _evict_idle(self, now: float, capacity: int, refill_per_second: float):
+        # Anyone idle this long is back to a full bucket, same as a new user
+        full_after = capacity / refill_per_second if refill_per_second > 0 else float("inf")
+        idle = [key for key, bucket in self._buckets.items() if now - bucket.updated_at >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        self.evicted += len(idle)
+        self._next_eviction = now + self.evict_interval
+
+    def tracked_keys(self) -> int:
+        return len(self._buckets)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Buckets in Redis hashes, updated atomically by a Lua script using the
+    Redis clock, so the limit holds across workers. Keys expire once the
+    bucket would be full again, which is the eviction.
+    """
+
+    _SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill_per_ms = tonumber(ARGV[2])
+    local now = redis.call('TIME')
+    local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1])
+    local updated_at = tonumber(bucket[2])
+    if tokens == nil then
+        tokens = capacity
+    else
+        tokens = math.min(capacity, tokens + (now_ms - updated_at) * refill_per_ms)
+    end
+
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now_ms)
+    if refill_per_ms > 0 then
+        redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / refill_per_ms) + 1000)
+    end
+    return allowed
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = RATE_LIMIT_KEY_PREFIX, client=None):
+        self.url = url
+        self.prefix = prefix
+        self._client = client
+        self._script = None
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> bool:
+        if self._script is None:
+            if self._client is None:
+                import redis.asyncio as redis  # Optional dependency, only needed for this backend
+                self._client = redis.from_url(self.url)
+            self._script = self._client.register_script(self._SCRIPT)
+        allowed = await self._script(keys=[self.prefix + key], args=[capacity, refill_per_second / 1000.0])
+        return bool(int(allowed))
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        store: RateLimitStore,
+        capacity: int = MESSAGE_LIMIT,
+        window_seconds: float = TIME_WINDOW_SECONDS,
+    ):
+        self.store = store
+        self.capacity = max(1, capacity)
+        self.refill_per_second = self.capacity / window_seconds if window_seconds > 0 else 0.0
+        self.allowed = 0
+        self.rejected = 0
+        self.store_errors = 0
+
+    async def allow(self, key: str) -> bool:
+        try:
+            allowed = await self.store.take(key, self.capacity, self.refill_per_second)
+        except Exception as e:
+            # A broken shared store must not take the chat down with it
+            logger.error("🔴 Store error, allowing message: %s", e)
+            self.store_errors += 1
+            allowed = True
+
+        if allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return allowed
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.store).__name__,
+            "capacity": self.capacity,
+            "refill_per_second": round(self.refill_per_second, 4),
+            "tracked_keys": self.store.tracked_keys(),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "store_errors": self.store_errors,
+        }
+
+
+def create_rate_limiter(kind: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if kind == "memory":
+        return RateLimiter(InMemoryRateLimitStore())
+    if kind == "redis":
+        return RateLimiter(RedisRateLimitStore())
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {kind}")
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- Resilience Defaults ---
+# Each can be overridden per dependency, e.g. TOXICITY_BREAKER_FAILURE_RATE
+# or EMOTION_LIMIT_MAX (see DependencyGuard.from_env).
+
+# The circuit opens when at least BREAKER_FAILURE_RATE of the last
+# BREAKER_WINDOW calls failed (once BREAKER_MIN_CALLS have been seen), or
+# straight away after BREAKER_CONSECUTIVE_FAILURES failures in a row. While
+# open, calls are refused instantly; after BREAKER_OPEN_SECONDS one probe at a
+# time is let through, and BREAKER_HALF_OPEN_PROBES successes close it again.
+BREAKER_WINDOW = 50
+BREAKER_MIN_CALLS = 10
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_CONSECUTIVE_FAILURES = 5
+BREAKER_OPEN_SECONDS = 5.0
+BREAKER_HALF_OPEN_PROBES = 3
+
+# Concurrent calls allowed. Grows by about one per round of successful calls
+# and is cut by LIMIT_BACKOFF on every failure or timeout; calls beyond it are
+# refused instead of queueing behind a struggling service.
+LIMIT_INITIAL = 20
+LIMIT_MIN = 1
+LIMIT_MAX = 200
+LIMIT_BACKOFF = 0.5
+
+# The per-call timeout is TIMEOUT_MULTIPLIER x the TIMEOUT_PERCENTILE of the
+# last LATENCY_WINDOW successful calls, kept between TIMEOUT_MIN_SECONDS and the
+# client's HTTP timeout. Until LATENCY_MIN_SAMPLES calls have been seen, the
+# HTTP timeout is used as is.
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_MULTIPLIER = 2.0
+TIMEOUT_MIN_SECONDS = 0.25
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency whose circuit is open or whose concurrency limit is reached."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"'{name}' is unavailable ({reason})")
+        self.name = name
+        self.reason = reason
+
+
+class LatencyWindow:
+    """The last `size` latencies, in seconds."""
+
+    def __init__(self, size: int):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        consecutive_failures: int = BREAKER_CONSECUTIVE_FAILURES,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate
+        self.consecutive_failures = max(1, consecutive_failures)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = self.CLOSED
+        self.trips = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._failures = 0
+        self._failure_streak = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_successes = 0
+
+    @property
+    def failure_rate(self) -> float:
+        return self._failures / len(self._outcomes) if self._outcomes else 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_successes = 0
+        # Half open: one probe at a time
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if not ok:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._close()
+            return
+        if self.state == self.OPEN:
+            # A call that started before the circuit opened; too late to matter
+            return
+
+        if len(self._outcomes) == self._outcomes.maxlen and not self._outcomes[0]:
+            self._failures -= 1
+        self._outcomes.append(ok)
+        if ok:
+            self._failure_streak = 0
+            return
+        self._failures += 1
+        self._failure_streak += 1
+        if self._failure_streak >= self.consecutive_failures or (
+            len(self._outcomes) >= self.min_calls and self.failure_rate >= self.failure_rate_threshold
+        ):
+            self._open()
+
+    def abandon(self):
+        """The caller gave up on the call; it says nothing about the dependency."""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self._failure_streak = 0
+        self.trips += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+
+
+class AdaptiveLimiter:
+    """Additive increase, multiplicative decrease on the number of concurrent calls."""
+
+    def __init__(
+        self,
+        initial: int = LIMIT_INITIAL,
+        minimum: int = LIMIT_MIN,
+        maximum: int = LIMIT_MAX,
+        backoff: float = LIMIT_BACKOFF,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.backoff = backoff
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, ok: Optional[bool]):
+        """`ok` is None when the outcome says nothing about the dependency."""
+        self.in_flight -= 1
+        if ok:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        elif ok is False:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+
+
+class DependencyGuard:
+    """
+    Wraps every call to one downstream service with a concurrency limit, a
+    circuit breaker and a timeout derived from the service's recent latency,
+    so a slow or failing service costs callers milliseconds, not the full
+    HTTP timeout. Refused calls raise DependencyUnavailable; the caller picks
+    the degraded behaviour.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_timeout: float,
+        breaker: Optional[CircuitBreaker] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        latency_window: int = LATENCY_WINDOW,
+        latency_min_samples: int = LATENCY_MIN_SAMPLES,
+        timeout_percentile: float = TIMEOUT_PERCENTILE,
+        timeout_multiplier: float = TIMEOUT_MULTIPLIER,
+        min_timeout: float = TIMEOUT_MIN_SECONDS,
+    ):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.latency = LatencyWindow(latency_window)
+        self.latency_min_samples = latency_min_samples
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.max_timeout = max_timeout
+        self.timeout = max_timeout
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected_open = 0
+        self.rejected_overloaded = 0
+        self._samples_since_update = 0
+
+    @classmethod
+    def from_env(cls, name: str, max_timeout: float, **defaults) -> "DependencyGuard":
+        """
+        Builds a guard from environment variables, e.g. for name="TOXICITY":
+        TOXICITY_BREAKER_FAILURE_RATE, TOXICITY_BREAKER_OPEN_SECONDS,
+        TOXICITY_LIMIT_MAX, TOXICITY_TIMEOUT_MULTIPLIER.
+        """
+        def setting(key: str, cast, default):
+            value = os.environ.get(f"{name}_{key}")
+            return cast(value) if value is not None else defaults.get(key.lower(), default)
+
+        return cls(
+            name=name.lower(),
+            max_timeout=max_timeout,
+            breaker=CircuitBreaker(
+                window=setting("BREAKER_WINDOW", int, BREAKER_WINDOW),
+                min_calls=setting("BREAKER_MIN_CALLS", int, BREAKER_MIN_CALLS),
+                failure_rate=setting("BREAKER_FAILURE_RATE", float, BREAKER_FAILURE_RATE),
+                consecutive_failures=setting("BREAKER_CONSECUTIVE_FAILURES", int, BREAKER_CONSECUTIVE_FAILURES),
+                open_seconds=setting("BREAKER_OPEN_SECONDS", float, BREAKER_OPEN_SECONDS),
+                half_open_probes=setting("BREAKER_HALF_OPEN_PROBES", int, BREAKER_HALF_OPEN_PROBES),
+            ),
+            limiter=AdaptiveLimiter(
+                initial=setting("LIMIT_INITIAL", int, LIMIT_INITIAL),
+                minimum=setting("LIMIT_MIN", int, LIMIT_MIN),
+                maximum=setting("LIMIT_MAX", int, LIMIT_MAX),
+                backoff=setting("LIMIT_BACKOFF", float, LIMIT_BACKOFF),
+            ),
+            latency_window=setting("LATENCY_WINDOW", int, LATENCY_WINDOW),
+            latency_min_samples=setting("LATENCY_MIN_SAMPLES", int, LATENCY_MIN_SAMPLES),
+            timeout_percentile=setting("TIMEOUT_PERCENTILE", float, TIMEOUT_PERCENTILE),
+            timeout_multiplier=setting("TIMEOUT_MULTIPLIER", float, TIMEOUT_MULTIPLIER),
+            min_timeout=setting("TIMEOUT_MIN_SECONDS", float, TIMEOUT_MIN_SECONDS),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.breaker.state != CircuitBreaker.CLOSED
+
+    async def call(
+        self, fn: Callable[[], Awaitable[T]], is_failure: Optional[Callable[[T], bool]] = None
+    ) -> T:
+        """
+        Runs `fn()` within the current timeout. Exceptions, timeouts and
+        results for which `is_failure` is true count against the dependency.
+        """
+        if not self.limiter.try_acquire():
+            self.rejected_overloaded += 1
+            raise DependencyUnavailable(self.name, "concurrency limit reached")
+        if not self.breaker.allow():
+            self.limiter.release(None)
+            self.rejected_open += 1
+            raise DependencyUnavailable(self.name, "circuit open")
+
+        timeout = self.timeout
+        started = time.perf_counter()
+        ok: Optional[bool] = None
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+            ok = not (is_failure and is_failure(result))
+            return result
+        except asyncio.TimeoutError:
+            ok = False
+            self.timeouts += 1
+            # Counted at the budget it was given, so the budget can grow if the
+            # service has become slower for good rather than staying tripped
+            self._record_latency(timeout)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            ok = False
+            self.errors += 1
+            raise
+        finally:
+            if ok is None:
+                # Cancelled by our own caller
+                self.breaker.abandon()
+            else:
+                if ok:
+                    self._record_latency(time.perf_counter() - started)
+                was_closed = self.breaker.state == CircuitBreaker.CLOSED
+                self.breaker.record(ok)
+                if was_closed and self.breaker.state == CircuitBreaker.OPEN:
+                    logger.warning(
+                        "⚠️ Circuit for '%s' opened (failure rate %.0f%%); refusing calls for %.1fs.",
+                        self.name, self.breaker.failure_rate * 100, self.breaker.open_seconds,
+                    )
+                elif not was_closed and self.breaker.state == CircuitBreaker.CLOSED:
+                    logger.info("✅ Circuit for '%s' closed again.", self.name)
+            self.limiter.release(ok)
+
+    def _record_latency(self, seconds: float):
+        self.latency.add(seconds)
+        self._samples_since_update += 1
+        # Re-sorting the window on every call isn't worth it
+        if len(self.latency) >= self.latency_min_samples and self._samples_since_update >= 10:
+            self._samples_since_update = 0
+            derived = self.latency.percentile(self.timeout_percentile) * self.timeout_multiplier
+            self.timeout = min(self.max_timeout, max(self.min_timeout, derived))
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        p99 = self.latency.percentile(0.99)
+        return {
+            "state": self.breaker.state,
+            "failure_rate": round(self.breaker.failure_rate, 3),
+            "trips": self.breaker.trips,
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "timeout_seconds": round(self.timeout, 4),
+            "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rejected_open": self.rejected_open,
+            "rejected_overloaded": self.rejected_overloaded,
+        }
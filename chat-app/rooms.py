@@ -0,0 +1,57 @@
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import AsyncSessionLocal
+
+# The room clients join when they don't ask for one
+DEFAULT_ROOM = os.environ.get("DEFAULT_ROOM", "general")
+
+
+class RoomDirectory:
+    """
+    Resolves room names to ids. Rooms are never renamed or deleted, so a
+    lookup is cached forever and only unknown names go to the database.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+
+    async def resolve(self, name: str) -> Optional[int]:
+        room_id = self._ids.get(name)
+        if room_id is None:
+            async with AsyncSessionLocal() as db:
+                room_id = (await db.execute(
+                    select(models.Room.id).where(models.Room.name == name)
+                )).scalar_one_or_none()
+            if room_id is not None:
+                self._ids[name] = room_id
+        return room_id
+
+    async def create(self, name: str) -> Optional[models.Room]:
+        """Creates a room. Returns None if the name is already taken."""
+        async with AsyncSessionLocal() as db:
+            room = models.Room(name=name)
+            db.add(room)
+            try:
+                await db.commit()
+            except IntegrityError:
+                return None
+            await db.refresh(room)
+        self._ids[room.name] = room.id
+        return room
+
+    async def ensure(self, name: str) -> int:
+        """Returns the id of `name`, creating the room if it doesn't exist yet."""
+        room_id = await self.resolve(name)
+        if room_id is None:
+            room = await self.create(name)
+            # Another worker may have created it first
+            room_id = room.id if room else await self.resolve(name)
+        return room_id
+
+
+room_directory = RoomDirectory()
@@ -0,0 +1,170 @@
+"""
+Brings an existing database up to the schema in models.py.
+
+`Base.metadata.create_all` only creates missing tables; it never changes an
+existing one. The steps below cover every change made to `messages` since
+the original schema. Each one checks first, so running them again is a no-op.
+
+    python schema.py check     # lists what's out of date, exits 1 if anything is
+    python schema.py migrate   # applies it
+
+The app calls check_schema() on startup and refuses to start on an
+out-of-date database, instead of failing every message write later on.
+"""
+import logging
+import sys
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import BigInteger, inspect, text
+
+import models
+from database import Base, engine
+from rooms import DEFAULT_ROOM
+
+logger = logging.getLogger(__name__)
+
+# Replaced by ix_messages_room_timestamp_id when rooms were added
+OBSOLETE_INDEXES = ("ix_messages_timestamp_id",)
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+class Step(NamedTuple):
+    description: str
+    needed: Callable  # (inspector) -> bool
+    apply: Callable  # (connection) -> None
+
+
+def _column(inspector, name: str):
+    return next((column for column in inspector.get_columns("messages") if column["name"] == name), None)
+
+
+def _index_names(inspector) -> set:
+    return {index["name"] for index in inspector.get_indexes("messages")}
+
+
+# --- messages.id: BIGINT allocated by the app (persistence.SnowflakeIdGenerator) ---
+def _id_needed(inspector) -> bool:
+    # SQLite integers are 64-bit whatever the declared type, and an explicit id
+    # always wins over its rowid, so only MySQL needs the change
+    if inspector.bind.dialect.name != "mysql":
+        return False
+    column = _column(inspector, "id")
+    return not isinstance(column["type"], BigInteger) or bool(column.get("autoincrement"))
+
+
+def _id_apply(connection):
+    connection.execute(text("ALTER TABLE messages MODIFY id BIGINT NOT NULL"))
+
+
+# --- messages.room_id: NOT NULL, references rooms; old messages go to DEFAULT_ROOM ---
+def _default_room_id(connection) -> int:
+    room_id = connection.execute(
+        text("SELECT id FROM rooms WHERE name = :name"), {"name": DEFAULT_ROOM}
+    ).scalar()
+    if room_id is None:
+        connection.execute(text("INSERT INTO rooms (name) VALUES (:name)"), {"name": DEFAULT_ROOM})
+        room_id = connection.execute(
+            text("SELECT id FROM rooms WHERE name = :name"), {"name": DEFAULT_ROOM}
+        ).scalar()
+    return room_id
+
+
+def _room_id_needed(inspector) -> bool:
+    column = _column(inspector, "room_id")
+    return column is None or column["nullable"]
+
+
+def _room_id_apply(connection):
+    room_id = int(_default_room_id(connection))
+    mysql = connection.dialect.name == "mysql"
+    if _column(inspect(connection), "room_id") is None:
+        # SQLite can only add a NOT NULL column with a default
+        connection.execute(text(
+            f"ALTER TABLE messages ADD COLUMN room_id INTEGER NOT NULL DEFAULT {room_id} REFERENCES rooms (id)"
+        ))
+        if mysql:
+            # MySQL ignores an inline REFERENCES, and new rows must name their room
+            connection.execute(text(
+                "ALTER TABLE messages ADD CONSTRAINT fk_messages_room_id FOREIGN KEY (room_id) REFERENCES rooms (id)"
+            ))
+            connection.execute(text("ALTER TABLE messages ALTER room_id DROP DEFAULT"))
+        return
+    connection.execute(text("UPDATE messages SET room_id = :room_id WHERE room_id IS NULL"), {"room_id": room_id})
+    if not mysql:
+        raise SchemaOutOfDate("messages.room_id is nullable; SQLite can't change that in place, recreate the table")
+    connection.execute(text("ALTER TABLE messages MODIFY room_id INT NOT NULL"))
+
+
+# --- Indexes ---
+def _index_needed(inspector) -> bool:
+    names = _index_names(inspector)
+    return "ix_messages_room_timestamp_id" not in names or any(name in names for name in OBSOLETE_INDEXES)
+
+
+def _index_apply(connection):
+    names = _index_names(inspect(connection))
+    if "ix_messages_room_timestamp_id" not in names:
+        next(
+            index for index in models.Message.__table__.indexes if index.name == "ix_messages_room_timestamp_id"
+        ).create(connection)
+    for name in OBSOLETE_INDEXES:
+        if name in names:
+            on_table = " ON messages" if connection.dialect.name == "mysql" else ""
+            connection.execute(text(f"DROP INDEX {name}{on_table}"))
+
+
+STEPS = [
+    Step("messages.id must be a BIGINT without AUTO_INCREMENT", _id_needed, _id_apply),
+    Step("messages.room_id must exist, be NOT NULL and reference rooms", _room_id_needed, _room_id_apply),
+    Step("messages needs index ix_messages_room_timestamp_id (and not the ones it replaced)",
+         _index_needed, _index_apply),
+]
+
+
+def pending_steps(bind=engine) -> List[Step]:
+    inspector = inspect(bind)
+    if not inspector.has_table("messages"):
+        return []  # create_all will build it from the models
+    return [step for step in STEPS if step.needed(inspector)]
+
+
+def check_schema(bind=engine):
+    """Raises SchemaOutOfDate listing every pending step."""
+    steps = pending_steps(bind)
+    if steps:
+        raise SchemaOutOfDate(
+            "The database schema is out of date; run `python schema.py migrate`:\n"
+            + "\n".join(f"  - {step.description}" for step in steps)
+        )
+
+
+def migrate(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    for step in pending_steps(bind):
+        logger.info("Migrating: %s", step.description)
+        with bind.begin() as connection:
+            step.apply(connection)
+    check_schema(bind)
+    logger.info("✅ Database schema is up to date.")
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "migrate":
+        migrate()
+    elif command == "check":
+        steps = pending_steps()
+        for step in steps:
+            print(f"- {step.description}")
+        print("✅ Database schema is up to date." if not steps else "❌ Run `python schema.py migrate`.")
+        sys.exit(1 if steps else 0)
+    else:
+        sys.exit(f"Unknown command: {command} (expected 'check' or 'migrate')")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 class UserCreate(BaseModel):
     username: str
@@ -22,6 +22,7 @@ class MessageCreate(BaseModel):
 class MessageOut(BaseModel):
     id: int
     user_id: int
+    room_id: Optional[int] = None
     content: str
     timestamp: datetime
     
@@ -33,9 +34,24 @@ class MessageOut(BaseModel):
     class Config:
         from_attributes = True
 
+class RoomCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=50, pattern=r"^[A-Za-z0-9_-]+$")
+
+class RoomOut(BaseModel):
+    id: int
+    name: str
+    class Config:
+        from_attributes = True
+
 # NEW: Schema for the overall mood response
 class MoodOut(BaseModel):
     mood: str
 
 class SummaryOut(BaseModel):
-    summary: str
\ No newline at end of file
+    summary: str
+
+class LoggingSettings(BaseModel):
+    # Logger name ("root", "main", "broadcast", ...) -> level name
+    levels: Dict[str, str] = {}
+    # Fraction of sampled per-message debug events to keep
+    sample_rate: Optional[float] = Field(None, ge=0.0, le=1.0)
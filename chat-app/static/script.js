@@ -19,7 +19,14 @@ const summaryBtn = document.getElementById('summary-btn');
 let ws;
 let isLogin = true;
 let currentUser = null;
-let moodInterval;
+// The room comes from the page URL, e.g. /?room=gaming
+const currentRoom = new URLSearchParams(window.location.search).get('room') || 'general';
+
+// History is loaded newest page first, older pages on scroll
+const HISTORY_PAGE_SIZE = 50;
+let oldestMessageId = null;
+let hasMoreHistory = true;
+let isLoadingHistory = false;
 const emotionEmojis = {
     'admiration': '😍', 'amusement': '😄', 'anger': '😠', 'annoyance': '😒', 
     'approval': '👍', 'caring': '🤗', 'confusion': '😕', 'curiosity': '🤔', 
@@ -78,7 +85,6 @@ logoutBtn.addEventListener('click', () => {
     sessionStorage.removeItem('token');
     currentUser = null;
     if (ws) ws.close();
-    if (moodInterval) clearInterval(moodInterval);
     authContainer.style.display = 'flex';
     chatContainer.classList.add('hidden');
 });
@@ -101,12 +107,11 @@ async function enterChat() {
     chatContainer.classList.remove('hidden');
 
     await fetchMessageHistory(token);
+    // Fetch the mood once; after that the server pushes 'mood_update' events
     await updateMood(token);
     
-    moodInterval = setInterval(() => updateMood(token), 5000);
-    
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    ws = new WebSocket(`${wsProtocol}//${window.location.host}/ws?token=${token}`);
+    ws = new WebSocket(`${wsProtocol}//${window.location.host}/ws?token=${token}&room=${encodeURIComponent(currentRoom)}`);
     
     ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
@@ -118,6 +123,8 @@ async function enterChat() {
         } else if (data.type === 'emotion_update') {
             // NEW: Handle the emotion update
             updateMessageEmotion(data.message_id, data.emotion);
+        } else if (data.type === 'mood_update') {
+            showMood(data.mood);
         }
     };
 
@@ -148,26 +155,66 @@ function updateMessageEmotion(messageId, emotion) {
 
 async function updateMood(token) {
     try {
-        const response = await fetch('/mood', { headers: { 'Authorization': `Bearer ${token}` } });
+        const response = await fetch(`/mood?room=${encodeURIComponent(currentRoom)}`, { headers: { 'Authorization': `Bearer ${token}` } });
         if (!response.ok) return;
         const data = await response.json();
-        moodEmoji.textContent = emotionEmojis[data.mood] || emotionEmojis['neutral'];
-        moodText.textContent = data.mood;
+        showMood(data.mood);
     } catch (error) {
         console.error("Mood fetch error:", error);
     }
 }
 
+function showMood(mood) {
+    moodEmoji.textContent = emotionEmojis[mood] || emotionEmojis['neutral'];
+    moodText.textContent = mood;
+}
+
+async function fetchHistoryPage(token, beforeId) {
+    const params = new URLSearchParams({ room: currentRoom, limit: HISTORY_PAGE_SIZE });
+    if (beforeId !== null) params.set('before_id', beforeId);
+    const response = await fetch(`/messages?${params}`, { headers: { 'Authorization': `Bearer ${token}` } });
+    if (!response.ok) throw new Error('Failed to fetch history');
+    const page = await response.json();
+    hasMoreHistory = page.length === HISTORY_PAGE_SIZE;
+    if (page.length) oldestMessageId = page[0].id;
+    return page;
+}
+
 async function fetchMessageHistory(token) {
+    oldestMessageId = null;
+    hasMoreHistory = true;
     try {
-        const response = await fetch('/messages', { headers: { 'Authorization': `Bearer ${token}` } });
-        if (!response.ok) throw new Error('Failed to fetch history');
-        const history = await response.json();
+        const history = await fetchHistoryPage(token, null);
         messagesDiv.innerHTML = '';
         history.forEach(msg => appendMessage(msg, false));
     } catch (error) { console.error("History fetch error:", error); }
 }
 
+async function loadOlderMessages() {
+    const token = sessionStorage.getItem('token');
+    if (!token || isLoadingHistory || !hasMoreHistory || oldestMessageId === null) return;
+
+    isLoadingHistory = true;
+    try {
+        const previousHeight = messagesDiv.scrollHeight;
+        const page = await fetchHistoryPage(token, oldestMessageId);
+        // Prepend newest-to-oldest so the page ends up in chronological order
+        for (let i = page.length - 1; i >= 0; i--) {
+            appendMessage(page[i], false, true);
+        }
+        // Keep the view anchored on the message the user was looking at
+        messagesDiv.scrollTop += messagesDiv.scrollHeight - previousHeight;
+    } catch (error) {
+        console.error("History fetch error:", error);
+    } finally {
+        isLoadingHistory = false;
+    }
+}
+
+messagesDiv.addEventListener('scroll', () => {
+    if (messagesDiv.scrollTop < 100) loadOlderMessages();
+});
+
 messageForm.addEventListener('submit', (e) => {
     e.preventDefault();
     const message = messageInput.value;
@@ -185,14 +232,15 @@ function appendSystemAlert(content) {
     messagesDiv.scrollTop = messagesDiv.scrollHeight;
 }
 
-function appendMessage(msg, animate = true) {
+function appendMessage(msg, animate = true, prepend = false) {
     const isSent = currentUser && msg.username === currentUser.username;
+    let element;
     
     if (msg.username === 'System') {
         const item = document.createElement('div');
         item.className = 'text-center text-sm text-slate-400 italic py-2';
         item.textContent = msg.content;
-        messagesDiv.appendChild(item);
+        element = item;
     } else {
         const emoji = emotionEmojis[msg.emotion] || emotionEmojis['unknown'];
         const avatarInitial = msg.username ? msg.username.charAt(0).toUpperCase() : '?';
@@ -235,43 +283,26 @@ function appendMessage(msg, animate = true) {
             messageWrapper.insertAdjacentElement('afterbegin', messageBubble);
         }
         
-        messagesDiv.appendChild(messageWrapper);
+        element = messageWrapper;
     }
 
+    // Older history is inserted above what is already shown
+    if (prepend) {
+        messagesDiv.insertBefore(element, messagesDiv.firstChild);
+        return;
+    }
+    messagesDiv.appendChild(element);
     messagesDiv.scrollTop = messagesDiv.scrollHeight;
 }
 
-async function fetchAndShowSummary() {
+function fetchAndShowSummary() {
     const token = sessionStorage.getItem('token');
     if (!token) return;
 
-    summaryBtn.textContent = 'Generating...';
-    summaryBtn.disabled = true;
-
-    try {
-        const response = await fetch('/summary', { 
-            headers: { 'Authorization': `Bearer ${token}` } 
-        });
-
-        if (!response.ok) {
-            throw new Error('Failed to fetch summary.');
-        }
-
-        const data = await response.json();
-        
-        // Store the summary in session storage for the next page to access.
-        sessionStorage.setItem('chatSummary', data.summary);
-        
-        // Redirect the browser to the new summary page.
-        window.location.href = '/summary-page';
-
-    } catch (error) {
-        console.error("Summary fetch error:", error);
-        alert("Could not generate a summary at this time.");
-        // Restore the button's state only if an error occurs.
-        summaryBtn.textContent = 'Get Summary';
-        summaryBtn.disabled = false;
-    } 
+    // The summary page streams the summary itself (/summary/stream), so go
+    // there right away instead of waiting for the whole text here.
+    sessionStorage.setItem('summaryRoom', currentRoom);
+    window.location.href = '/summary-page';
 }
 
 // --- Event Listeners and Initial Load ---
@@ -1,18 +1,67 @@
 document.addEventListener('DOMContentLoaded', () => {
     const summaryTextElement = document.getElementById('summary-text');
-    
-    // Retrieve the summary from session storage, where it was placed by the main chat page.
-    const summary = sessionStorage.getItem('chatSummary');
-
-    if (summaryTextElement) {
-        if (summary) {
-            // Display the summary text.
-            summaryTextElement.textContent = summary;
-            // Clean up the storage so the summary isn't accidentally shown again.
-            sessionStorage.removeItem('chatSummary');
-        } else {
-            // This is a fallback in case the user navigates to this page directly.
-            summaryTextElement.textContent = "No summary available. Please go back to the chat and generate one.";
-        }
+    if (!summaryTextElement) return;
+
+    const token = sessionStorage.getItem('token');
+    const room = sessionStorage.getItem('summaryRoom') || 'general';
+
+    if (!token) {
+        // This is a fallback in case the user navigates to this page directly.
+        summaryTextElement.textContent = "No summary available. Please go back to the chat and generate one.";
+        return;
     }
+
+    streamSummary(token, room, summaryTextElement);
 });
+
+// Reads the Server-Sent Events from /summary/stream and appends each token as it arrives.
+// (EventSource can't send an Authorization header, so the stream is read via fetch.)
+async function streamSummary(token, room, summaryTextElement) {
+    let received = false;
+    try {
+        const response = await fetch(`/summary/stream?room=${encodeURIComponent(room)}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok || !response.body) {
+            throw new Error('Failed to fetch summary.');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventType = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event:')) eventType = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                const payload = data ? JSON.parse(data) : {};
+
+                if (eventType === 'done') return;
+                if (eventType === 'error') throw new Error(payload.detail);
+                if (payload.token) {
+                    if (!received) summaryTextElement.textContent = '';
+                    received = true;
+                    summaryTextElement.textContent += payload.token;
+                }
+            }
+        }
+    } catch (error) {
+        console.error("Summary stream error:", error);
+        if (!received) {
+            summaryTextElement.textContent = "Could not generate a summary at this time.";
+        }
+    }
+}
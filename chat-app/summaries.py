@@ -0,0 +1,243 @@
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+import models
+from database import AsyncSessionLocal
+from summarizer import run_chain_async
+
+# --- Summary Settings ---
+# A full summary covers the room's last SUMMARY_WINDOW messages.
+SUMMARY_WINDOW = int(os.environ.get("SUMMARY_WINDOW", "50"))
+# Transcripts longer than this are summarized in chunks and then combined (map-reduce)
+SUMMARY_CHUNK_MAX_CHARS = int(os.environ.get("SUMMARY_CHUNK_MAX_CHARS", "6000"))
+# More new messages than this since the cached summary means a full rebuild
+SUMMARY_MAX_NEW_MESSAGES = int(os.environ.get("SUMMARY_MAX_NEW_MESSAGES", "500"))
+# Rebuild from scratch after this many incremental updates, so drift can't pile up
+SUMMARY_MAX_INCREMENTAL_UPDATES = int(os.environ.get("SUMMARY_MAX_INCREMENTAL_UPDATES", "20"))
+SUMMARY_CACHE_MAX_ROOMS = int(os.environ.get("SUMMARY_CACHE_MAX_ROOMS", "1000"))
+
+NO_MESSAGES_SUMMARY = "There are no recent messages to summarize."
+
+
+class SummaryEntry:
+    """The latest summary of a room and the newest message it covers."""
+
+    __slots__ = ("newest_id", "newest_timestamp", "text", "updates")
+
+    def __init__(self, newest_id: int, newest_timestamp: datetime, text: str, updates: int = 0):
+        self.newest_id = newest_id
+        self.newest_timestamp = newest_timestamp
+        self.text = text
+        self.updates = updates
+
+
+class _InFlight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+def _chunk_transcript(lines: List[str], max_chars: int) -> List[str]:
+    """Groups transcript lines into chunks of at most max_chars (a single long line is its own chunk)."""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class RoomSummaries:
+    """
+    Caches each room's summary keyed by the newest message it covers.
+
+    - Nothing new since the last summary: the cached text, no LLM call.
+    - A few new messages: the previous summary plus only those messages.
+    - Long transcripts: chunks summarized in parallel, then combined.
+
+    Concurrent requests for the same (room, newest message) share one
+    in-flight LLM call.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        window: int = SUMMARY_WINDOW,
+        chunk_max_chars: int = SUMMARY_CHUNK_MAX_CHARS,
+        max_new_messages: int = SUMMARY_MAX_NEW_MESSAGES,
+        max_incremental_updates: int = SUMMARY_MAX_INCREMENTAL_UPDATES,
+        max_rooms: int = SUMMARY_CACHE_MAX_ROOMS,
+    ):
+        self.session_factory = session_factory
+        self.window = window
+        self.chunk_max_chars = chunk_max_chars
+        self.max_new_messages = max_new_messages
+        self.max_incremental_updates = max_incremental_updates
+        self.max_rooms = max_rooms
+        self._entries: "OrderedDict[int, SummaryEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, int], _InFlight] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.incremental_builds = 0
+        self.full_builds = 0
+
+    async def summarize(self, room_id: int, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Returns the room's current summary. If this call ends up generating it,
+        `on_token` receives the text as the LLM streams it; a cached or shared
+        result is only returned.
+        """
+        newest = await self._newest_message(room_id)
+        if newest is None:
+            return NO_MESSAGES_SUMMARY
+
+        entry = self._entries.get(room_id)
+        if entry and entry.newest_id == newest.id:
+            self._entries.move_to_end(room_id)
+            self.hits += 1
+            return entry.text
+
+        key = (room_id, newest.id)
+        inflight = self._inflight.get(key)
+        if inflight is None or inflight.task.cancelled():
+            inflight = _InFlight(asyncio.create_task(self._build(room_id, entry, newest, on_token)))
+            self._inflight[key] = inflight
+            inflight.task.add_done_callback(lambda task: self._forget(key, task))
+        else:
+            self.coalesced += 1
+
+        inflight.waiters += 1
+        try:
+            # Shielded so one impatient caller can't cancel the others' result
+            return await asyncio.shield(inflight.task)
+        finally:
+            inflight.waiters -= 1
+            if not inflight.waiters and not inflight.task.done():
+                # Nobody is waiting any more, so stop paying for tokens
+                inflight.task.cancel()
+
+    def _forget(self, key: Tuple[int, int], task: asyncio.Task):
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight.task is task:
+            del self._inflight[key]
+
+    async def _build(self, room_id: int, entry: Optional[SummaryEntry], newest, on_token) -> str:
+        messages = None
+        if entry is not None and entry.updates < self.max_incremental_updates:
+            messages = await self._messages_after(room_id, entry)
+            if messages is None:
+                pass  # Too many new messages to fold in: rebuilt in full below
+            elif not messages:
+                # The newest message isn't after the checkpoint (it was older,
+                # or the checkpoint's message is gone), so nothing is new. Move
+                # the checkpoint to it so later calls are plain cache hits.
+                self._store(room_id, SummaryEntry(newest.id, newest.timestamp, entry.text, entry.updates))
+                self.hits += 1
+                return entry.text
+
+        if messages is not None:
+            self.incremental_builds += 1
+            text = await self._summarize_messages(entry.text, messages, on_token)
+            updates = entry.updates + 1
+        else:
+            self.full_builds += 1
+            messages = await self._recent_messages(room_id)
+            if not messages:
+                return NO_MESSAGES_SUMMARY
+            text = await self._summarize_messages(None, messages, on_token)
+            updates = 0
+
+        # Key on the newest message actually summarized, which may be newer than the one we saw
+        newest = messages[-1]
+        self._store(room_id, SummaryEntry(newest.id, newest.timestamp, text, updates))
+        return text
+
+    async def _summarize_messages(self, previous: Optional[str], messages, on_token) -> str:
+        lines = [f"{message.username}: {message.content}" for message in messages]
+        chunks = _chunk_transcript(lines, self.chunk_max_chars)
+
+        if len(chunks) == 1:
+            if previous is None:
+                return await run_chain_async("summary", {"chat_transcript": chunks[0]}, on_token)
+            return await run_chain_async(
+                "update", {"previous_summary": previous, "chat_transcript": chunks[0]}, on_token
+            )
+
+        # Map: summarize each chunk concurrently. Reduce: combine them in order.
+        partials = await asyncio.gather(*(
+            run_chain_async("summary", {"chat_transcript": chunk}) for chunk in chunks
+        ))
+        return await run_chain_async(
+            "combine",
+            {"previous_summary": previous or "(none)", "partial_summaries": "\n\n".join(partials)},
+            on_token,
+        )
+
+    def _store(self, room_id: int, entry: SummaryEntry):
+        self._entries[room_id] = entry
+        self._entries.move_to_end(room_id)
+        while len(self._entries) > self.max_rooms:
+            self._entries.popitem(last=False)
+
+    # --- Queries ---
+    def _transcript_query(self, room_id: int):
+        return (
+            select(models.Message.id, models.Message.timestamp, models.Message.content, models.User.username)
+            .join(models.User, models.Message.user_id == models.User.id)
+            .where(models.Message.room_id == room_id)
+        )
+
+    async def _newest_message(self, room_id: int):
+        async with self.session_factory() as db:
+            return (await db.execute(
+                select(models.Message.id, models.Message.timestamp)
+                .where(models.Message.room_id == room_id)
+                .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+                .limit(1)
+            )).first()
+
+    async def _recent_messages(self, room_id: int):
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                self._transcript_query(room_id)
+                .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+                .limit(self.window)
+            )).all()
+        return list(reversed(rows))
+
+    async def _messages_after(self, room_id: int, entry: SummaryEntry):
+        """Messages newer than `entry`, oldest first; None if there are too many to fold in."""
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                self._transcript_query(room_id)
+                .where(or_(
+                    models.Message.timestamp > entry.newest_timestamp,
+                    and_(models.Message.timestamp == entry.newest_timestamp, models.Message.id > entry.newest_id),
+                ))
+                .order_by(models.Message.timestamp, models.Message.id)
+                .limit(self.max_new_messages + 1)
+            )).all()
+        if len(rows) > self.max_new_messages:
+            return None
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "incremental_builds": self.incremental_builds,
+            "full_builds": self.full_builds,
+        }
@@ -1,25 +1,85 @@
 
 
+import asyncio
+import logging
 import os
-from langchain_groq import ChatGroq
+from typing import Callable, Dict, Optional
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
 # from dotenv import load_dotenv
-from starlette.concurrency import run_in_threadpool
 
 # Load environment variables from .env file
 # load_dotenv()
-llm = ChatGroq(
-        temperature=0, 
-        model_name="llama-3.3-70b-versatile"
-    )
 
-# --- Summarization Chain ---
-def get_summary_chain() -> LLMChain:
+logger = logging.getLogger(__name__)
+
+# --- LLM Settings ---
+# Which provider builds the chat model: "groq" (default) or "fake" (canned
+# responses, no network or credentials; for tests and benchmarks).
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "groq")
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", "0"))
+# At most this many LLM calls run at once on this worker; the rest wait their turn
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+# A call (including a whole streamed response) taking longer than this is abandoned
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+FAKE_LLM_RESPONSE = os.environ.get("FAKE_LLM_RESPONSE", "The group chatted about a few topics; no decisions were made.")
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", "0"))
+
+
+# --- LLM Providers ---
+class FakeChatModel(FakeListChatModel):
     """
-    Initializes and returns a LangChain LLMChain for summarization using Groq and Llama.
+    Returns canned responses after a non-blocking delay. Streaming spreads
+    the same delay over the characters, like a real model emitting tokens.
     """
-    # llm = ChatGroq(temperature=0, model_name="llama3-8b-8192")
+
+    latency: float = 0.0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        response = self.responses[self.i]
+        self.i = (self.i + 1) % len(self.responses)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+def _groq_llm():
+    from langchain_groq import ChatGroq  # Only imported (and GROQ_API_KEY only needed) when used
+    return ChatGroq(temperature=LLM_TEMPERATURE, model_name=LLM_MODEL)
+
+def _fake_llm():
+    return FakeChatModel(
+        responses=[FAKE_LLM_RESPONSE],
+        latency=FAKE_LLM_LATENCY_SECONDS,
+        sleep=FAKE_LLM_LATENCY_SECONDS / max(1, len(FAKE_LLM_RESPONSE)) or None,
+    )
+
+LLM_PROVIDERS: Dict[str, Callable] = {
+    "groq": _groq_llm,
+    "fake": _fake_llm,
+}
+
+def register_llm_provider(name: str, factory: Callable):
+    """Adds a provider: `factory()` must return a LangChain chat model."""
+    LLM_PROVIDERS[name] = factory
+
+_llm = None
+
+def get_llm():
+    """Builds the chat model on first use, so importing this module needs no credentials."""
+    global _llm
+    if _llm is None:
+        factory = LLM_PROVIDERS.get(LLM_PROVIDER)
+        if factory is None:
+            raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+        _llm = factory()
+        logger.info("✅ LLM client created (provider: %s).", LLM_PROVIDER)
+    return _llm
+
+# --- Summarization Chain ---
+def get_summary_prompt() -> PromptTemplate:
     prompt_template = """
     You are an expert in summarizing conversations. Your task is to provide a concise, neutral summary of the following chat transcript.
     Focus on the main topics and decisions, ignoring small talk.
@@ -29,19 +89,53 @@ def get_summary_chain() -> LLMChain:
 
     SUMMARY:
     """
-    prompt = PromptTemplate(
+    return PromptTemplate(
         template=prompt_template,
         input_variables=["chat_transcript"]
     )
-    return LLMChain(prompt=prompt, llm=llm)
 
-# --- NEW: Mood Analysis Chain ---
-def get_mood_chain() -> LLMChain:
+# --- Incremental / Map-Reduce Summarization Prompts ---
+def get_update_prompt() -> PromptTemplate:
+    """Folds new messages into an existing summary, so old ones needn't be resent."""
+    prompt_template = """
+    You are an expert in summarizing conversations. Below is a summary of a chat so far, followed by the new messages posted since.
+    Rewrite the summary so it also covers the new messages. Keep it concise and neutral, focus on the main topics and decisions, and ignore small talk.
+
+    SUMMARY SO FAR:
+    {previous_summary}
+
+    NEW MESSAGES:
+    {chat_transcript}
+
+    UPDATED SUMMARY:
     """
-    Initializes a new LangChain LLMChain specifically for mood analysis.
+    return PromptTemplate(
+        template=prompt_template,
+        input_variables=["previous_summary", "chat_transcript"]
+    )
+
+def get_combine_prompt() -> PromptTemplate:
+    """Merges summaries of consecutive chunks of a long transcript (the 'reduce' step)."""
+    prompt_template = """
+    You are an expert in summarizing conversations. A long chat was split into consecutive parts and each part was summarized.
+    Combine the earlier summary (if any) and the part summaries, in order, into one concise, neutral summary.
+    Focus on the main topics and decisions, ignoring small talk.
+
+    EARLIER SUMMARY:
+    {previous_summary}
+
+    PART SUMMARIES:
+    {partial_summaries}
+
+    SUMMARY:
     """
-    # llm = ChatGroq(temperature=0.2, model_name="llama3-8b-8192")
-    
+    return PromptTemplate(
+        template=prompt_template,
+        input_variables=["previous_summary", "partial_summaries"]
+    )
+
+# --- NEW: Mood Analysis Chain ---
+def get_mood_prompt() -> PromptTemplate:
     # This detailed prompt guides the LLM to return a single, clean word
     # that matches the emotions our frontend already knows how to display.
     prompt_template = """
@@ -55,26 +149,60 @@ def get_mood_chain() -> LLMChain:
 
     DOMINANT MOOD:
     """
-    prompt = PromptTemplate(
+    return PromptTemplate(
         template=prompt_template,
         input_variables=["chat_transcript"]
     )
-    return LLMChain(prompt=prompt, llm=llm)
 
 
-# Create reusable instances of our chains
-summary_chain = get_summary_chain()
-mood_chain = get_mood_chain() # NEW mood chain instance
+# --- Chains ---
+PROMPTS = {
+    "summary": get_summary_prompt,
+    "update": get_update_prompt,
+    "combine": get_combine_prompt,
+    "mood": get_mood_prompt,
+}
+
+_chains: Dict[str, object] = {}
+
+def get_chain(name: str):
+    """Returns the reusable `prompt | llm | parser` runnable for `name`, building it on first use."""
+    chain = _chains.get(name)
+    if chain is None:
+        chain = _chains[name] = PROMPTS[name]() | get_llm() | StrOutputParser()
+    return chain
+
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+async def run_chain_async(name: str, inputs: dict, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Runs a chain and returns its text. With `on_token` the response is
+    streamed and each piece is handed over as it arrives. Cancelling the
+    caller cancels the LLM call.
+    """
+    async with _llm_slots:
+        if on_token is None:
+            text = await asyncio.wait_for(get_chain(name).ainvoke(inputs), timeout=LLM_TIMEOUT_SECONDS)
+            return text.strip()
+
+        async def stream() -> str:
+            pieces = []
+            async for piece in get_chain(name).astream(inputs):
+                if piece:
+                    pieces.append(piece)
+                    on_token(piece)
+            return "".join(pieces)
+
+        return (await asyncio.wait_for(stream(), timeout=LLM_TIMEOUT_SECONDS)).strip()
 
 async def generate_summary_async(chat_transcript: str) -> str:
     """
     Asynchronously generates a summary from a chat transcript.
     """
     try:
-        response = await run_in_threadpool(summary_chain.invoke, {"chat_transcript": chat_transcript})
-        return response.get("text", "Sorry, the summary could not be generated.").strip()
+        return await run_chain_async("summary", {"chat_transcript": chat_transcript})
     except Exception as e:
-        print(f"❌ Error during summarization: {e}")
+        logger.error("❌ Error during summarization: %s", e)
         return "An error occurred while generating the summary."
 
 # NEW: Async function for generating mood
@@ -83,11 +211,11 @@ async def generate_mood_async(chat_transcript: str) -> str:
     Asynchronously generates a mood analysis from a chat transcript.
     """
     try:
-        response = await run_in_threadpool(mood_chain.invoke, {"chat_transcript": chat_transcript})
+        response = await run_chain_async("mood", {"chat_transcript": chat_transcript})
         # We strip whitespace and convert to lower to ensure a clean response
-        return response.get("text", "neutral").strip().lower()
+        return response.lower() or "neutral"
     except Exception as e:
-        print(f"❌ Error during mood analysis: {e}")
+        logger.error("❌ Error during mood analysis: %s", e)
         return "neutral"
 
 # import os
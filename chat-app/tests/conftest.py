@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# Settings the app modules read on import: a throwaway SQLite database (so
+# the Cloud SQL variables aren't needed) and the canned-response LLM
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/chat-test.db")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+# The app modules are imported as top-level modules, as in the container.
+# Run pytest from chat-app/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import Base
+
+
+class FakeClock:
+    """
+    Stands in for a module's `time` (monkeypatch the module attribute, not
+    time.monotonic itself, which the event loop also reads). monotonic() only
+    moves when a test advances `now`.
+    """
+
+    perf_counter = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_factory(tmp_path):
+    """An async session factory on a fresh SQLite database with the app's tables."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/chat.db")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
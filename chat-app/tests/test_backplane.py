@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from backplane import InProcessBackplane, RedisBackplane, create_backplane
+
+fakeredis = pytest.importorskip("fakeredis")
+
+pytestmark = pytest.mark.anyio
+
+
+def _redis_backplane(server, channel="test:broadcast"):
+    return RedisBackplane(channel=channel, client=fakeredis.aioredis.FakeRedis(server=server))
+
+
+async def _receive(inbox: list, count: int, timeout: float = 2.0):
+    async def wait():
+        while len(inbox) < count:
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), timeout)
+
+
+async def test_in_process_backplane_delivers_to_its_handler():
+    received = []
+
+    async def handler(envelope):
+        received.append(envelope)
+
+    backplane = create_backplane("memory")
+    assert isinstance(backplane, InProcessBackplane)
+    await backplane.start(handler)
+    await backplane.publish({"room_id": 1, "frame": "hi"})
+    assert received == [{"room_id": 1, "frame": "hi"}]
+    assert await backplane.lease_node_id(8, lambda node_id: None) is None
+
+
+async def test_redis_backplane_fans_out_to_every_worker_in_publish_order():
+    server = fakeredis.FakeServer()
+    workers = [_redis_backplane(server), _redis_backplane(server)]
+    inboxes = [[], []]
+    for worker, inbox in zip(workers, inboxes):
+        async def handler(envelope, inbox=inbox):
+            inbox.append(envelope)
+        await worker.start(handler)
+
+    envelopes = [{"room_id": 1, "frame": str(n)} for n in range(5)]
+    for n, envelope in enumerate(envelopes):
+        await workers[n % 2].publish(envelope)
+
+    for inbox in inboxes:
+        await _receive(inbox, len(envelopes))
+        assert inbox == envelopes
+    for worker in workers:
+        await worker.stop()
+
+
+async def test_redis_backplane_only_delivers_its_own_channel():
+    server = fakeredis.FakeServer()
+    backplanes = [_redis_backplane(server), _redis_backplane(server, channel="other:broadcast")]
+    inboxes = [[], []]
+    for backplane, inbox in zip(backplanes, inboxes):
+        async def handler(envelope, inbox=inbox):
+            inbox.append(envelope)
+        await backplane.start(handler)
+
+    await backplanes[1].publish({"frame": "elsewhere"})
+    await backplanes[0].publish({"frame": "here"})
+    for inbox in inboxes:
+        await _receive(inbox, 1)
+    await asyncio.sleep(0.05)
+    assert inboxes == [[{"frame": "here"}], [{"frame": "elsewhere"}]]
+    for backplane in backplanes:
+        await backplane.stop()
+
+
+async def test_node_id_leases_are_unique_and_released_on_stop():
+    server = fakeredis.FakeServer()
+    workers = [_redis_backplane(server) for _ in range(3)]
+    for worker in workers:
+        await worker.start(lambda envelope: asyncio.sleep(0))
+
+    node_ids = [await worker.lease_node_id(2, lambda node_id: None) for worker in workers[:2]]
+    assert sorted(node_ids) == [0, 1]
+    with pytest.raises(RuntimeError):
+        await workers[2].lease_node_id(2, lambda node_id: None)
+
+    # Stopping hands the id back at once instead of after the lease TTL
+    await workers[0].stop()
+    assert await workers[2].lease_node_id(2, lambda node_id: None) == node_ids[0]
+    for worker in workers[1:]:
+        await worker.stop()
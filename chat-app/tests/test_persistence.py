@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+import models
+from persistence import MessageWriter, PersistenceBacklogFull
+
+pytestmark = pytest.mark.anyio
+
+
+def _failing(session_factory, failures: set):
+    """A session factory whose n-th use (counting from 1) raises a connection error, for each n in `failures`."""
+    calls = {"n": 0}
+
+    def factory():
+        calls["n"] += 1
+        if calls["n"] in failures:
+            raise OperationalError("INSERT", {}, Exception("database is down"))
+        return session_factory()
+
+    return factory
+
+
+async def _stored(session_factory) -> dict:
+    async with session_factory() as db:
+        rows = (await db.execute(select(models.Message.id, models.Message.emotion))).all()
+    return dict(rows)
+
+
+async def test_write_behind_batches_rows_and_folds_in_early_emotions(session_factory):
+    writer = MessageWriter(session_factory, mode="write_behind")
+    first = await writer.add_message(1, 1, "hello")
+    second = await writer.add_message(1, 1, "there")
+    await writer.set_emotion(first["id"], "joy")
+    assert writer.pending_rows == 2  # The emotion rode along with its INSERT
+
+    await writer.flush()
+    await writer.set_emotion(second["id"], "surprise")
+    await writer.flush()
+
+    assert await _stored(session_factory) == {first["id"]: "joy", second["id"]: "surprise"}
+    assert writer.pending_rows == 0
+
+
+async def test_write_behind_requeues_rows_after_a_connection_error(session_factory):
+    # The batch and the first row-by-row attempt both hit the outage
+    writer = MessageWriter(_failing(session_factory, {1, 2}), mode="write_behind")
+    rows = [await writer.add_message(1, 1, text) for text in ("a", "b")]
+
+    with pytest.raises(OperationalError):
+        await writer.flush()
+    assert writer.pending_rows == 2
+
+    await writer.flush()
+    assert set(await _stored(session_factory)) == {row["id"] for row in rows}
+    assert writer.dead_lettered == 0
+
+
+async def test_write_behind_dead_letters_a_poison_row_without_blocking_others(session_factory):
+    writer = MessageWriter(session_factory, mode="write_behind", max_attempts=3)
+    poison = await writer.add_message(1, 1, "duplicate id")
+    good = await writer.add_message(1, 1, "fine")
+    async with session_factory() as db:
+        await db.execute(insert(models.Message).values(id=poison["id"], user_id=1, room_id=1, content="taken"))
+        await db.commit()
+
+    await writer.flush()
+    assert good["id"] in await _stored(session_factory)
+    assert writer.pending_rows == 1  # Only the poison row is retried
+
+    await writer.flush()
+    await writer.flush()
+    assert writer.pending_rows == 0
+    assert writer.dead_lettered == 1
+
+
+async def test_write_behind_refuses_messages_while_the_backlog_stays_full(session_factory):
+    writer = MessageWriter(session_factory, mode="write_behind", flush_max_rows=1, max_pending_rows=1, max_attempts=5)
+    poison = await writer.add_message(1, 1, "duplicate id")
+    async with session_factory() as db:
+        await db.execute(insert(models.Message).values(id=poison["id"], user_id=1, room_id=1, content="taken"))
+        await db.commit()
+
+    # The flush made to free a slot can't write the poison row, which stays queued
+    with pytest.raises(PersistenceBacklogFull):
+        await writer.add_message(1, 1, "no room")
+    assert writer.pending_rows == 1
+
+
+async def test_write_through_reports_a_failed_flush_to_every_writer_in_the_batch(session_factory):
+    # Writer A's flush succeeds; B and C queue during it and share the second, failing flush
+    writer = MessageWriter(_failing(session_factory, {2}), mode="write_through")
+    await writer.start()
+    assert writer._task is None  # No background flushes behind the writers' backs
+
+    async def send(text):
+        try:
+            await writer.add_message(1, 1, text)
+            return "ok"
+        except OperationalError:
+            return "error"
+
+    results = await asyncio.gather(send("A"), send("B"), send("C"))
+    assert results == ["ok", "error", "error"]
+    assert writer.pending_rows == 0
+    assert len(await _stored(session_factory)) == 1
+    await writer.stop()
@@ -0,0 +1,69 @@
+import pytest
+
+import rate_limit
+from conftest import FakeClock
+from rate_limit import InMemoryRateLimitStore, RateLimiter, RateLimitStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+async def test_allows_a_burst_up_to_capacity_then_rejects(clock):
+    limiter = RateLimiter(InMemoryRateLimitStore(), capacity=3, window_seconds=30)
+    assert [await limiter.allow("alice") for _ in range(4)] == [True, True, True, False]
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rejected"] == 1
+
+
+async def test_refills_at_capacity_per_window(clock):
+    limiter = RateLimiter(InMemoryRateLimitStore(), capacity=3, window_seconds=30)
+    for _ in range(3):
+        await limiter.allow("alice")
+
+    clock.now += 9.9  # Just short of one token (one per 10s)
+    assert not await limiter.allow("alice")
+    clock.now += 0.1
+    assert await limiter.allow("alice")
+    assert not await limiter.allow("alice")
+
+    # A long pause refills to capacity, never beyond it
+    clock.now += 3600
+    assert [await limiter.allow("alice") for _ in range(4)] == [True, True, True, False]
+
+
+async def test_users_have_separate_buckets(clock):
+    limiter = RateLimiter(InMemoryRateLimitStore(), capacity=1, window_seconds=10)
+    assert await limiter.allow("alice")
+    assert not await limiter.allow("alice")
+    assert await limiter.allow("bob")
+
+
+async def test_idle_buckets_are_evicted_once_full_again(clock):
+    store = InMemoryRateLimitStore(evict_interval=5)
+    limiter = RateLimiter(store, capacity=2, window_seconds=10)
+    await limiter.allow("alice")
+    clock.now += 6
+    await limiter.allow("bob")  # Sweeps, but alice's bucket isn't full yet
+    assert store.tracked_keys() == 2
+
+    clock.now += 8  # alice has been idle for a full refill (10s), bob for 8s
+    await limiter.allow("bob")
+    assert store.tracked_keys() == 1
+    assert store.evicted == 1
+
+
+async def test_store_errors_let_messages_through():
+    class BrokenStore(RateLimitStore):
+        async def take(self, key, capacity, refill_per_second):
+            raise ConnectionError("redis is down")
+
+    limiter = RateLimiter(BrokenStore(), capacity=1, window_seconds=10)
+    assert await limiter.allow("alice")
+    assert await limiter.allow("alice")
+    assert limiter.stats()["store_errors"] == 2
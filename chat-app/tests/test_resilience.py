@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+
+import resilience
+from conftest import FakeClock
+from resilience import AdaptiveLimiter, CircuitBreaker, DependencyGuard, DependencyUnavailable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", clock)
+    return clock
+
+
+def _breaker(**overrides) -> CircuitBreaker:
+    settings = dict(window=10, min_calls=4, failure_rate=0.5, consecutive_failures=3,
+                    open_seconds=5.0, half_open_probes=2)
+    settings.update(overrides)
+    return CircuitBreaker(**settings)
+
+
+def _trip(breaker: CircuitBreaker):
+    while breaker.state == CircuitBreaker.CLOSED:
+        assert breaker.allow()
+        breaker.record(False)
+
+
+# --- CircuitBreaker ---
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = _breaker()
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+
+
+def test_breaker_opens_on_failure_rate_over_the_window(clock):
+    breaker = _breaker(consecutive_failures=100)
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.state == CircuitBreaker.CLOSED  # Below min_calls
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.failure_rate == 0.5
+
+
+def test_breaker_forgets_failures_that_leave_the_window(clock):
+    breaker = _breaker(window=4, consecutive_failures=100)
+    for ok in (False, True, True, True, True, True, False):
+        breaker.record(ok)
+    assert breaker.failure_rate == 0.25
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_opens_after_open_seconds_and_probes_one_at_a_time(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock.now += 4.9
+    assert not breaker.allow()
+
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # The first probe is still out
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure_rate == 0.0
+
+
+def test_breaker_reopens_when_a_probe_fails(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock.now += 5
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 2
+    assert not breaker.allow()
+
+
+def test_abandoned_probe_frees_the_probe_slot(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock.now += 5
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+# --- AdaptiveLimiter ---
+def test_limiter_refuses_beyond_its_limit():
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=10)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release(None)
+    assert limiter.limit == 2
+    assert limiter.try_acquire()
+
+
+def test_limiter_grows_by_about_one_per_round_of_successes():
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=10)
+    for _ in range(4):
+        limiter.try_acquire()
+        limiter.release(True)
+    assert 4.9 < limiter.limit < 5.0
+    for _ in range(100):
+        limiter.try_acquire()
+        limiter.release(True)
+    assert limiter.limit == 10
+
+
+def test_limiter_backs_off_on_failure_down_to_its_minimum():
+    limiter = AdaptiveLimiter(initial=8, minimum=2, maximum=10, backoff=0.5)
+    limiter.try_acquire()
+    limiter.release(False)
+    assert limiter.limit == 4
+    for _ in range(3):
+        limiter.try_acquire()
+        limiter.release(False)
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+# --- DependencyGuard ---
+@pytest.mark.anyio
+async def test_guard_refuses_calls_while_the_circuit_is_open(clock):
+    guard = DependencyGuard("test", max_timeout=1.0, breaker=_breaker(), limiter=AdaptiveLimiter(initial=4))
+
+    async def fail():
+        raise ConnectionError("down")
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            await guard.call(fail)
+    assert guard.is_open
+
+    async def succeed():
+        return "ok"
+
+    with pytest.raises(DependencyUnavailable) as refused:
+        await guard.call(succeed)
+    assert refused.value.reason == "circuit open"
+    assert guard.limiter.in_flight == 0
+
+    clock.now += 5
+    for _ in range(2):
+        assert await guard.call(succeed) == "ok"
+    assert not guard.is_open
+
+
+@pytest.mark.anyio
+async def test_guard_counts_timeouts_and_failed_results_against_the_dependency(clock):
+    guard = DependencyGuard("test", max_timeout=0.05, breaker=_breaker(), limiter=AdaptiveLimiter(initial=4))
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    async def error_response():
+        return {"status": 503}
+
+    with pytest.raises(asyncio.TimeoutError):
+        await guard.call(hang)
+    assert await guard.call(error_response, is_failure=lambda r: r["status"] >= 500) == {"status": 503}
+    assert guard.stats()["timeouts"] == 1
+    assert guard.breaker.failure_rate == 1.0
+    assert guard.limiter.limit == 1
+
+
+@pytest.mark.anyio
+async def test_guard_refuses_calls_beyond_the_concurrency_limit():
+    guard = DependencyGuard("test", max_timeout=1.0, limiter=AdaptiveLimiter(initial=1))
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(guard.call(slow))
+    await asyncio.sleep(0)
+    with pytest.raises(DependencyUnavailable) as refused:
+        await guard.call(slow)
+    assert refused.value.reason == "concurrency limit reached"
+    release.set()
+    assert await first == "done"
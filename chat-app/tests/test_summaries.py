@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import insert
+
+import models
+import summarizer
+from summaries import NO_MESSAGES_SUMMARY, RoomSummaries
+from summarizer import FakeChatModel
+
+pytestmark = pytest.mark.anyio
+
+ROOM_ID = 1
+START = datetime(2024, 1, 1, 12, 0)
+
+
+class RecordingChatModel(FakeChatModel):
+    """Also keeps every prompt it was sent."""
+
+    prompts: List[str] = []
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[0].content)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    model = RecordingChatModel(responses=["Summary 1", "Summary 2", "Summary 3", "Summary 4"])
+    monkeypatch.setattr(summarizer, "_llm", model)
+    monkeypatch.setattr(summarizer, "_chains", {})
+    return model
+
+
+@pytest.fixture
+async def post(session_factory):
+    async with session_factory() as db:
+        await db.execute(insert(models.User).values(id=1, username="alice", password="x"))
+        await db.execute(insert(models.Room).values(id=ROOM_ID, name="general"))
+        await db.commit()
+    count = {"n": 0}
+
+    async def post(*contents: str):
+        async with session_factory() as db:
+            for content in contents:
+                count["n"] += 1
+                await db.execute(insert(models.Message).values(
+                    id=count["n"], user_id=1, room_id=ROOM_ID, content=content,
+                    timestamp=START + timedelta(seconds=count["n"]),
+                ))
+            await db.commit()
+
+    return post
+
+
+async def test_empty_room_needs_no_llm_call(session_factory, llm):
+    summaries = RoomSummaries(session_factory)
+    assert await summaries.summarize(ROOM_ID) == NO_MESSAGES_SUMMARY
+    assert llm.prompts == []
+
+
+async def test_unchanged_room_is_served_from_cache(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory)
+    await post("hello", "anyone here?")
+    assert await summaries.summarize(ROOM_ID) == "Summary 1"
+    assert await summaries.summarize(ROOM_ID) == "Summary 1"
+    assert len(llm.prompts) == 1
+    assert summaries.stats()["full_builds"] == 1
+    assert summaries.stats()["hits"] == 1
+
+
+async def test_new_messages_are_folded_into_the_previous_summary(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory)
+    await post("hello", "anyone here?")
+    await summaries.summarize(ROOM_ID)
+    await post("lunch at noon?")
+
+    assert await summaries.summarize(ROOM_ID) == "Summary 2"
+    prompt = llm.prompts[-1]
+    assert "Summary 1" in prompt
+    assert "alice: lunch at noon?" in prompt
+    assert "anyone here?" not in prompt
+    assert summaries.stats()["incremental_builds"] == 1
+
+
+async def test_too_many_new_messages_means_a_full_rebuild(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory, max_new_messages=2)
+    await post("hello")
+    await summaries.summarize(ROOM_ID)
+    await post("one", "two", "three")
+
+    await summaries.summarize(ROOM_ID)
+    assert "alice: hello" in llm.prompts[-1]
+    assert summaries.stats()["full_builds"] == 2
+    assert summaries.stats()["incremental_builds"] == 0
+
+
+async def test_rebuilds_in_full_after_max_incremental_updates(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory, max_incremental_updates=1)
+    for content in ("one", "two", "three"):
+        await post(content)
+        await summaries.summarize(ROOM_ID)
+    assert summaries.stats()["full_builds"] == 2
+    assert summaries.stats()["incremental_builds"] == 1
+
+
+async def test_concurrent_requests_share_one_llm_call(session_factory, llm, post):
+    llm.latency = 0.05
+    summaries = RoomSummaries(session_factory)
+    await post("hello")
+    results = await asyncio.gather(*(summaries.summarize(ROOM_ID) for _ in range(3)))
+    assert results == ["Summary 1"] * 3
+    assert len(llm.prompts) == 1
+    assert summaries.stats()["coalesced"] == 2
+
+
+async def test_long_transcripts_are_summarized_in_chunks_then_combined(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory, chunk_max_chars=30)
+    await post("a" * 20, "b" * 20, "c" * 20)
+    assert await summaries.summarize(ROOM_ID) == "Summary 4"
+    assert len(llm.prompts) == 4
+    assert "Summary 1" in llm.prompts[-1] and "Summary 3" in llm.prompts[-1]
+
+
+async def test_streams_tokens_to_the_caller_that_builds(session_factory, llm, post):
+    summaries = RoomSummaries(session_factory)
+    await post("hello")
+    tokens = []
+    assert await summaries.summarize(ROOM_ID, on_token=tokens.append) == "Summary 1"
+    assert "".join(tokens) == "Summary 1"
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+
+class MicroBatcher:
+    """
+    Groups concurrent requests into batches for a single model forward pass.
+
+    Callers `submit()` one item and get back their own result. A single
+    background worker pulls items off the queue, waits at most `max_wait_ms`
+    for more to arrive (or until `max_batch_size` is reached), and runs
+    `batch_fn` on the whole batch in a threadpool so the event loop stays free.
+    `depth_gauge`, if given, is kept set to the number of waiting items.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        depth_gauge=None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.depth_gauge = depth_gauge
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Items taken off the queue but not answered yet, so stop() can fail them
+        self._batch: List[Tuple[Any, asyncio.Future]] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Fail anything still waiting so callers don't hang forever
+        if self._queue:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Batcher stopped"))
+
+    @property
+    def queue_depth(self) -> int:
+        """Items waiting for a batch (not counting the one being processed)."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, item: Any) -> Any:
+        if self._queue is None:
+            raise RuntimeError("Batcher has not been started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        self._report_depth()
+        return await future
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        # Each item goes through the same queue, so a bulk request is
+        # batched together with whatever else is in flight.
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        # Filled in place, so a cancellation mid-collect still sees the items
+        batch = self._batch = []
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        self._report_depth()
+        return batch
+
+    def _report_depth(self):
+        if self.depth_gauge is not None:
+            self.depth_gauge.set(self._queue.qsize())
+
+    async def _run(self):
+        try:
+            while True:
+                batch = await self._collect()
+                await self._process(batch)
+                self._batch = []
+        except asyncio.CancelledError:
+            for _, future in self._batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batcher stopped"))
+            self._batch = []
+            raise
+
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future]]):
+        # Skip callers that gave up (e.g. client disconnected)
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        items = [item for item, _ in batch]
+        try:
+            results = await run_in_threadpool(self.batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
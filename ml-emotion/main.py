@@ -1,27 +1,137 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from ml_model import analyze_emotion # Your existing file
+from ml_model import analyze_emotions, load_model, model_state # Your existing file
+from batcher import MicroBatcher
+from cache import ResultCache
+import metrics
 
 #for local
 # import uvicorn
-# import os
 # from dotenv import load_dotenv
 # load_dotenv()
 
-app = FastAPI(title="Emotion Analysis Service")
+# --- Micro-batching Settings ---
+# Concurrent /analyze calls are grouped into one forward pass of up to
+# MAX_BATCH_SIZE texts, waiting at most MAX_WAIT_MS for a batch to fill.
+MAX_BATCH_SIZE = int(os.environ.get("EMOTION_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("EMOTION_MAX_WAIT_MS", "10"))
+
+batcher = MicroBatcher(analyze_emotions, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, depth_gauge=metrics.BATCHER_QUEUE_DEPTH)
+
+# --- Result Cache ---
+# Repeated texts ("lol", "ok", copy-pasted spam) are answered from memory
+# instead of running the model again.
+CACHE_MAX_BYTES = int(os.environ.get("EMOTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.environ.get("EMOTION_CACHE_TTL_SECONDS", "3600"))
+# Share one entry between casings of a text. Off by default: the models are
+# case-sensitive, so "STOP" and "stop" can score differently.
+CACHE_CASEFOLD = os.environ.get("EMOTION_CACHE_CASEFOLD", "false").lower() == "true"
+
+result_cache = ResultCache(CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_CASEFOLD)
+
+async def _classify(texts: List[str]) -> list:
+    """Serves cache hits directly and sends only the misses to the batcher."""
+    results = [result_cache.get(text) for text in texts]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        computed = await batcher.submit_many([texts[i] for i in misses])
+        for i, result in zip(misses, computed):
+            results[i] = result
+            # Don't remember failures; the next request should retry the model
+            if result != "unknown":
+                result_cache.set(texts[i], result)
+    return results
+
+# --- Model Lifecycle ---
+# By default the model loads in the background: the process answers /health
+# straight away and /ready flips to 200 once the model has warmed up, so an
+# orchestrator can hold traffic back until then. Set to false to block
+# startup until the model is ready instead.
+LOAD_IN_BACKGROUND = os.environ.get("EMOTION_LOAD_IN_BACKGROUND", "true").lower() == "true"
+# Retry-After for requests that arrive before the model is ready
+NOT_READY_RETRY_AFTER_SECONDS = 5
+
+STARTED_AT = time.perf_counter()
+ready_after_seconds = None
+
+async def _load_model():
+    global ready_after_seconds
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_model)
+    except Exception:
+        return  # Already logged, and reported by /health
+    ready_after_seconds = round(time.perf_counter() - STARTED_AT, 3)
+    print(f"🚀 Emotion service ready {ready_after_seconds}s after startup.")
+
+def _require_ready():
+    if not model_state.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Model is not ready",
+            headers={"Retry-After": str(NOT_READY_RETRY_AFTER_SECONDS)},
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await batcher.start()
+    loader = asyncio.create_task(_load_model())
+    if not LOAD_IN_BACKGROUND:
+        await loader
+    yield
+    await batcher.stop()
+
+app = FastAPI(title="Emotion Analysis Service", lifespan=lifespan)
 
 class TextIn(BaseModel):
     text: str
 
+class TextsIn(BaseModel):
+    texts: List[str]
+
 @app.get("/")
 def read_root():
     return {"status": "Emotion analysis service is running"}
 
+@app.get("/health")
+def health():
+    """Liveness: the process is up. Only a model that failed to load makes it unhealthy."""
+    body = {**model_state.as_dict(), "ready_after_seconds": ready_after_seconds}
+    return JSONResponse(body, status_code=503 if model_state.status == "failed" else 200)
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 only once the model is loaded and warmed up."""
+    body = {"ready": model_state.ready, "status": model_state.status}
+    return JSONResponse(body, status_code=200 if model_state.ready else 503)
+
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/stats")
+def stats():
+    return {"cache": result_cache.stats()}
+
 @app.post("/analyze")
-def analyze(data: TextIn):
-    # Run the analysis from your original file
-    emotion = analyze_emotion(data.text)
+async def analyze(data: TextIn):
+    _require_ready()
+    # Queued with other concurrent requests and run as one batch
+    emotion = (await _classify([data.text]))[0]
     return {"emotion": emotion}
 
+@app.post("/analyze_batch")
+async def analyze_batch(data: TextsIn):
+    _require_ready()
+    emotions = await _classify(data.texts)
+    return {"emotions": emotions}
+
 # if __name__ == "__main__":
-#     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
\ No newline at end of file
+#     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
@@ -0,0 +1,50 @@
+import os
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+
+# --- Metrics Settings ---
+# With more than one gunicorn worker, point PROMETHEUS_MULTIPROC_DIR at an
+# empty directory so /metrics aggregates every worker, not just the one that
+# happened to answer. Gauges are therefore set whenever their value changes,
+# never computed at scrape time: a callback can't be shared between workers.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# --- Inference ---
+BATCH_SIZE = Histogram(
+    "emotion_batch_size", "Texts per model forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+FORWARD_SECONDS = Histogram(
+    "emotion_forward_seconds", "Time per batch in the model, tokenization included",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+INFERENCE_ERRORS = Counter("emotion_inference_errors_total", "Batches that raised during inference")
+
+# --- Service State ---
+# Summed over live workers
+BATCHER_QUEUE_DEPTH = Gauge(
+    "emotion_batcher_queue_depth", "Texts waiting for a batch", multiprocess_mode="livesum"
+)
+# 1 once any live worker is serving
+MODEL_READY = Gauge(
+    "emotion_model_ready", "1 once the model is loaded and warmed up", multiprocess_mode="livemax"
+)
+
+
+def render() -> Tuple[bytes, str]:
+    """The exposition body and its content type, for the /metrics endpoint."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drops an exited worker's live* gauge values (called from gunicorn's child_exit hook)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
@@ -1,61 +1,212 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+import numpy as np
+import os
+import time
+from typing import Dict, List, Optional
+
+import metrics
 
 # Define the new model name
 MODEL_NAME = "cirimus/modernbert-base-go-emotions"
 
-# Global variables for the model and tokenizer
+# --- Inference Backend ---
+# "torch":      eager fp32 PyTorch (the default)
+# "torch-int8": PyTorch with nn.Linear layers dynamically quantized to int8
+# "onnx":       an ONNX Runtime session over a model exported with
+#               `python optimize.py export` (optionally quantized to int8)
+EMOTION_BACKEND = os.environ.get("EMOTION_BACKEND", "torch")
+EMOTION_ONNX_PATH = os.environ.get("EMOTION_ONNX_PATH", "onnx/model.onnx")
+# Intra-op threads for ONNX Runtime; 0 lets it pick (one per core)
+EMOTION_ONNX_THREADS = int(os.environ.get("EMOTION_ONNX_THREADS", "0"))
+
+# --- Model Lifecycle ---
+# A directory with pre-downloaded weights (the Dockerfile bakes them in), so
+# startup never waits on the network. Falls back to the Hugging Face cache.
+EMOTION_MODEL_DIR = os.environ.get("EMOTION_MODEL_DIR")
+
+
+class TorchBackend:
+    """Runs the Hugging Face model in PyTorch, optionally int8-quantized."""
+
+    tensor_type = "pt"
+
+    def __init__(self, model_name: str, quantize: bool = False, local_files_only: bool = False):
+        import torch  # Not needed at all by the ONNX backend
+        self.torch = torch
+        # safetensors weights are memory-mapped and loaded straight into the
+        # model, without first building a randomly initialized copy
+        model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, local_files_only=local_files_only, low_cpu_mem_usage=True
+        )
+        # Set the model to evaluation mode (disables dropout, etc.)
+        model.eval()
+        if quantize:
+            # Weights stored as int8, activations quantized on the fly: smaller
+            # and faster matmuls on CPU, no calibration data needed
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.id2label = model.config.id2label
+
+    def logits(self, inputs) -> np.ndarray:
+        # Perform inference without tracking gradients or autograd state
+        with self.torch.inference_mode():
+            return self.model(**inputs).logits.numpy()
+
+
+class OnnxBackend:
+    """Runs an exported ONNX graph with ONNX Runtime; no PyTorch needed."""
+
+    tensor_type = "np"
+
+    def __init__(self, model_name: str, onnx_path: str, threads: int = 0, local_files_only: bool = False):
+        import onnxruntime as ort  # Optional dependency, only needed for this backend
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {graph_input.name for graph_input in self.session.get_inputs()}
+        # Only the config (labels) is needed from the hub, not the weights
+        self.id2label = AutoConfig.from_pretrained(model_name, local_files_only=local_files_only).id2label
+
+    def logits(self, inputs) -> np.ndarray:
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def create_backend(
+    kind: str = EMOTION_BACKEND,
+    model_name: str = MODEL_NAME,
+    onnx_path: str = EMOTION_ONNX_PATH,
+    local_files_only: bool = False,
+):
+    if kind == "torch":
+        return TorchBackend(model_name, local_files_only=local_files_only)
+    if kind == "torch-int8":
+        return TorchBackend(model_name, quantize=True, local_files_only=local_files_only)
+    if kind == "onnx":
+        return OnnxBackend(model_name, onnx_path, EMOTION_ONNX_THREADS, local_files_only=local_files_only)
+    raise ValueError(f"Unknown EMOTION_BACKEND: {kind}")
+
+
+class ModelState:
+    """What /health and /ready report: whether the model is usable, and how long it took."""
+
+    def __init__(self):
+        self.status = "not_loaded"  # -> "loading" -> "ready" | "failed"
+        self.source: Optional[str] = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "backend": EMOTION_BACKEND,
+            "source": self.source,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+
+# Global variables for the backend and tokenizer, set by load_model()
 tokenizer = None
-model = None
-
-print(f"Loading model: {MODEL_NAME}...")
-try:
-    # Load the tokenizer and model from Hugging Face
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
-    # Set the model to evaluation mode (disables dropout, etc.)
-    model.eval()
-    print("✅ Emotion analysis model loaded successfully.")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
+backend = None
+model_state = ModelState()
 
-def analyze_emotion(text: str) -> str:
+def load_model():
     """
-    Analyzes the emotion of a given text string using the modernBERT model.
-    Returns the label of the most likely emotion.
+    Loads the tokenizer and backend, then runs one warm-up inference so the
+    first real request doesn't pay for lazy initialization. Blocking; call
+    it from a worker thread. Raises (and records the error) on failure.
     """
-    # Check if the model and tokenizer were loaded successfully
-    if not model or not tokenizer:
-        return "unknown"
-        
+    global tokenizer, backend
+    if model_state.status in ("loading", "ready"):
+        return
+
+    local = bool(EMOTION_MODEL_DIR and os.path.isdir(EMOTION_MODEL_DIR))
+    source = EMOTION_MODEL_DIR if local else MODEL_NAME
+    model_state.status = "loading"
+    model_state.source = source
+    print(f"Loading model: {source} (backend: {EMOTION_BACKEND})...")
+
     try:
-        # Tokenize the input text and convert to PyTorch tensors
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-
-        # Perform inference without calculating gradients
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        # Get the raw output scores (logits)
-        logits = outputs.logits
-
-        # Find the index of the highest score
-        predicted_class_id = torch.argmax(logits, dim=1).item()
-        
-        # Look up the corresponding emotion label from the model's configuration
-        return model.config.id2label[predicted_class_id]
+        started = time.perf_counter()
+        loaded_tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+        loaded_backend = create_backend(model_name=source, local_files_only=local)
+        model_state.load_seconds = round(time.perf_counter() - started, 3)
 
+        started = time.perf_counter()
+        predict_labels(["Warming up the emotion model."], loaded_backend, loaded_tokenizer)
+        model_state.warmup_seconds = round(time.perf_counter() - started, 3)
     except Exception as e:
+        model_state.status = "failed"
+        model_state.error = str(e)
+        print(f"❌ Error loading model: {e}")
+        raise
+
+    tokenizer, backend = loaded_tokenizer, loaded_backend
+    model_state.status = "ready"
+    metrics.MODEL_READY.set(1)
+    print(
+        f"✅ Emotion analysis model loaded successfully "
+        f"(load {model_state.load_seconds}s, warm-up {model_state.warmup_seconds}s)."
+    )
+
+def predict_logits(texts: List[str], backend, tokenizer) -> np.ndarray:
+    """One padded forward pass over `texts` with the given backend; raises on failure."""
+    # Tokenize the whole batch, padding to the longest text in it
+    inputs = tokenizer(texts, return_tensors=backend.tensor_type, truncation=True, padding=True)
+    return backend.logits(inputs)
+
+def predict_labels(texts: List[str], backend, tokenizer) -> List[str]:
+    """The top label for each text; raises on failure."""
+    logits = predict_logits(texts, backend, tokenizer)
+    # Find the index of the highest score for every row and look up its label
+    id2label: Dict[int, str] = backend.id2label
+    return [id2label[int(class_id)] for class_id in np.argmax(logits, axis=1)]
+
+def analyze_emotions(texts: List[str]) -> List[str]:
+    """
+    Analyzes a batch of texts in a single padded forward pass.
+    Returns one emotion label per input text, in the same order.
+    """
+    if not texts:
+        return []
+
+    # Check if the model and tokenizer were loaded successfully
+    if not backend or not tokenizer:
+        return ["unknown"] * len(texts)
+
+    try:
+        with metrics.FORWARD_SECONDS.time():
+            labels = predict_labels(texts, backend, tokenizer)
+        metrics.BATCH_SIZE.observe(len(texts))
+        return labels
+    except Exception as e:
+        metrics.INFERENCE_ERRORS.inc()
         print(f"Error during emotion analysis: {e}")
-        return "unknown"
+        return ["unknown"] * len(texts)
+
+def analyze_emotion(text: str) -> str:
+    """
+    Analyzes the emotion of a given text string using the modernBERT model.
+    Returns the label of the most likely emotion.
+    """
+    return analyze_emotions([text])[0]
 
 # Example usage:
 if __name__ == "__main__":
+    load_model()
     text1 = "I am so excited for the party tonight, it's going to be amazing!"
     text2 = "I'm not sure what to do, I feel so lost and confused."
     text3 = "Thank you so much for your help, I really appreciate it."
-    
+
     print(f"'{text1}' -> Emotion: {analyze_emotion(text1)}")
     print(f"'{text2}' -> Emotion: {analyze_emotion(text2)}")
     print(f"'{text3}' -> Emotion: {analyze_emotion(text3)}")
-
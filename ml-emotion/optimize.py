@@ -0,0 +1,249 @@
+"""
+Export and verify the optimized emotion model backends.
+
+    # Export to ONNX (and an int8-quantized copy next to it)
+    python optimize.py export --output onnx/model.onnx --quantize
+
+    # Compare backends on a held-out GoEmotions sample
+    python optimize.py parity --backends torch torch-int8 onnx onnx:onnx/model.int8.onnx
+
+The first backend listed is the reference. `parity` exits non-zero when
+another backend agrees with it on fewer than --min-agreement of the texts,
+or loses more than --max-accuracy-drop accuracy against the gold labels.
+The report also counts "label flips outside the margin": texts whose top
+label changed although the reference's top two label probabilities were
+more than --margin apart, i.e. not a near-tie.
+
+Needs `onnx` and `onnxruntime` for export, and `datasets` for parity.
+tests/test_emotion_parity.py runs the same comparison automatically on a
+fixed set of texts, without `datasets`.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+import numpy as np
+
+from ml_model import MODEL_NAME, EMOTION_MODEL_DIR, EMOTION_ONNX_PATH, create_backend, predict_logits
+
+
+def model_source():
+    """The baked-in model directory if there is one, otherwise the hub name (as load_model does)."""
+    if EMOTION_MODEL_DIR and os.path.isdir(EMOTION_MODEL_DIR):
+        return EMOTION_MODEL_DIR, True
+    return MODEL_NAME, False
+
+
+def export_onnx(output: str, opset: int = 17, quantize: bool = False) -> list:
+    """Exports the model to `output` (and an int8 copy next to it). Returns the written paths."""
+    import torch
+
+    source, local = model_source()
+    # Eager attention and no torch.compile'd blocks, so the graph traces cleanly
+    model = AutoModelForSequenceClassification.from_pretrained(
+        source, local_files_only=local, attn_implementation="eager", reference_compile=False
+    )
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+    sample = tokenizer(
+        ["Export sample.", "A second, somewhat longer sample so the sequence axis is padded."],
+        return_tensors="pt", padding=True,
+    )
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        output,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"✅ Exported {source} to {output}")
+    paths = [output]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        root, ext = os.path.splitext(output)
+        quantized_path = f"{root}.int8{ext}"
+        quantize_dynamic(output, quantized_path, weight_type=QuantType.QInt8)
+        print(f"✅ Wrote int8-quantized model to {quantized_path}")
+        paths.append(quantized_path)
+    return paths
+
+
+def export(args):
+    export_onnx(args.output, args.opset, args.quantize)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _load_sample(args):
+    from datasets import load_dataset
+
+    dataset = load_dataset("google-research-datasets/go_emotions", "simplified", split=args.split)
+    dataset = dataset.shuffle(seed=args.seed).select(range(min(args.samples, len(dataset))))
+    names = dataset.features["labels"].feature.names
+    gold = [{names[label] for label in labels} for labels in dataset["labels"]]
+    return list(dataset["text"]), gold
+
+
+def _probabilities(logits: np.ndarray) -> np.ndarray:
+    # GoEmotions is multi-label, so each label gets its own sigmoid
+    return 1.0 / (1.0 + np.exp(-logits.astype(np.float64)))
+
+
+def _evaluate(spec: str, texts, tokenizer, batch_size: int):
+    kind, _, onnx_path = spec.partition(":")
+    source, local = model_source()
+    rss_before = _rss_mb()
+    backend = create_backend(kind, model_name=source, onnx_path=onnx_path or EMOTION_ONNX_PATH, local_files_only=local)
+    rss_after = _rss_mb()
+
+    # One warm-up batch so lazy initialization doesn't count as latency
+    predict_logits(texts[:batch_size], backend, tokenizer)
+
+    logits, batch_ms = [], []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        batch_started = time.perf_counter()
+        logits.append(predict_logits(texts[start:start + batch_size], backend, tokenizer))
+        batch_ms.append((time.perf_counter() - batch_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    single_ms = []
+    for text in texts[:50]:
+        single_started = time.perf_counter()
+        predict_logits([text], backend, tokenizer)
+        single_ms.append((time.perf_counter() - single_started) * 1000)
+
+    probabilities = _probabilities(np.concatenate(logits))
+    predictions = [backend.id2label[int(class_id)] for class_id in np.argmax(probabilities, axis=1)]
+    return predictions, probabilities, {
+        "texts_per_s": round(len(texts) / elapsed, 2),
+        "batch_ms_p50": round(statistics.median(batch_ms), 2),
+        "single_ms_p50": round(statistics.median(single_ms), 2),
+        "model_rss_mb": round(rss_after - rss_before, 1),
+    }
+
+
+def compare_backends(
+    texts, backends, gold=None, batch_size: int = 16, margin: float = 0.05,
+    min_agreement: float = 0.98, max_accuracy_drop: float = 0.01,
+) -> dict:
+    """
+    Runs every backend spec over `texts` and compares each against the
+    first. `gold` (a set of labels per text) adds accuracy; a backend's
+    "passed" follows the rules in the module docstring.
+    """
+    source, local = model_source()
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+
+    report, reference, reference_probabilities, reference_accuracy = {}, None, None, None
+    for spec in backends:
+        predictions, probabilities, metrics = _evaluate(spec, texts, tokenizer, batch_size)
+        accuracy = None
+        if gold is not None:
+            # GoEmotions is multi-label: a prediction counts if it's one of the gold labels
+            accuracy = sum(label in labels for label, labels in zip(predictions, gold)) / len(texts)
+            metrics["accuracy"] = round(accuracy, 4)
+
+        if reference is None:
+            reference, reference_probabilities, reference_accuracy = predictions, probabilities, accuracy
+            top_two = np.sort(probabilities, axis=1)[:, -2:]
+            gaps = top_two[:, 1] - top_two[:, 0]
+            metrics["near_tie_texts"] = int((gaps <= margin).sum())
+        else:
+            top_two = np.sort(reference_probabilities, axis=1)[:, -2:]
+            gaps = top_two[:, 1] - top_two[:, 0]
+            flips = [
+                (text, ref, label, gap)
+                for text, ref, label, gap in zip(texts, reference, predictions, gaps)
+                if ref != label
+            ]
+            hard_flips = [flip for flip in flips if flip[3] > margin]
+            agreement = 1 - len(flips) / len(texts)
+            metrics.update({
+                "agreement_with_reference": round(agreement, 4),
+                "max_probability_diff": round(float(np.abs(probabilities - reference_probabilities).max()), 5),
+                "label_flips": len(flips),
+                "label_flips_outside_margin": len(hard_flips),
+                "flipped_texts": [
+                    {"text": text, "reference": ref, "label": label, "reference_gap": round(float(gap), 4)}
+                    for text, ref, label, gap in flips
+                ],
+            })
+            metrics["passed"] = agreement >= min_agreement and (
+                accuracy is None or reference_accuracy - accuracy <= max_accuracy_drop
+            )
+        report[spec] = metrics
+        print(f"{spec}: {metrics}")
+
+    return {"samples": len(texts), "margin": margin, "reference": backends[0], "backends": report}
+
+
+def parity(args):
+    texts, gold = _load_sample(args)
+    summary = compare_backends(
+        texts, args.backends, gold, args.batch_size, args.margin, args.min_agreement, args.max_accuracy_drop
+    )
+    summary["split"] = args.split
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if not all(metrics.get("passed", True) for metrics in summary["backends"].values()):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the model to ONNX")
+    export_parser.add_argument("--output", default=EMOTION_ONNX_PATH)
+    export_parser.add_argument("--opset", type=int, default=17)
+    export_parser.add_argument("--quantize", action="store_true", help="also write a dynamic int8 copy")
+    export_parser.set_defaults(func=export)
+
+    parity_parser = commands.add_parser("parity", help="compare backends on held-out GoEmotions")
+    parity_parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"],
+                               help="backend names; use onnx:<path> for a specific ONNX file")
+    parity_parser.add_argument("--split", default="test")
+    parity_parser.add_argument("--samples", type=int, default=1000)
+    parity_parser.add_argument("--seed", type=int, default=0)
+    parity_parser.add_argument("--batch-size", type=int, default=16)
+    parity_parser.add_argument("--min-agreement", type=float, default=0.98)
+    parity_parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    parity_parser.add_argument("--margin", type=float, default=0.05,
+                               help="top-two probability gap below which a label flip counts as a near-tie")
+    parity_parser.add_argument("--output", help="also write the JSON report to this file")
+    parity_parser.set_defaults(func=parity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
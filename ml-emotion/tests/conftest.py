@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+# The service modules live one level up and are imported as top-level modules,
+# as in the container. Run pytest from ml-emotion/.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+PARITY_TEXTS_FILE = os.path.join(TESTS_DIR, "parity_texts.txt")
+
+GO_EMOTIONS_LABELS = [
+    "admiration", "amusement", "anger", "annoyance", "approval", "caring", "confusion", "curiosity",
+    "desire", "disappointment", "disapproval", "disgust", "embarrassment", "excitement", "fear",
+    "gratitude", "grief", "joy", "love", "nervousness", "optimism", "pride", "realization", "relief",
+    "remorse", "sadness", "surprise", "neutral",
+]
+
+
+def load_parity_texts():
+    with open(PARITY_TEXTS_FILE, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def _build_tiny_model(path: str):
+    """A 2-layer ModernBERT with random weights and the GoEmotions labels, plus a word-level tokenizer."""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+    from transformers import ModernBertConfig, ModernBertForSequenceClassification, PreTrainedTokenizerFast
+
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    tokenizer = Tokenizer(models.WordLevel(unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(load_parity_texts(), trainers.WordLevelTrainer(special_tokens=specials))
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, cls_token="[CLS]", sep_token="[SEP]", pad_token="[PAD]",
+        unk_token="[UNK]", mask_token="[MASK]", model_input_names=["input_ids", "attention_mask"],
+    ).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = ModernBertConfig(
+        vocab_size=tokenizer.get_vocab_size(), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, pad_token_id=0, cls_token_id=2, bos_token_id=2, sep_token_id=3, eos_token_id=3,
+        id2label=dict(enumerate(GO_EMOTIONS_LABELS)),
+        label2id={label: i for i, label in enumerate(GO_EMOTIONS_LABELS)},
+    )
+    ModernBertForSequenceClassification(config).save_pretrained(path)
+
+
+@pytest.fixture(scope="session")
+def model_source(tmp_path_factory):
+    """
+    Points optimize.py at the model the parity tests run on: the real weights
+    when they can be loaded (EMOTION_MODEL_DIR or the Hugging Face cache),
+    otherwise a tiny randomly initialized stand-in. The stand-in says nothing
+    about the real model's labels, but it runs export, quantization and the
+    comparison end to end wherever the tests run.
+    """
+    from transformers import AutoConfig
+
+    import optimize
+
+    source, local = optimize.model_source()
+    try:
+        AutoConfig.from_pretrained(source, local_files_only=local)
+        yield source
+        return
+    except OSError:
+        pass
+
+    path = str(tmp_path_factory.mktemp("tiny-model"))
+    _build_tiny_model(path)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(optimize, "EMOTION_MODEL_DIR", path)
+        yield path
@@ -0,0 +1,49 @@
+"""
+Backend parity for the emotion model (the automated form of `optimize.py parity`).
+
+Every optimized backend is compared with the PyTorch reference on
+parity_texts.txt, which leans toward messages where two emotions compete.
+
+Tolerance: a backend may only pick a different top label than the
+reference when the reference's two most likely labels are within
+TIE_MARGIN of each other (a near-tie the model can't call reliably anyway);
+any other label change fails. Every label probability must also stay within
+MAX_PROBABILITY_DIFF of the reference.
+
+Runs on the real weights when they are available (set EMOTION_MODEL_DIR, as
+in the Docker image), otherwise on a tiny random stand-in (see conftest.py).
+"""
+import pytest
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+import optimize
+from conftest import load_parity_texts
+
+# Top-two probability gap below which a label flip is tolerated (same as the CLI default)
+TIE_MARGIN = 0.05
+# Largest allowed |probability - reference probability| for any label
+MAX_PROBABILITY_DIFF = 0.05
+
+BACKENDS = ["torch-int8", "onnx", "onnx-int8"]
+
+
+@pytest.fixture(scope="module")
+def report(model_source, tmp_path_factory):
+    onnx_path, int8_path = optimize.export_onnx(str(tmp_path_factory.mktemp("onnx") / "model.onnx"), quantize=True)
+    specs = ["torch", "torch-int8", f"onnx:{onnx_path}", f"onnx:{int8_path}"]
+    summary = optimize.compare_backends(load_parity_texts(), specs, margin=TIE_MARGIN)
+    # Keyed by readable names for the parametrized tests
+    return dict(zip(["torch"] + BACKENDS, summary["backends"].values()))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_no_label_flips_outside_near_ties(report, backend):
+    metrics = report[backend]
+    assert metrics["label_flips_outside_margin"] == 0, metrics["flipped_texts"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_probabilities_within_tolerance(report, backend):
+    assert report[backend]["max_probability_diff"] <= MAX_PROBABILITY_DIFF
@@ -0,0 +1,105 @@
+import hashlib
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Rough per-entry bookkeeping cost (OrderedDict node, tuple, floats)
+_ENTRY_OVERHEAD_BYTES = 120
+
+
+def normalize_text(text: str, casefold: bool = False) -> str:
+    """
+    Collapses whitespace so trivial variants share a key. With `casefold`,
+    also folds unicode forms and case, which is only safe when the model
+    gives the same result for every casing.
+    """
+    if casefold:
+        text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split())
+
+
+def text_key(text: str, casefold: bool = False) -> bytes:
+    return hashlib.sha256(normalize_text(text, casefold).encode("utf-8")).digest()
+
+
+class ResultCache:
+    """
+    A bounded LRU cache with a TTL, keyed on a hash of the normalized text.
+
+    The size limit is in (approximate) bytes rather than entries. Guarded by
+    a lock, so it can also be shared with worker threads. A `max_bytes` of 0
+    disables the cache. `casefold` is passed to normalize_text.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, casefold: bool = False):
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.casefold = casefold
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, text: str) -> Optional[Any]:
+        if not self.max_bytes:
+            return None
+        key = text_key(text, self.casefold)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at <= now:
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, text: str, value: Any):
+        if not self.max_bytes:
+            return
+        key = text_key(text, self.casefold)
+        size = len(key) + sys.getsizeof(value) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self.current_bytes += size
+
+            # Evict least-recently-used entries until we are back under budget
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def _remove(self, key: bytes, size: int):
+        del self._entries[key]
+        self.current_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,49 +1,228 @@
-from transformers import pipeline
-
-print("Loading content moderation model...")
-try:
-    # Load the pipeline for the binary toxicity classifier
-    moderator = pipeline(
-        "text-classification", 
-        model="garak-llm/roberta_toxicity_classifier"
-    )
-    print("✅ Content moderation model loaded successfully.")
-except Exception as e:
-    print(f"❌ Error loading moderation model: {e}")
-    moderator = None
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+import metrics
+
+MODEL_NAME = "garak-llm/roberta_toxicity_classifier"
+
+# --- Inference Backend ---
+# "torch":      direct tokenizer + model calls in fp32 (the default)
+# "torch-int8": the same with nn.Linear layers dynamically quantized to int8
+# "onnx":       an ONNX Runtime session over a model exported with
+#               `python optimize.py export` (optionally quantized to int8)
+TOXICITY_BACKEND = os.environ.get("TOXICITY_BACKEND", "torch")
+TOXICITY_ONNX_PATH = os.environ.get("TOXICITY_ONNX_PATH", "onnx/model.onnx")
+# The Dockerfile runs two workers; split the cores between them instead of
+# letting each one spin up a thread per core and fight over them.
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Longest input in tokens, same as the pipeline's truncation
+MAX_LENGTH = int(os.environ.get("TOXICITY_MAX_LENGTH", "512"))
+
+# --- Model Lifecycle ---
+# A directory with pre-downloaded weights (the Dockerfile bakes them in), so
+# startup never waits on the network. Falls back to the Hugging Face cache.
+TOXICITY_MODEL_DIR = os.environ.get("TOXICITY_MODEL_DIR")
+
+
+class TorchBackend:
+    """Calls the model directly, skipping the pipeline's per-call overhead."""
+
+    tensor_type = "pt"
+
+    def __init__(
+        self, model_name: str, quantize: bool = False, threads: int = TORCH_NUM_THREADS, local_files_only: bool = False
+    ):
+        import torch  # Not needed at all by the ONNX backend
+        self.torch = torch
+        torch.set_num_threads(threads)
+        # safetensors weights are memory-mapped and loaded straight into the
+        # model, without first building a randomly initialized copy
+        model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, local_files_only=local_files_only, low_cpu_mem_usage=True
+        )
+        model.eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.id2label = model.config.id2label
+
+    def logits(self, inputs) -> np.ndarray:
+        with self.torch.inference_mode():
+            return self.model(**inputs).logits.float().numpy()
+
+
+class OnnxBackend:
+    """Runs an exported ONNX graph with ONNX Runtime; no PyTorch needed."""
+
+    tensor_type = "np"
+
+    def __init__(
+        self, model_name: str, onnx_path: str, threads: int = TORCH_NUM_THREADS, local_files_only: bool = False
+    ):
+        import onnxruntime as ort  # Optional dependency, only needed for this backend
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {graph_input.name for graph_input in self.session.get_inputs()}
+        # Only the config (labels) is needed from the hub, not the weights
+        self.id2label = AutoConfig.from_pretrained(model_name, local_files_only=local_files_only).id2label
+
+    def logits(self, inputs) -> np.ndarray:
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def create_backend(
+    kind: str = TOXICITY_BACKEND,
+    model_name: str = MODEL_NAME,
+    onnx_path: str = TOXICITY_ONNX_PATH,
+    local_files_only: bool = False,
+):
+    if kind == "torch":
+        return TorchBackend(model_name, local_files_only=local_files_only)
+    if kind == "torch-int8":
+        return TorchBackend(model_name, quantize=True, local_files_only=local_files_only)
+    if kind == "onnx":
+        return OnnxBackend(model_name, onnx_path, local_files_only=local_files_only)
+    raise ValueError(f"Unknown TOXICITY_BACKEND: {kind}")
+
+
+def toxic_label_index(id2label) -> int:
+    # Find the 'toxic' label specifically; -1 if the model doesn't have one
+    return next((int(i) for i, label in id2label.items() if label.lower() == "toxic"), -1)
+
+
+class ModelState:
+    """What /health and /ready report: whether the model is usable, and how long it took."""
+
+    def __init__(self):
+        self.status = "not_loaded"  # -> "loading" -> "ready" | "failed"
+        self.source: Optional[str] = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
 
-# A threshold of 0.8 is a good starting point. 
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "backend": TOXICITY_BACKEND,
+            "source": self.source,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+
+# Set by load_model()
+tokenizer = None
+backend = None
+toxic_index = -1
+model_state = ModelState()
+
+# A threshold of 0.8 is a good starting point.
 # You can lower it to be more strict or raise it to be more lenient.
-TOXICITY_THRESHOLD = 0.8
+TOXICITY_THRESHOLD = float(os.environ.get("TOXICITY_THRESHOLD", "0.8"))
 
-def is_toxic(text: str) -> bool:
+def load_model():
     """
-    Analyzes text for toxicity using a binary classifier. Returns True if the 
-    'toxic' label has a score above the threshold, False otherwise.
+    Loads the tokenizer and backend, then runs one warm-up inference so the
+    first real request doesn't pay for lazy initialization. Blocking; call
+    it from a worker thread. Raises (and records the error) on failure.
     """
-    if not moderator:
-        return False # Fail safe if the model didn't load
+    global tokenizer, backend, toxic_index
+    if model_state.status in ("loading", "ready"):
+        return
+
+    local = bool(TOXICITY_MODEL_DIR and os.path.isdir(TOXICITY_MODEL_DIR))
+    source = TOXICITY_MODEL_DIR if local else MODEL_NAME
+    model_state.status = "loading"
+    model_state.source = source
+    print(f"Loading content moderation model: {source} (backend: {TOXICITY_BACKEND})...")
 
     try:
-        # Use top_k=None to get the scores for ALL labels ('toxic' and 'non-toxic')
-        results = moderator(text, top_k=None)
-        
-        # Find the result for the 'toxic' label specifically
-        for result in results:
-            if result['label'] == 'toxic' and result['score'] > TOXICITY_THRESHOLD:
-                print(f"Toxic content detected: (Score: {result['score']:.2f})")
-                return True
-                
+        started = time.perf_counter()
+        loaded_tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+        loaded_backend = create_backend(model_name=source, local_files_only=local)
+        loaded_toxic_index = toxic_label_index(loaded_backend.id2label)
+        model_state.load_seconds = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        predict_scores(["Warming up the moderation model."], loaded_backend, loaded_tokenizer, loaded_toxic_index)
+        model_state.warmup_seconds = round(time.perf_counter() - started, 3)
     except Exception as e:
+        model_state.status = "failed"
+        model_state.error = str(e)
+        print(f"❌ Error loading moderation model: {e}")
+        raise
+
+    tokenizer, backend, toxic_index = loaded_tokenizer, loaded_backend, loaded_toxic_index
+    model_state.status = "ready"
+    metrics.MODEL_READY.set(1)
+    print(
+        f"✅ Content moderation model loaded successfully "
+        f"(load {model_state.load_seconds}s, warm-up {model_state.warmup_seconds}s)."
+    )
+
+def predict_scores(texts: List[str], backend, tokenizer, toxic_index: int) -> List[float]:
+    """One padded forward pass; returns the softmax probability of 'toxic' per text. Raises on failure."""
+    if toxic_index < 0:
+        return [0.0] * len(texts)
+    inputs = tokenizer(
+        texts, return_tensors=backend.tensor_type, truncation=True, max_length=MAX_LENGTH, padding=True
+    )
+    logits = backend.logits(inputs)
+    # Softmax over the labels, as the text-classification pipeline does
+    logits = logits - logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return [float(score) for score in probabilities[:, toxic_index]]
+
+def toxicity_scores(texts: List[str]) -> List[Optional[float]]:
+    """
+    Runs the classifier over a batch of texts in one forward pass and returns
+    the raw score of the 'toxic' label for each text (None if unavailable, so
+    a failure is never mistaken for a clean verdict).
+    """
+    if not texts:
+        return []
+    if not backend or not tokenizer:
+        return [None] * len(texts)
+
+    try:
+        with metrics.FORWARD_SECONDS.time():
+            scores = predict_scores(texts, backend, tokenizer, toxic_index)
+        metrics.BATCH_SIZE.observe(len(texts))
+        return scores
+    except Exception as e:
+        metrics.INFERENCE_ERRORS.inc()
         print(f"Error during toxicity analysis: {e}")
-    
+        return [None] * len(texts)
+
+def is_toxic(text: str) -> bool:
+    """
+    Analyzes text for toxicity using a binary classifier. Returns True if the
+    'toxic' label has a score above the threshold, False otherwise.
+    """
+    score = toxicity_scores([text])[0]
+    if score is not None and score > TOXICITY_THRESHOLD:
+        print(f"Toxic content detected: (Score: {score:.2f})")
+        return True
     return False
 
 # Example usage to show how it works now:
 if __name__ == "__main__":
+    load_model()
     clean_message = "I am having a wonderful day, the weather is lovely!"
     toxic_message = "You are a complete idiot."
 
     print(f"'{clean_message}' -> Is Toxic: {is_toxic(clean_message)}") # Expected: False
     print(f"'{toxic_message}' -> Is Toxic: {is_toxic(toxic_message)}") # Expected: True
-
@@ -0,0 +1,9 @@
+# Picked up automatically by gunicorn from the working directory
+
+
+def child_exit(server, worker):
+    # Otherwise the exited worker's queue depth and readiness would still be counted.
+    # Imported here so the master process doesn't create metric files of its own.
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,216 @@
+"""
+Export and verify the optimized toxicity model backends.
+
+    # Export to ONNX (and an int8-quantized copy next to it)
+    python optimize.py export --output onnx/model.onnx --quantize
+
+    # Compare backends, with extra attention to scores near the threshold
+    python optimize.py parity --backends torch torch-int8 onnx onnx:onnx/model.int8.onnx --texts-file samples.txt
+
+The first backend listed is the reference. A backend fails parity if any
+score differs from the reference by more than --max-score-diff, or if it
+flips a block/allow decision for a text whose reference score is more than
+--margin away from TOXICITY_THRESHOLD. Flips inside that band are reported
+but tolerated: they are the texts the threshold can't decide reliably anyway.
+
+Needs `onnx` and `onnxruntime` for export. tests/test_toxicity_parity.py runs the
+same check automatically, with no decision flips tolerated at all.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from content_moderation import (
+    MODEL_NAME, TOXICITY_MODEL_DIR, TOXICITY_ONNX_PATH, TOXICITY_THRESHOLD,
+    create_backend, predict_scores, toxic_label_index,
+)
+
+# Used when no --texts-file is given: a mix of clean, borderline and toxic messages
+DEFAULT_TEXTS = [
+    "I am having a wonderful day, the weather is lovely!",
+    "Thanks for the help earlier, really appreciate it.",
+    "Can someone explain how the new feature works?",
+    "That was a dumb move, but whatever.",
+    "Shut up, nobody asked you.",
+    "This game is so stupid, I hate losing.",
+    "You're kind of annoying today lol",
+    "What a ridiculous idea, are you serious?",
+    "Go away, you clown.",
+    "You are a complete idiot.",
+    "I will find you and make you regret this.",
+    "You're a worthless piece of garbage.",
+    "Honestly this take is trash.",
+    "Stop being such a baby about it.",
+    "lol you suck at this",
+    "ok",
+]
+
+
+def model_source():
+    """The baked-in model directory if there is one, otherwise the hub name (as load_model does)."""
+    if TOXICITY_MODEL_DIR and os.path.isdir(TOXICITY_MODEL_DIR):
+        return TOXICITY_MODEL_DIR, True
+    return MODEL_NAME, False
+
+
+def export_onnx(output: str, opset: int = 17, quantize: bool = False) -> list:
+    """Exports the model to `output` (and an int8 copy next to it). Returns the written paths."""
+    import torch
+
+    source, local = model_source()
+    model = AutoModelForSequenceClassification.from_pretrained(source, local_files_only=local)
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+    sample = tokenizer(
+        ["Export sample.", "A second, somewhat longer sample so the sequence axis is padded."],
+        return_tensors="pt", padding=True,
+    )
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        output,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"✅ Exported {source} to {output}")
+    paths = [output]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        root, ext = os.path.splitext(output)
+        quantized_path = f"{root}.int8{ext}"
+        quantize_dynamic(output, quantized_path, weight_type=QuantType.QInt8)
+        print(f"✅ Wrote int8-quantized model to {quantized_path}")
+        paths.append(quantized_path)
+    return paths
+
+
+def export(args):
+    export_onnx(args.output, args.opset, args.quantize)
+
+
+def _load_texts(args):
+    if not args.texts_file:
+        return DEFAULT_TEXTS
+    with open(args.texts_file, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _evaluate(spec: str, texts, tokenizer):
+    kind, _, onnx_path = spec.partition(":")
+    source, local = model_source()
+    backend = create_backend(kind, model_name=source, onnx_path=onnx_path or TOXICITY_ONNX_PATH, local_files_only=local)
+    toxic_index = toxic_label_index(backend.id2label)
+
+    # Warm-up so lazy initialization doesn't count as latency
+    predict_scores(texts[:1], backend, tokenizer, toxic_index)
+
+    scores, single_ms = [], []
+    for text in texts:
+        started = time.perf_counter()
+        scores.extend(predict_scores([text], backend, tokenizer, toxic_index))
+        single_ms.append((time.perf_counter() - started) * 1000)
+    return scores, {
+        "single_ms_p50": round(statistics.median(single_ms), 2),
+        "single_ms_p95": round(sorted(single_ms)[int(0.95 * (len(single_ms) - 1))], 2),
+    }
+
+
+def compare_backends(texts, backends, threshold=TOXICITY_THRESHOLD, margin=0.05, max_score_diff=0.05) -> dict:
+    """
+    Scores `texts` with every backend spec and compares each against the
+    first. Returns the report; a backend's "passed" follows the rules in the
+    module docstring.
+    """
+    source, local = model_source()
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local)
+
+    report, reference = {}, None
+    for spec in backends:
+        scores, metrics = _evaluate(spec, texts, tokenizer)
+        if reference is None:
+            reference = scores
+            metrics["near_threshold_texts"] = sum(abs(s - threshold) <= margin for s in scores)
+        else:
+            diffs = [abs(a - b) for a, b in zip(scores, reference)]
+            flips = [
+                (text, ref, score)
+                for text, ref, score in zip(texts, reference, scores)
+                if (ref > threshold) != (score > threshold)
+            ]
+            hard_flips = [flip for flip in flips if abs(flip[1] - threshold) > margin]
+            near = [d for d, ref in zip(diffs, reference) if abs(ref - threshold) <= margin]
+            metrics.update({
+                "max_score_diff": round(max(diffs), 5),
+                "mean_score_diff": round(statistics.fmean(diffs), 5),
+                "max_score_diff_near_threshold": round(max(near), 5) if near else None,
+                "decision_flips": len(flips),
+                "decision_flips_outside_margin": len(hard_flips),
+                "flipped_texts": [
+                    {"text": text, "reference": round(ref, 4), "score": round(score, 4)} for text, ref, score in flips
+                ],
+            })
+            metrics["passed"] = not hard_flips and max(diffs) <= max_score_diff
+        report[spec] = metrics
+        print(f"{spec}: {metrics}")
+
+    return {
+        "texts": len(texts), "threshold": threshold, "margin": margin,
+        "reference": backends[0], "backends": report,
+    }
+
+
+def parity(args):
+    summary = compare_backends(
+        _load_texts(args), args.backends, args.threshold, args.margin, args.max_score_diff
+    )
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if not all(metrics.get("passed", True) for metrics in summary["backends"].values()):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the model to ONNX")
+    export_parser.add_argument("--output", default=TOXICITY_ONNX_PATH)
+    export_parser.add_argument("--opset", type=int, default=17)
+    export_parser.add_argument("--quantize", action="store_true", help="also write a dynamic int8 copy")
+    export_parser.set_defaults(func=export)
+
+    parity_parser = commands.add_parser("parity", help="compare backends' toxicity scores")
+    parity_parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"],
+                               help="backend names; use onnx:<path> for a specific ONNX file")
+    parity_parser.add_argument("--texts-file", help="one message per line (default: a built-in sample)")
+    parity_parser.add_argument("--threshold", type=float, default=TOXICITY_THRESHOLD)
+    parity_parser.add_argument("--margin", type=float, default=0.05,
+                               help="scores this close to the threshold may flip without failing")
+    parity_parser.add_argument("--max-score-diff", type=float, default=0.05)
+    parity_parser.add_argument("--output", help="also write the JSON report to this file")
+    parity_parser.set_defaults(func=parity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
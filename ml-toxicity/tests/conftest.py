@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+# The service modules live one level up and are imported as top-level modules,
+# as in the container. Run pytest from ml-toxicity/.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+PARITY_TEXTS_FILE = os.path.join(TESTS_DIR, "parity_texts.txt")
+
+
+def load_parity_texts():
+    with open(PARITY_TEXTS_FILE, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def _build_tiny_model(path: str):
+    """A 2-layer RoBERTa with random weights and the real model's labels, plus a word-level tokenizer."""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+
+    specials = ["<s>", "<pad>", "</s>", "<unk>"]
+    tokenizer = Tokenizer(models.WordLevel(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(load_parity_texts(), trainers.WordLevelTrainer(special_tokens=specials))
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)]
+    )
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", pad_token="<pad>", unk_token="<unk>",
+        model_input_names=["input_ids", "attention_mask"],
+    ).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = RobertaConfig(
+        vocab_size=tokenizer.get_vocab_size(), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, max_position_embeddings=130, bos_token_id=0, pad_token_id=1, eos_token_id=2,
+        id2label={0: "neutral", 1: "toxic"}, label2id={"neutral": 0, "toxic": 1},
+    )
+    RobertaForSequenceClassification(config).save_pretrained(path)
+
+
+@pytest.fixture(scope="session")
+def model_source(tmp_path_factory):
+    """
+    Points optimize.py at the model the parity tests run on: the real weights
+    when they can be loaded (TOXICITY_MODEL_DIR or the Hugging Face cache),
+    otherwise a tiny randomly initialized stand-in. The stand-in says nothing
+    about the real model's scores, but it runs export, quantization and the
+    comparison end to end wherever the tests run.
+    """
+    from transformers import AutoConfig
+
+    import optimize
+
+    source, local = optimize.model_source()
+    try:
+        AutoConfig.from_pretrained(source, local_files_only=local)
+        yield source
+        return
+    except OSError:
+        pass
+
+    path = str(tmp_path_factory.mktemp("tiny-model"))
+    _build_tiny_model(path)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(optimize, "TOXICITY_MODEL_DIR", path)
+        yield path
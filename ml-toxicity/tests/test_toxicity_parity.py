@@ -0,0 +1,44 @@
+"""
+Backend parity for the toxicity model (the automated form of `optimize.py parity`).
+
+Every optimized backend must make the same block/allow decision as the
+PyTorch reference on every text in parity_texts.txt, which is weighted
+toward messages near TOXICITY_THRESHOLD, and keep every score within
+MAX_SCORE_DIFF of the reference. Unlike the CLI, no flip is tolerated,
+not even within the margin around the threshold.
+
+Runs on the real weights when they are available (set TOXICITY_MODEL_DIR, as
+in the Docker image), otherwise on a tiny random stand-in (see conftest.py).
+"""
+import pytest
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+import optimize
+from conftest import load_parity_texts
+
+# Largest allowed |score - reference score|, in probability units (same as the CLI default)
+MAX_SCORE_DIFF = 0.05
+
+BACKENDS = ["torch-int8", "onnx", "onnx-int8"]
+
+
+@pytest.fixture(scope="module")
+def report(model_source, tmp_path_factory):
+    onnx_path, int8_path = optimize.export_onnx(str(tmp_path_factory.mktemp("onnx") / "model.onnx"), quantize=True)
+    specs = ["torch", "torch-int8", f"onnx:{onnx_path}", f"onnx:{int8_path}"]
+    summary = optimize.compare_backends(load_parity_texts(), specs, max_score_diff=MAX_SCORE_DIFF)
+    # Keyed by readable names for the parametrized tests
+    return dict(zip(["torch"] + BACKENDS, summary["backends"].values()))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_no_decision_flips(report, backend):
+    metrics = report[backend]
+    assert metrics["decision_flips"] == 0, metrics["flipped_texts"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_scores_within_tolerance(report, backend):
+    assert report[backend]["max_score_diff"] <= MAX_SCORE_DIFF